@@ -0,0 +1,106 @@
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from pymongo.errors import PyMongoError
+
+import myitems_pb2
+import myitems_pb2_grpc
+from server import ItemServiceServicer
+from storage import MemoryBackend, MongoBackend, SQLiteBackend
+
+# GetItemById and ListAllItems through a local gRPC server, per storage backend.
+#	python3 backend_benchmark.py [items]	(default 100,000)
+# The Mongo run uses MONGO_HOST/MONGO_PORT (database "benchdb", dropped
+# afterwards) and is skipped when no server is reachable.
+
+LOOKUPS = 20000
+THREADS = 8
+PORT = 50151
+
+def seed(backend, count):
+	batch = 10000
+	for start in range(1, count + 1, batch):
+		backend.insert_many([{"id": i, "name": f"Item{i}"} for i in range(start, min(start + batch, count + 1))])
+
+def run(label, backend, count):
+	start = time.perf_counter()
+	seed(backend, count)
+	print(f"\n{label}:")
+	print(f"	Seed {count} items:	{time.perf_counter() - start:.2f}s")
+
+	server = grpc.server(futures.ThreadPoolExecutor(max_workers=THREADS))
+	myitems_pb2_grpc.add_ItemServiceServicer_to_server(ItemServiceServicer(backend), server)
+	server.add_insecure_port(f"localhost:{PORT}")
+	server.start()
+	channel = grpc.insecure_channel(f"localhost:{PORT}")
+	stub = myitems_pb2_grpc.ItemServiceStub(channel)
+
+	try:
+		for i in range(500):	# warm up the channel and server threads
+			stub.GetItemById(myitems_pb2.ItemRequest(id=i % count + 1))
+
+		# GetItemById: random ids from THREADS concurrent callers
+		latencies = []
+		def caller(n):
+			rng = random.Random()
+			own = []
+			for _ in range(n):
+				request = myitems_pb2.ItemRequest(id=rng.randint(1, count))
+				t = time.perf_counter()
+				stub.GetItemById(request)
+				own.append(time.perf_counter() - t)
+			latencies.extend(own)
+
+		workers = [threading.Thread(target=caller, args=(LOOKUPS // THREADS,)) for _ in range(THREADS)]
+		start = time.perf_counter()
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		elapsed = time.perf_counter() - start
+		latencies.sort()
+		print(f"	GetItemById:	{len(latencies) / elapsed:.0f} calls/s, "
+				f"p50 {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+				f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+
+		# ListAllItems: full stream, best of 3
+		best = None
+		for _ in range(3):
+			start = time.perf_counter()
+			received = sum(1 for _ in stub.ListAllItems(myitems_pb2.Empty()))
+			elapsed = time.perf_counter() - start
+			best = elapsed if best is None else min(best, elapsed)
+		print(f"	ListAllItems:	{best:.2f}s for {received} items ({received / best:.0f} items/s)")
+	finally:
+		channel.close()
+		server.stop(0)
+
+if __name__ == '__main__':
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+	print("Storage backend benchmark")
+	print("=" * 50)
+
+	run("Memory", MemoryBackend(), count)
+
+	with tempfile.TemporaryDirectory(prefix="items-sqlite-") as tmp:
+		backend = SQLiteBackend(os.path.join(tmp, "items.db"))
+		run("SQLite (WAL, connection per thread)", backend, count)
+		backend.close()
+
+	try:
+		backend = MongoBackend(os.environ.get("MONGO_HOST", "localhost"), os.environ.get("MONGO_PORT", "27017"), "benchdb")
+	except PyMongoError as e:
+		print(f"\nMongo: skipped ({e.__class__.__name__}: no server reachable)")
+	else:
+		try:
+			backend.collection.delete_many({})
+			run("Mongo", backend, count)
+		finally:
+			backend.client.drop_database("benchdb")
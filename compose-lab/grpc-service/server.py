@@ -4,37 +4,30 @@ import time
 import myitems_pb2
 import myitems_pb2_grpc
 from grpc_reflection.v1alpha import reflection
-from pymongo import MongoClient
-import os
-
-# MongoDB connection
-mongo_host = os.environ.get("MONGO_HOST", "localhost")
-mongo_port = os.environ.get("MONGO_PORT", "27017")
-mongo_db = os.getenv("MONGO_DB", "itemsdb")
-
-client = MongoClient(f"mongodb://{mongo_host}:{mongo_port}", serverSelectionTimeoutMS=5000)
-db = client[mongo_db]
-collection = db["items"]
-
-# Create unique index on id field
-collection.create_index("id", unique=True)
-
-print(f"[gRPC] connected to MongoDB at {mongo_host}:{mongo_port}")
+from storage import DuplicateItemError, backend_from_env
 
 class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 
+	def __init__(self, backend):
+		# Storage backend (Mongo, SQLite or in-memory, see storage.py)
+		self.backend = backend
+
 	def CreateItem(self, request, context):
-		# Unary RPC: Create a new item in MongoDB
+		# Unary RPC: Create a new item
 		try:
 			print(f"[gRPC] Creating item: id={request.id}, name={request.name}")
 
-			# Insert into MongoDB
-			doc = {"id": request.id, "name": request.name}
-			collection.insert_one(doc)
+			self.backend.insert_many([{"id": request.id, "name": request.name}])
 
 			print(f"[gRPC] Item created successfully: {request.id}")
 			return myitems_pb2.ItemResponse(id=request.id, name=request.name, success=True)
 
+		except DuplicateItemError:
+			print(f"[gRPC] Item already exists: {request.id}")
+			context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+			context.set_details("Item already exists")
+			return myitems_pb2.ItemResponse(success=False)
+
 		except Exception as e:
 			print(f"[gRPC] Error creating item: {e}")
 			context.set_code(grpc.StatusCode.INTERNAL)
@@ -42,15 +35,11 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 			return myitems_pb2.ItemResponse(success=False)
 		
 	def UpdateItem(self, request, context):
-		# Unary RPC: Update an existing item in MongoDB
+		# Unary RPC: Update an existing item
 		try:
 			print(f"[gRPC] Updating item: id={request.id}, name={request.name}")
 
-			# Update MongoDB
-			#doc = {{"id": request.id}, {"$set": {"name": request.name}}}
-			result = collection.update_one({"id": request.id}, {"$set": {"name": request.name}})
-
-			if result.matched_count == 0:
+			if not self.backend.update(request.id, request.name):
 				print(f"[gRPC] Item not found: {request.id}")
 				context.set_code(grpc.StatusCode.NOT_FOUND)
 				context.set_details("Item not found")
@@ -66,15 +55,11 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 			return myitems_pb2.ItemResponse(success=False)
 		
 	def DeleteItem(self, request, context):
-		# Unary RPC: Delete an existing item in MongoDB
+		# Unary RPC: Delete an existing item
 		try:
 			print(f"[gRPC] Deleting item: id={request.id}, name={request.name}")
 
-			# Update MongoDB
-			#doc = {"id": request.id, "name": request.name}
-			result = collection.delete_one({"id": request.id})
-
-			if result.deleted_count == 0:
+			if not self.backend.delete(request.id):
 				print(f"[gRPC]  Item not found: {request.id}")
 				context.set_code(grpc.StatusCode.NOT_FOUND)
 				context.set_details("Item not found")
@@ -90,15 +75,15 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 			return myitems_pb2.ItemResponse(success=False)
 
 	def GetItemById(self, request, context):
-		# Get item by ID from MongoDB
+		# Get item by ID
 		try:
-			doc = collection.find_one({"id": request.id})
-			if not doc:
+			item = self.backend.get(request.id)
+			if not item:
 				context.set_code(grpc.StatusCode.NOT_FOUND)
 				context.set_details("Item not found")
 				return myitems_pb2.ItemResponse()
 
-			return myitems_pb2.ItemResponse(id=doc["id"], name=doc["name"], success=True)
+			return myitems_pb2.ItemResponse(id=item["id"], name=item["name"], success=True)
 
 		except Exception as e:
 			print(f"[gRPC] Error: {e}")
@@ -109,8 +94,8 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 	def ListAllItems(self, request, context):
 		# Server-streaming RPC: List all items
 		try:
-			for doc in collection.find():
-				yield myitems_pb2.ItemResponse(id=doc["id"], name=doc["name"], success=True)
+			for item in self.backend.scan():
+				yield myitems_pb2.ItemResponse(id=item["id"], name=item["name"], success=True)
 
 		except Exception as e:
 			print(f"[gRPC] Error: {e}")
@@ -120,8 +105,8 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 def serve():
 	server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
 
-	# Add servicer to server
-	myitems_pb2_grpc.add_ItemServiceServicer_to_server(ItemServiceServicer(), server)
+	# Add servicer to server, backed by the storage selected with STORAGE_BACKEND
+	myitems_pb2_grpc.add_ItemServiceServicer_to_server(ItemServiceServicer(backend_from_env()), server)
 
 	# Enable gRPC reflection
 	service_names = (myitems_pb2.DESCRIPTOR.services_by_name['ItemService'].full_name,
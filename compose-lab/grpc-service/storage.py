@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import threading
+
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+
+# Storage backends for ItemServiceServicer. Items are plain dicts
+# {"id": int, "name": str}; every backend implements the same five calls so
+# the servicer does not know where items live. Selected with STORAGE_BACKEND
+# (mongo, sqlite or memory).
+
+class DuplicateItemError(Exception):
+	# insert_many hit an id that already exists
+	pass
+
+class ItemBackend:
+
+	def get(self, item_id):
+		# Item dict, or None if it does not exist
+		raise NotImplementedError
+
+	def scan(self):
+		# Iterate over all items
+		raise NotImplementedError
+
+	def insert_many(self, items):
+		# Insert new items; raises DuplicateItemError if an id exists
+		raise NotImplementedError
+
+	def update(self, item_id, name):
+		# True if the item existed and was updated
+		raise NotImplementedError
+
+	def delete(self, item_id):
+		# True if the item existed and was deleted
+		raise NotImplementedError
+
+class MemoryBackend(ItemBackend):
+	# Process-local dict; for tests, benchmarks and throwaway deployments
+
+	def __init__(self):
+		self.items = {}
+		self.lock = threading.Lock()
+
+	def get(self, item_id):
+		name = self.items.get(item_id)
+		if name is None:
+			return None
+		return {"id": item_id, "name": name}
+
+	def scan(self):
+		for item_id, name in list(self.items.items()):
+			yield {"id": item_id, "name": name}
+
+	def insert_many(self, items):
+		with self.lock:
+			for item in items:
+				if item["id"] in self.items:
+					raise DuplicateItemError(f"Item {item['id']} already exists")
+			for item in items:
+				self.items[item["id"]] = item["name"]
+
+	def update(self, item_id, name):
+		with self.lock:
+			if item_id not in self.items:
+				return False
+			self.items[item_id] = name
+			return True
+
+	def delete(self, item_id):
+		with self.lock:
+			return self.items.pop(item_id, None) is not None
+
+# SQL used by SQLiteBackend. The statements are constant strings so sqlite3's
+# per-connection statement cache compiles each one once and reuses it.
+SQLITE_SCHEMA = "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)"
+SQLITE_GET = "SELECT id, name FROM items WHERE id = ?"
+SQLITE_SCAN = "SELECT id, name FROM items ORDER BY id"
+SQLITE_INSERT = "INSERT INTO items (id, name) VALUES (?, ?)"
+SQLITE_UPDATE = "UPDATE items SET name = ? WHERE id = ?"
+SQLITE_DELETE = "DELETE FROM items WHERE id = ?"
+
+class SQLiteBackend(ItemBackend):
+	# Embedded SQLite database file, for single-node deployments.
+	#
+	# The database runs in WAL journal mode: readers never block the writer or
+	# each other, and with synchronous=NORMAL a commit is an append to the WAL
+	# without an fsync (the WAL is synced at checkpoints). Each worker thread
+	# gets its own connection, so gRPC handlers do not serialise on one.
+	# Connections are in autocommit mode; multi-row inserts use an explicit
+	# transaction.
+
+	def __init__(self, path, busy_timeout=5.0, synchronous="NORMAL"):
+		self.path = path
+		self.busy_timeout = busy_timeout
+		self.synchronous = synchronous
+		self.local = threading.local()
+		self.connections = []
+		self.lock = threading.Lock()
+
+		conn = self.connection()
+		# journal_mode is persistent, so setting it once per database is enough
+		mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+		conn.execute(SQLITE_SCHEMA)
+		print(f"[gRPC] using SQLite database {path} (journal_mode={mode})")
+
+	def connection(self):
+		conn = getattr(self.local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+					check_same_thread=False, cached_statements=256)
+			conn.execute(f"PRAGMA synchronous={self.synchronous}")
+			self.local.conn = conn
+			with self.lock:
+				self.connections.append(conn)
+		return conn
+
+	def get(self, item_id):
+		row = self.connection().execute(SQLITE_GET, (item_id,)).fetchone()
+		if row is None:
+			return None
+		return {"id": row[0], "name": row[1]}
+
+	def scan(self):
+		# Rows are streamed from the cursor; in WAL mode the open read
+		# transaction does not hold up writers
+		cursor = self.connection().execute(SQLITE_SCAN)
+		cursor.arraysize = 1000
+		try:
+			while True:
+				rows = cursor.fetchmany()
+				if not rows:
+					break
+				for row in rows:
+					yield {"id": row[0], "name": row[1]}
+		finally:
+			cursor.close()
+
+	def insert_many(self, items):
+		conn = self.connection()
+		try:
+			# BEGIN IMMEDIATE takes the write lock up front instead of
+			# upgrading a read lock mid-transaction (which can deadlock)
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				conn.executemany(SQLITE_INSERT, ((item["id"], item["name"]) for item in items))
+			except BaseException:
+				conn.execute("ROLLBACK")
+				raise
+			conn.execute("COMMIT")
+		except sqlite3.IntegrityError as e:
+			raise DuplicateItemError(str(e))
+
+	def update(self, item_id, name):
+		return self.connection().execute(SQLITE_UPDATE, (name, item_id)).rowcount > 0
+
+	def delete(self, item_id):
+		return self.connection().execute(SQLITE_DELETE, (item_id,)).rowcount > 0
+
+	def close(self):
+		with self.lock:
+			for conn in self.connections:
+				conn.close()
+			self.connections.clear()
+
+class MongoBackend(ItemBackend):
+	# MongoDB collection with a unique index on id
+
+	def __init__(self, host, port, db_name):
+		self.client = MongoClient(f"mongodb://{host}:{port}", serverSelectionTimeoutMS=5000)
+		self.collection = self.client[db_name]["items"]
+
+		# Create unique index on id field
+		self.collection.create_index("id", unique=True)
+		print(f"[gRPC] connected to MongoDB at {host}:{port}")
+
+	def get(self, item_id):
+		return self.collection.find_one({"id": item_id}, {"_id": 0, "id": 1, "name": 1})
+
+	def scan(self):
+		return self.collection.find({}, {"_id": 0, "id": 1, "name": 1})
+
+	def insert_many(self, items):
+		try:
+			# insert_many adds _id to the dicts it is given, so pass copies.
+			# Unlike the other backends this is not atomic: items before the
+			# duplicate stay inserted.
+			self.collection.insert_many([dict(item) for item in items])
+		except BulkWriteError as e:
+			if any(error.get("code") == 11000 for error in e.details.get("writeErrors", [])):
+				raise DuplicateItemError(str(e))
+			raise
+
+	def update(self, item_id, name):
+		return self.collection.update_one({"id": item_id}, {"$set": {"name": name}}).matched_count > 0
+
+	def delete(self, item_id):
+		return self.collection.delete_one({"id": item_id}).deleted_count > 0
+
+def backend_from_env():
+	# Build the backend selected by STORAGE_BACKEND (default: mongo)
+	kind = os.getenv("STORAGE_BACKEND", "mongo").lower()
+	if kind == "memory":
+		print("[gRPC] using in-memory storage")
+		return MemoryBackend()
+	if kind == "sqlite":
+		return SQLiteBackend(
+			os.getenv("SQLITE_PATH", "items.db"),
+			synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+		)
+	if kind == "mongo":
+		return MongoBackend(
+			os.environ.get("MONGO_HOST", "localhost"),
+			os.environ.get("MONGO_PORT", "27017"),
+			os.getenv("MONGO_DB", "itemsdb"),
+		)
+	raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from concurrent import futures
+
+import grpc
+
+import myitems_pb2
+import myitems_pb2_grpc
+from server import ItemServiceServicer
+from storage import MemoryBackend, SQLiteBackend
+
+# Servicer tests over the embedded backends, no Mongo needed:
+#	python3 -m pytest test_server.py
+
+class ServicerTests:
+	# Mixed into a TestCase that provides make_backend()
+
+	def setUp(self):
+		self.backend = self.make_backend()
+		self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+		myitems_pb2_grpc.add_ItemServiceServicer_to_server(ItemServiceServicer(self.backend), self.server)
+		port = self.server.add_insecure_port("127.0.0.1:0")
+		self.server.start()
+		self.channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+		self.stub = myitems_pb2_grpc.ItemServiceStub(self.channel)
+
+	def tearDown(self):
+		self.channel.close()
+		self.server.stop(None)
+
+	def assertCode(self, code, call, request):
+		with self.assertRaises(grpc.RpcError) as raised:
+			call(request, timeout=5)
+		self.assertEqual(raised.exception.code(), code)
+
+	def test_crud(self):
+		created = self.stub.CreateItem(myitems_pb2.ItemRequest(id=1, name="one"), timeout=5)
+		self.assertEqual((created.id, created.name, created.success), (1, "one", True))
+		self.assertEqual(self.stub.GetItemById(myitems_pb2.ItemRequest(id=1), timeout=5).name, "one")
+
+		self.stub.UpdateItem(myitems_pb2.ItemRequest(id=1, name="uno"), timeout=5)
+		self.assertEqual(self.stub.GetItemById(myitems_pb2.ItemRequest(id=1), timeout=5).name, "uno")
+
+		self.stub.CreateItem(myitems_pb2.ItemRequest(id=2, name="two"), timeout=5)
+		items = self.stub.ListAllItems(myitems_pb2.Empty(), timeout=5)
+		self.assertEqual(sorted((item.id, item.name) for item in items), [(1, "uno"), (2, "two")])
+
+		self.assertTrue(self.stub.DeleteItem(myitems_pb2.ItemRequest(id=1), timeout=5).success)
+		self.assertEqual([item.id for item in self.stub.ListAllItems(myitems_pb2.Empty(), timeout=5)], [2])
+
+	def test_create_existing(self):
+		self.stub.CreateItem(myitems_pb2.ItemRequest(id=1, name="one"), timeout=5)
+		self.assertCode(grpc.StatusCode.ALREADY_EXISTS, self.stub.CreateItem, myitems_pb2.ItemRequest(id=1, name="again"))
+		self.assertEqual(self.stub.GetItemById(myitems_pb2.ItemRequest(id=1), timeout=5).name, "one")
+
+	def test_missing_item(self):
+		request = myitems_pb2.ItemRequest(id=404, name="nobody")
+		self.assertCode(grpc.StatusCode.NOT_FOUND, self.stub.GetItemById, request)
+		self.assertCode(grpc.StatusCode.NOT_FOUND, self.stub.UpdateItem, request)
+		self.assertCode(grpc.StatusCode.NOT_FOUND, self.stub.DeleteItem, request)
+
+class MemoryBackendTest(ServicerTests, unittest.TestCase):
+
+	def make_backend(self):
+		return MemoryBackend()
+
+class SQLiteBackendTest(ServicerTests, unittest.TestCase):
+
+	def make_backend(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		backend = SQLiteBackend(os.path.join(directory.name, "items.db"))
+		self.addCleanup(backend.close)
+		return backend
+
+if __name__ == '__main__':
+	unittest.main()
@@ -5,8 +5,11 @@ import myitems_pb2_grpc
 import os
 import time
 from pybreaker import CircuitBreaker, CircuitBreakerError
+from fastjson import FastJSONProvider, item_list_response
+from pbcontent import protobuf_response, protobuf_stream_response, read_item_request, wants_protobuf
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # gRPC connection configuration
 GRPC_HOST = os.getenv("GRPC_HOST", "localhost")
@@ -24,6 +27,17 @@ breaker = CircuitBreaker(
 
 print(f"[REST] Connected to gRPC at {GRPC_HOST}:{GRPC_PORT}")
 
+def item_response(response, status, message=None):
+	# Return a gRPC ItemResponse as-is when the client accepts
+	# application/x-protobuf, otherwise as JSON
+	if wants_protobuf():
+		return protobuf_response(response, status)
+
+	body = {"id": response.id, "name": response.name}
+	if message:
+		body["message"] = message
+	return jsonify(body), status
+
 def grpc_create_item(item_data):
 	# Make gRPC call to create item with 1-second timeout
 	request = myitems_pb2.ItemRequest(id=item_data["id"], name=item_data["name"])
@@ -46,7 +60,7 @@ def create_item():
 	# - Circuit breaker opens after 3 consecutive failures
 	# - Returns 503 when circuit is open
 
-	item_data = request.get_json()
+	item_data = read_item_request()
 
 	if not item_data or 'id' not in item_data or 'name' not in item_data:
 		return jsonify({"error": "Bad request"}), 400
@@ -65,7 +79,7 @@ def create_item():
 			response = breaker.call(grpc_create_item, item_data)
 
 			print(f"[REST] Item created successfully: {response.id}")
-			return jsonify({"message": "Item created", "id": response.id, "name": response.name}), 201
+			return item_response(response, 201, "Item created")
 
 		except CircuitBreakerError:
 			# Circuit is open - fail fast
@@ -93,7 +107,7 @@ def get_item(item_id):
 		request = myitems_pb2.ItemRequest(id=item_id)
 		response = stub.GetItemById(request, timeout=1)
 
-		return jsonify({"id": response.id, "name": response.name}), 200
+		return item_response(response, 200)
 
 	except grpc.RpcError as e:
 		if e.code() == grpc.StatusCode.NOT_FOUND:
@@ -104,11 +118,13 @@ def get_item(item_id):
 def list_items():
 	# List all items
 	try:
-		items = []
-		for item in stub.ListAllItems(myitems_pb2.Empty(), timeout=5):
-			items.append({"id": item.id, "name": item.name})
+		items = list(stub.ListAllItems(myitems_pb2.Empty(), timeout=5))
+
+		# Length-delimited ItemResponse stream for protobuf clients
+		if wants_protobuf():
+			return protobuf_stream_response(items)
 
-		return jsonify(items), 200
+		return item_list_response(items), 200
 
 	except grpc.RpcError as e:
 		return jsonify({"error": str(e)}), 500
@@ -120,7 +136,7 @@ def update_item(item_id):
 		# - Circuit breaker opens after 3 consecutive failures
 		# - Returns 503 when circuit is open
 		
-		item_data = request.get_json()
+		item_data = read_item_request()
 		
 		if not item_data or 'id' not in item_data or 'name' not in item_data or item_data['id'] != item_id:
 			return jsonify({"error": "Bad request"}), 400
@@ -139,7 +155,7 @@ def update_item(item_id):
 				response = breaker.call(grpc_update_item, item_data)
 
 				print(f"[REST] Item updated successfully: {response.id}")
-				return jsonify({"message": "Item updated", "id": response.id, "name": response.name}), 201
+				return item_response(response, 201, "Item updated")
 			
 			except CircuitBreakerError:
 				# Circuit is open - fail fast
@@ -167,7 +183,7 @@ def delete_item(item_id):
 	# - Circuit breaker opens after 3 consecutive failures
 	# - Returns 503 when circuit is open
 
-	item_data = request.get_json()
+	item_data = read_item_request()
 
 	if not item_data or item_data['id'] != item_id:
 		return jsonify({"error": "Bad request"}), 400
@@ -186,7 +202,7 @@ def delete_item(item_id):
 			response = breaker.call(grpc_delete_item, item_data)
 
 			print(f"[REST] Item deleted successfully: {response.id}")
-			return jsonify({"message": "Item deleted", "id": response.id, "name": response.name}), 201
+			return item_response(response, 201, "Item deleted")
 		
 		except CircuitBreakerError:
 			# Circuit i sopen - fail fast
@@ -0,0 +1,51 @@
+import time
+import requests
+
+import myitems_pb2
+from pbcontent import PROTOBUF_MIMETYPE, read_delimited
+
+# JSON vs protobuf responses from the REST gateway: latency and client CPU
+# (request + decode) per call. Needs the compose stack running with some items:
+#	docker compose up -d
+#	python3 content_benchmark.py
+
+BASE_URL = "http://localhost:5000"
+
+def decode_json(response):
+	return response.json()
+
+def decode_item(response):
+	return myitems_pb2.ItemResponse.FromString(response.content)
+
+def decode_items(response):
+	return list(read_delimited(response.content))
+
+def bench(label, path, accept, decode, iterations):
+	session = requests.Session()
+	session.headers["Accept"] = accept
+
+	wall_start = time.perf_counter()
+	cpu_start = time.process_time()
+	size = 0
+	for i in range(iterations):
+		response = session.get(BASE_URL + path)
+		size = len(response.content)
+		decode(response)
+	wall = (time.perf_counter() - wall_start) / iterations
+	cpu = (time.process_time() - cpu_start) / iterations
+
+	print(f"	{label:<10}{wall * 1000:>10.3f} ms{cpu * 1000:>12.3f} ms CPU{size:>10} bytes")
+	return wall, cpu
+
+def compare(path, decode_pb, iterations):
+	print(f"\nGET {path} ({iterations} calls)")
+	json_wall, json_cpu = bench("JSON", path, "application/json", decode_json, iterations)
+	pb_wall, pb_cpu = bench("protobuf", path, PROTOBUF_MIMETYPE, decode_pb, iterations)
+	print(f"	protobuf latency: {json_wall / pb_wall:.2f}x, client CPU: {json_cpu / pb_cpu:.2f}x vs JSON")
+
+if __name__ == '__main__':
+	print("Content negotiation benchmark: JSON vs protobuf")
+	print("=" * 50)
+
+	compare("/items/1", decode_item, 2000)
+	compare("/items", decode_items, 200)
@@ -0,0 +1,68 @@
+from flask import Response, request
+from google.protobuf.message import DecodeError
+
+import myitems_pb2
+
+PROTOBUF_MIMETYPE = "application/x-protobuf"
+
+def wants_protobuf():
+	# True when the Accept header prefers protobuf; JSON wins ties and */*
+	best = request.accept_mimetypes.best_match(["application/json", PROTOBUF_MIMETYPE], default="application/json")
+	return best == PROTOBUF_MIMETYPE
+
+def is_protobuf_body():
+	return request.mimetype == PROTOBUF_MIMETYPE
+
+def read_item_request():
+	# Request body as a dict, from JSON or from a serialized ItemRequest; None
+	# when the body can't be parsed, so callers answer 400 in either format
+	if is_protobuf_body():
+		try:
+			message = myitems_pb2.ItemRequest.FromString(request.get_data())
+		except DecodeError:
+			return None
+		return {"id": message.id, "name": message.name}
+	return request.get_json(silent=True)
+
+def encode_varint(value):
+	out = bytearray()
+	while value > 0x7f:
+		out.append((value & 0x7f) | 0x80)
+		value >>= 7
+	out.append(value)
+	return bytes(out)
+
+def decode_varint(data, pos):
+	# Returns (value, position after the varint)
+	result = shift = 0
+	while True:
+		byte = data[pos]
+		pos += 1
+		result |= (byte & 0x7f) << shift
+		if not byte & 0x80:
+			return result, pos
+		shift += 7
+
+def write_delimited(messages):
+	# Length-delimited stream: varint size followed by the message, the same
+	# framing as protobuf's writeDelimitedTo / parseDelimitedFrom
+	parts = []
+	for message in messages:
+		data = message.SerializeToString()
+		parts.append(encode_varint(len(data)))
+		parts.append(data)
+	return b"".join(parts)
+
+def read_delimited(data, message_class=myitems_pb2.ItemResponse):
+	# Client side: decode a length-delimited stream back into messages
+	pos = 0
+	while pos < len(data):
+		size, pos = decode_varint(data, pos)
+		yield message_class.FromString(data[pos:pos + size])
+		pos += size
+
+def protobuf_response(message, status=200):
+	return Response(message.SerializeToString(), status=status, mimetype=PROTOBUF_MIMETYPE)
+
+def protobuf_stream_response(messages, status=200):
+	return Response(write_delimited(messages), status=status, mimetype=PROTOBUF_MIMETYPE)
@@ -0,0 +1,35 @@
+import unittest
+
+import app
+import myitems_pb2
+from pbcontent import PROTOBUF_MIMETYPE
+
+# Request parsing only; nothing here reaches the gRPC service.
+#	python3 -m pytest test_app.py
+
+class MalformedBodyTest(unittest.TestCase):
+	# Bodies that can't be parsed get the JSON 400, whatever their format
+
+	def setUp(self):
+		self.client = app.app.test_client()
+
+	def assertBadRequest(self, response):
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.get_json(), {"error": "Bad request"})
+
+	def test_malformed_protobuf(self):
+		for method, path in (("post", "/items"), ("put", "/items/1"), ("delete", "/items/1")):
+			response = getattr(self.client, method)(path, data=b"\x08", content_type=PROTOBUF_MIMETYPE)
+			self.assertBadRequest(response)
+
+	def test_malformed_json(self):
+		for method, path in (("post", "/items"), ("put", "/items/1"), ("delete", "/items/1")):
+			response = getattr(self.client, method)(path, data=b"{bad", content_type="application/json")
+			self.assertBadRequest(response)
+
+	def test_protobuf_body_checked_like_json(self):
+		body = myitems_pb2.ItemRequest(id=2, name="two").SerializeToString()
+		self.assertBadRequest(self.client.put("/items/1", data=body, content_type=PROTOBUF_MIMETYPE))
+
+if __name__ == '__main__':
+	unittest.main()
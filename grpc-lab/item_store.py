@@ -0,0 +1,133 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+class ItemStore:
+	# Compact in-memory item storage. Instead of one dict per item, items are
+	# kept in parallel arrays:
+	#	ids		array('i')	item ids, sorted (new ids are handed out in increasing order)
+	#	starts		array('q')	offset of each name in the names buffer
+	#	lengths		array('i')	byte length of each UTF-8 encoded name
+	#	names		bytearray	all names back to back
+	# That is 16 bytes plus the name per item, instead of a dict, an int and a
+	# str object (a few hundred bytes). Lookups by id are a binary search.
+	#
+	# The servers share one store between request threads. Every public method
+	# holds _lock: an update or compaction rewrites starts and names in
+	# several steps, and a reader in between would decode the wrong bytes.
+	# Names must be str.
+
+	def __init__(self):
+		self.ids = array('i')
+		self.starts = array('q')
+		self.lengths = array('i')
+		self.names = bytearray()
+		self.garbage = 0	# bytes in names no longer referenced (after updates/deletes)
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __contains__(self, item_id):
+		with self._lock:
+			return self._index(item_id) >= 0
+
+	def __iter__(self):
+		# Items as {"id": ..., "name": ...} dicts, in id order, as of the call
+		with self._lock:
+			items = [{"id": self.ids[i], "name": self._name(i)} for i in range(len(self.ids))]
+		return iter(items)
+
+	def _index(self, item_id):
+		i = bisect_left(self.ids, item_id)
+		if i < len(self.ids) and self.ids[i] == item_id:
+			return i
+		return -1
+
+	def _name(self, i):
+		start = self.starts[i]
+		return self.names[start:start + self.lengths[i]].decode()
+
+	def _append_name(self, name):
+		data = name.encode()
+		start = len(self.names)
+		self.names += data
+		return start, len(data)
+
+	def add(self, item_id, name):
+		with self._lock:
+			return self._add(item_id, name)
+
+	def _add(self, item_id, name):
+		# Insert an item; appending a new highest id is O(1)
+		start, length = self._append_name(name)
+		if not self.ids or item_id > self.ids[-1]:
+			self.ids.append(item_id)
+			self.starts.append(start)
+			self.lengths.append(length)
+		else:
+			i = bisect_left(self.ids, item_id)
+			if i < len(self.ids) and self.ids[i] == item_id:
+				raise KeyError(f"Item {item_id} already exists")
+			self.ids.insert(i, item_id)
+			self.starts.insert(i, start)
+			self.lengths.insert(i, length)
+		return {"id": item_id, "name": name}
+
+	def get(self, item_id):
+		with self._lock:
+			i = self._index(item_id)
+			if i < 0:
+				return None
+			return {"id": item_id, "name": self._name(i)}
+
+	def update(self, item_id, name):
+		with self._lock:
+			return self._update(item_id, name)
+
+	def _update(self, item_id, name):
+		# Names are append-only in the buffer; the old bytes become garbage
+		i = self._index(item_id)
+		if i < 0:
+			return None
+		self.garbage += self.lengths[i]
+		self.starts[i], self.lengths[i] = self._append_name(name)
+		self._maybe_compact()
+		return {"id": item_id, "name": name}
+
+	def delete(self, item_id, renumber=False):
+		with self._lock:
+			return self._delete(item_id, renumber)
+
+	def _delete(self, item_id, renumber=False):
+		# Remove an item. With renumber=True every higher id shifts down by one
+		# (rest-lab keeps ids contiguous).
+		i = self._index(item_id)
+		if i < 0:
+			return False
+		self.garbage += self.lengths[i]
+		del self.ids[i]
+		del self.starts[i]
+		del self.lengths[i]
+		if renumber:
+			self.ids[i:] = array('i', [item - 1 for item in self.ids[i:]])
+		self._maybe_compact()
+		return True
+
+	def _maybe_compact(self):
+		if self.garbage > 4096 and self.garbage * 2 > len(self.names):
+			self._compact()
+
+	def compact(self):
+		with self._lock:
+			self._compact()
+
+	def _compact(self):
+		# Rewrite the names buffer without garbage
+		names = bytearray()
+		for i in range(len(self.ids)):
+			start = self.starts[i]
+			self.starts[i] = len(names)
+			names += self.names[start:start + self.lengths[i]]
+		self.names = names
+		self.garbage = 0
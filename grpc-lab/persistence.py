@@ -0,0 +1,299 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+
+from item_store import ItemStore
+
+# Write-ahead log records: header (op, item id, name length), UTF-8 name, CRC32
+OP_ADD = 1
+OP_UPDATE = 2
+OP_DELETE = 3
+OP_DELETE_RENUMBER = 4
+
+RECORD_HEADER = struct.Struct('<BiI')
+RECORD_CRC = struct.Struct('<I')
+
+# Snapshot: header (magic, item count, names length) followed by the raw
+# ItemStore arrays (ids, starts, lengths; native byte order) and names buffer
+SNAPSHOT_HEADER = struct.Struct('<8sqq')
+SNAPSHOT_MAGIC = b'ITEMSNP1'
+
+class DurableItemStore(ItemStore):
+	# ItemStore persisted to data_dir with a write-ahead log and snapshots.
+	#
+	# Files come in generations: snapshot-N.bin holds the state at the moment
+	# wal-N.log was started. Startup mmaps the newest snapshot, loads its
+	# arrays directly and replays wal-N.log (and any later WAL) on top.
+	#
+	# Every change is appended to the WAL before the call returns. A background
+	# flusher fsyncs the WAL; all writes that arrive during one fsync share the
+	# next one (group commit). With sync=True writers wait until their record
+	# is durable, with sync=False they return immediately.
+	#
+	# After snapshot_every WAL records a background snapshot is written and
+	# older generations are deleted.
+
+	def __init__(self, data_dir, sync=True, snapshot_every=100000):
+		super().__init__()
+		self.data_dir = data_dir
+		self.sync = sync
+		self.snapshot_every = snapshot_every
+		os.makedirs(data_dir, exist_ok=True)
+
+		# self._lock (from ItemStore) also covers WAL appends
+		self._fsync_lock = threading.Lock()	# WAL fsync / file rotation
+		self._snapshot_lock = threading.Lock()
+		self._flushed = threading.Condition()
+		self._pending = threading.Event()
+		self._snapshot_due = threading.Event()
+		self._written_lsn = 0
+		self._durable_lsn = 0
+		self._records_since_snapshot = 0
+		self._closed = False
+
+		self.generation = self._recover()
+		self._wal = open(self._path("wal", self.generation), 'ab')
+
+		threading.Thread(target=self._flush_loop, daemon=True).start()
+		threading.Thread(target=self._snapshot_loop, daemon=True).start()
+
+	# Files
+
+	def _path(self, kind, generation):
+		suffix = "bin" if kind == "snapshot" else "log"
+		return os.path.join(self.data_dir, f"{kind}-{generation:08d}.{suffix}")
+
+	def _generations(self, kind):
+		generations = []
+		for name in os.listdir(self.data_dir):
+			prefix, _, rest = name.partition("-")
+			number, _, suffix = rest.partition(".")
+			if prefix == kind and number.isdigit() and suffix in ("bin", "log"):
+				generations.append(int(number))
+		return sorted(generations)
+
+	def _fsync_dir(self):
+		fd = os.open(self.data_dir, os.O_RDONLY)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+	# Recovery
+
+	def _recover(self):
+		snapshots = self._generations("snapshot")
+		wals = self._generations("wal")
+
+		generation = 0
+		if snapshots:
+			generation = snapshots[-1]
+			self._load_snapshot(self._path("snapshot", generation))
+		elif wals:
+			generation = wals[0]
+
+		replayed = 0
+		for wal in wals:
+			if wal >= generation:
+				replayed += self._replay(self._path("wal", wal))
+				generation = wal
+
+		self._records_since_snapshot = replayed
+		print(f"[STORE] Recovered {len(self)} items from {self.data_dir} ({replayed} WAL records replayed)")
+		return generation
+
+	def _load_snapshot(self, path):
+		with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			magic, count, names_length = SNAPSHOT_HEADER.unpack_from(mm, 0)
+			if magic != SNAPSHOT_MAGIC:
+				raise ValueError(f"{path} is not an item snapshot")
+
+			pos = SNAPSHOT_HEADER.size
+			for name, typecode in (("ids", 'i'), ("starts", 'q'), ("lengths", 'i')):
+				values = array(typecode)
+				size = count * values.itemsize
+				values.frombytes(mm[pos:pos + size])
+				setattr(self, name, values)
+				pos += size
+			self.names = bytearray(mm[pos:pos + names_length])
+
+		self.garbage = len(self.names) - sum(self.lengths)
+
+	def _replay(self, path):
+		# Apply every complete record; a torn record at the end (crash during
+		# a write) is cut off so new records are appended after valid data
+		with open(path, 'rb') as f:
+			data = f.read()
+
+		pos = count = 0
+		while pos + RECORD_HEADER.size <= len(data):
+			op, item_id, length = RECORD_HEADER.unpack_from(data, pos)
+			end = pos + RECORD_HEADER.size + length
+			if end + RECORD_CRC.size > len(data):
+				break
+			(crc,) = RECORD_CRC.unpack_from(data, end)
+			if crc != zlib.crc32(data[pos:end]):
+				break
+
+			self._apply(op, item_id, data[pos + RECORD_HEADER.size:end].decode())
+			pos = end + RECORD_CRC.size
+			count += 1
+
+		if pos < len(data):
+			print(f"[STORE] Truncating {len(data) - pos} bytes of incomplete WAL data in {path}")
+			with open(path, 'r+b') as f:
+				f.truncate(pos)
+		return count
+
+	def _apply(self, op, item_id, name):
+		if op == OP_ADD:
+			self._add(item_id, name)
+		elif op == OP_UPDATE:
+			self._update(item_id, name)
+		elif op in (OP_DELETE, OP_DELETE_RENUMBER):
+			self._delete(item_id, renumber=op == OP_DELETE_RENUMBER)
+
+	# Logging
+
+	def _log(self, op, item_id, name=""):
+		# Caller holds self._lock
+		data = name.encode()
+		record = RECORD_HEADER.pack(op, item_id, len(data)) + data
+		self._wal.write(record + RECORD_CRC.pack(zlib.crc32(record)))
+		self._written_lsn += 1
+		self._records_since_snapshot += 1
+		if self._records_since_snapshot >= self.snapshot_every:
+			self._snapshot_due.set()
+		return self._written_lsn
+
+	def _commit(self, lsn):
+		self._pending.set()
+		if not self.sync:
+			return
+		with self._flushed:
+			while self._durable_lsn < lsn:
+				self._flushed.wait()
+
+	def _flush_loop(self):
+		while not self._closed:
+			self._pending.wait()
+			self._pending.clear()
+			self._flush()
+
+	def _flush(self):
+		with self._fsync_lock:
+			with self._lock:
+				if self._wal.closed:
+					return
+				lsn = self._written_lsn
+				self._wal.flush()
+				fd = self._wal.fileno()
+			# Writers keep appending while the disk syncs; they ride the next fsync
+			os.fsync(fd)
+		with self._flushed:
+			self._durable_lsn = max(self._durable_lsn, lsn)
+			self._flushed.notify_all()
+
+	# ItemStore operations
+
+	def add(self, item_id, name):
+		with self._lock:
+			item = self._add(item_id, name)
+			lsn = self._log(OP_ADD, item_id, name)
+		self._commit(lsn)
+		return item
+
+	def update(self, item_id, name):
+		with self._lock:
+			item = self._update(item_id, name)
+			if item is None:
+				return None
+			lsn = self._log(OP_UPDATE, item_id, name)
+		self._commit(lsn)
+		return item
+
+	def delete(self, item_id, renumber=False):
+		with self._lock:
+			if not self._delete(item_id, renumber):
+				return False
+			lsn = self._log(OP_DELETE_RENUMBER if renumber else OP_DELETE, item_id)
+		self._commit(lsn)
+		return True
+
+	# Snapshots
+
+	def _snapshot_loop(self):
+		while not self._closed:
+			self._snapshot_due.wait()
+			self._snapshot_due.clear()
+			if not self._closed:
+				self.snapshot()
+
+	def snapshot(self):
+		# Start a new WAL generation and write the state as of that point. Only
+		# the array copies happen under the lock; file writing runs alongside
+		# new writes.
+		with self._snapshot_lock:
+			with self._fsync_lock, self._lock:
+				self._wal.flush()
+				os.fsync(self._wal.fileno())
+				self._wal.close()
+				with self._flushed:
+					self._durable_lsn = self._written_lsn
+					self._flushed.notify_all()
+
+				self.generation += 1
+				generation = self.generation
+				self._wal = open(self._path("wal", generation), 'ab')
+				self._records_since_snapshot = 0
+
+				ids = array('i', self.ids)
+				starts = array('q', self.starts)
+				lengths = array('i', self.lengths)
+				names = bytes(self.names)
+
+			path = self._path("snapshot", generation)
+			with open(path + ".tmp", 'wb') as f:
+				f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(ids), len(names)))
+				for values in (ids, starts, lengths):
+					values.tofile(f)
+				f.write(names)
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(path + ".tmp", path)
+			self._fsync_dir()
+
+			# Older generations are fully covered by the new snapshot
+			for kind in ("snapshot", "wal"):
+				for old in self._generations(kind):
+					if old < generation:
+						os.remove(self._path(kind, old))
+
+			print(f"[STORE] Snapshot {generation} written: {len(ids)} items")
+
+	def close(self):
+		self._closed = True
+		self._pending.set()
+		self._snapshot_due.set()
+		with self._snapshot_lock, self._fsync_lock, self._lock:
+			self._wal.flush()
+			os.fsync(self._wal.fileno())
+			self._wal.close()
+			with self._flushed:
+				self._durable_lsn = self._written_lsn
+				self._flushed.notify_all()
+
+def open_store(data_dir=None):
+	# Durable store when a data directory is configured (ITEMS_DATA_DIR),
+	# otherwise the plain in-memory ItemStore
+	data_dir = data_dir or os.getenv("ITEMS_DATA_DIR")
+	if not data_dir:
+		return ItemStore()
+	return DurableItemStore(
+		data_dir,
+		sync=os.getenv("WAL_SYNC", "1") != "0",
+		snapshot_every=int(os.getenv("SNAPSHOT_EVERY", "100000")),
+	)
@@ -4,19 +4,21 @@ import time
 import myitems_pb2
 import myitems_pb2_grpc
 from grpc_reflection.v1alpha import reflection
+from persistence import open_store
 
-# In-memory data storage (reuse reflection)
-items = [
-	{"id": 1, "name": "Kala"},
-	{"id": 2, "name": "JP"}
-]
-next_id = 3
+# In-memory data storage (reuse reflection), compact array-backed store.
+# Set ITEMS_DATA_DIR to persist it with a WAL and snapshots (persistence.py).
+items = open_store()
+if not len(items):
+	items.add(1, "Kala")
+	items.add(2, "JP")
+next_id = items.ids[-1] + 1
 
 class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 
 	def GetItemById(self, request, context):
 		# Unary RPC: Get single item by ID
-		item = next((i for i in items if i['id'] == request.id), None)
+		item = items.get(request.id)
 		if item:
 			return myitems_pb2.ItemResponse(id=item['id'], name=item['name'])
 		else:
@@ -40,8 +42,7 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 				context.set_details('Item name cannot be empty')
 				return myitems_pb2.ItemsAddedResult(total_count=0)
 
-			new_item = {"id": next_id, "name": item_request.name}
-			items.append(new_item)
+			items.add(next_id, item_request.name)
 			next_id += 1
 			count += 1
 
@@ -0,0 +1,109 @@
+import collections
+import itertools
+import os
+import threading
+import time
+
+from prometheus_client import Counter, Gauge
+
+# Prometheus metrics (served by start_http_server on port 9103)
+EVENTS_PUBLISHED = Counter(
+	'item_events_published_total',
+	'Item change events recorded for WatchItems',
+	['type']
+)
+
+WATCHERS_GAUGE = Gauge(
+	'item_watchers',
+	'Open WatchItems streams',
+	multiprocess_mode='livesum'
+)
+
+WATCH_RESETS = Counter(
+	'item_watch_resets_total',
+	'WatchItems resumes that could not be served from the buffer (client must resync)'
+)
+
+class ResumeTooOld(Exception):
+	# The resume token is from another process or older than the buffer
+	pass
+
+class EventLog:
+	# In-process log of item changes for WatchItems, filled by the servicer's
+	# write paths.
+	#
+	# Events get consecutive sequence numbers and the last `size` of them are
+	# kept in a ring buffer, so a client that reconnects with its last token
+	# receives only what it missed. Tokens are "<epoch>:<sequence>"; the epoch
+	# is fixed at startup, so tokens from before a restart (or from another
+	# replica) are detected and answered with a reset instead of silently
+	# skipping events.
+
+	def __init__(self, size=10000):
+		self.epoch = format(time.time_ns(), "x")
+		self.events = collections.deque(maxlen=size)
+		self.sequence = 0
+		self.changed = threading.Condition()
+
+	def token(self, sequence):
+		return f"{self.epoch}:{sequence}"
+
+	def publish(self, event_type, item_id, name=""):
+		with self.changed:
+			self.sequence += 1
+			self.events.append((self.sequence, event_type, item_id, name))
+			self.changed.notify_all()
+		EVENTS_PUBLISHED.labels(event_type).inc()
+
+	def position(self, token):
+		# Sequence number to resume after; "" means "from now on"
+		if not token:
+			return self.sequence
+		epoch, _, sequence = token.partition(":")
+		if epoch != self.epoch or not sequence.isdigit():
+			raise ResumeTooOld(token)
+		sequence = int(sequence)
+		with self.changed:
+			oldest = self.events[0][0] if self.events else self.sequence + 1
+			if sequence > self.sequence or sequence + 1 < oldest:
+				raise ResumeTooOld(token)
+		return sequence
+
+	def wait(self, after, timeout):
+		# Events with sequence > after, waiting up to timeout for the first one
+		with self.changed:
+			if self.sequence <= after:
+				self.changed.wait(timeout)
+			if self.sequence <= after:
+				return []
+			oldest = self.events[0][0]
+			if after + 1 < oldest:
+				raise ResumeTooOld(self.token(after))
+			start = after + 1 - oldest
+			return list(itertools.islice(self.events, start, None))
+
+class WatchSlots:
+	# Caps concurrent WatchItems streams: each one occupies a server worker
+	# thread for as long as the client stays connected
+
+	def __init__(self, limit):
+		self.limit = limit
+		self.open = 0
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		with self.lock:
+			if self.open >= self.limit:
+				return False
+			self.open += 1
+			WATCHERS_GAUGE.set(self.open)
+			return True
+
+	def release(self):
+		with self.lock:
+			self.open -= 1
+			WATCHERS_GAUGE.set(self.open)
+
+WATCH_BUFFER = int(os.getenv("WATCH_BUFFER", "10000"))
+WATCH_MAX_STREAMS = int(os.getenv("WATCH_MAX_STREAMS", "8"))
+WATCH_HEARTBEAT = float(os.getenv("WATCH_HEARTBEAT", "15"))
@@ -0,0 +1,94 @@
+import os
+import random
+import sys
+import time
+
+from pymongo import MongoClient
+
+# Lookup and scan latency of the two MONGO_ID_MODE layouts, straight against
+# MongoDB with the same queries server.py sends.
+#	python3 id_mode_benchmark.py [items]	(default 200,000)
+# Uses MONGO_HOST/MONGO_PORT and a scratch database "idbench" that is dropped
+# afterwards. The plain layout (unique id index, no projection) is the
+# baseline the service used before MONGO_ID_MODE existed.
+
+LOOKUPS = 20000
+SCANS = 3
+
+LAYOUTS = [
+	# (collection, label, id field, indexes, projection, scan hint)
+	("baseline", "baseline (id index, full doc)", "id", [[("id", 1)]], None, None),
+	("field", "field (covering id+name index)", "id", [[("id", 1)], [("id", 1), ("name", 1)]],
+			{"_id": 0, "id": 1, "name": 1}, [("id", 1), ("name", 1)]),
+	("by_id", "_id (item id as _id)", "_id", [], {"_id": 1, "name": 1}, None),
+]
+
+def seed(collection, id_field, indexes, count):
+	for index in indexes:
+		collection.create_index(index, unique=index == [("id", 1)])
+	batch = 10000
+	for start in range(1, count + 1, batch):
+		collection.insert_many([{id_field: i, "name": f"Item{i}"} for i in range(start, min(start + batch, count + 1))],
+				ordered=False)
+
+def plan_summary(collection, id_field, projection):
+	# Winning plan stages and documents examined for one lookup
+	explain = collection.find({id_field: 1}, projection).explain()
+	stats = explain.get("executionStats", {})
+	stages = []
+	stage = explain["queryPlanner"]["winningPlan"]
+	stage = stage.get("queryPlan", stage)	# MongoDB 7+ (slot-based engine) nests the plan
+	while stage:
+		stages.append(stage.get("stage", "?"))
+		stage = stage.get("inputStage")
+	return " <- ".join(stages), stats.get("totalDocsExamined")
+
+def percentile(values, p):
+	return values[min(len(values) - 1, int(len(values) * p))]
+
+def run(collection, label, id_field, indexes, projection, hint, count):
+	collection.drop()
+	seed(collection, id_field, indexes, count)
+
+	stages, examined = plan_summary(collection, id_field, projection)
+	print(f"\n{label}:")
+	print(f"	Plan:		{stages} (docs examined: {examined})")
+
+	rng = random.Random(1)
+	latencies = []
+	for _ in range(LOOKUPS):
+		item_id = rng.randint(1, count)
+		start = time.perf_counter()
+		collection.find_one({id_field: item_id}, projection)
+		latencies.append(time.perf_counter() - start)
+	latencies.sort()
+	print(f"	GetItemById:	p50 {percentile(latencies, 0.5) * 1e6:.0f}us, p99 {percentile(latencies, 0.99) * 1e6:.0f}us")
+
+	best = None
+	for _ in range(SCANS):
+		cursor = collection.find({}, projection)
+		if hint:
+			cursor = cursor.hint(hint)
+		start = time.perf_counter()
+		received = sum(1 for _ in cursor)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	print(f"	ListAllItems:	{best:.3f}s for {received} items")
+
+	stats = collection.database.command("collStats", collection.name)
+	print(f"	Storage:	data {stats['size'] / 2**20:.1f} MiB, indexes {stats['totalIndexSize'] / 2**20:.1f} MiB")
+
+if __name__ == '__main__':
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+	mongo_host = os.environ.get("MONGO_HOST", "localhost")
+	mongo_port = os.environ.get("MONGO_PORT", "27017")
+	client = MongoClient(f"mongodb://{mongo_host}:{mongo_port}", serverSelectionTimeoutMS=5000)
+	db = client["idbench"]
+
+	print(f"MONGO_ID_MODE benchmark ({count} items)")
+	print("=" * 50)
+	try:
+		for name, label, id_field, indexes, projection, hint in LAYOUTS:
+			run(db[name], label, id_field, indexes, projection, hint, count)
+	finally:
+		client.drop_database("idbench")
@@ -0,0 +1,244 @@
+import collections
+import os
+import threading
+import time
+
+from prometheus_client import Counter, Gauge
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Prometheus metrics (served by start_http_server on port 9103)
+CACHE_REQUESTS = Counter(
+	'item_cache_requests_total',
+	'GetItemById cache lookups',
+	['result']
+)
+
+CACHE_INVALIDATIONS = Counter(
+	'item_cache_invalidations_total',
+	'Cached items dropped or refreshed because the item changed',
+	['source', 'action']
+)
+
+CACHE_SIZE = Gauge(
+	'item_cache_items',
+	'Items currently held in the read cache',
+	multiprocess_mode='livesum'
+)
+
+WATCHER_MODE = Gauge(
+	'item_cache_watcher_mode',
+	'How this replica learns about writes from other replicas (1 = active)',
+	['mode'],
+	multiprocess_mode='livemax'
+)
+
+# Change streams need a replica set or sharded cluster; a standalone mongod
+# answers watch() with this error code
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+MISSING = object()	# cached "item does not exist"
+
+# Invalidations are counted per shard of the id space, so a write only
+# discards in-flight reads of ids in its own shard
+GENERATION_SHARDS = 1024
+
+class ItemCache:
+	# LRU cache of item names for GetItemById, kept correct across replicas by
+	# a CacheWatcher. Not-found answers are cached too.
+	#
+	# A lookup that misses reads Mongo outside the lock. If an invalidation
+	# lands in between, the value it read may already be stale, so put() only
+	# stores it when the id's shard saw no invalidation since the read began
+	# (a counter per shard; cheap, and errs on the side of not caching).
+
+	def __init__(self, max_items):
+		self.max_items = max_items
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.generations = [0] * GENERATION_SHARDS
+
+	def generation(self, item_id):
+		# Token for put(): changes whenever item_id may have been written
+		return self.generations[hash(item_id) % GENERATION_SHARDS]
+
+	def _bump(self, item_id):
+		self.generations[hash(item_id) % GENERATION_SHARDS] += 1
+
+	def __len__(self):
+		return len(self.entries)
+
+	def lookup(self, item_id):
+		# (hit, name-or-MISSING, token); pass token to put() after a miss
+		with self.lock:
+			value = self.entries.get(item_id)
+			if value is not None:
+				self.entries.move_to_end(item_id)
+				CACHE_REQUESTS.labels("hit").inc()
+				return True, value, self.generation(item_id)
+			CACHE_REQUESTS.labels("miss").inc()
+			return False, None, self.generation(item_id)
+
+	def put(self, item_id, name, token):
+		with self.lock:
+			if token != self.generation(item_id):
+				return
+			self.entries[item_id] = MISSING if name is None else name
+			self.entries.move_to_end(item_id)
+			if len(self.entries) > self.max_items:
+				self.entries.popitem(last=False)
+			CACHE_SIZE.set(len(self.entries))
+
+	def cached_ids(self):
+		with self.lock:
+			return list(self.entries)
+
+	def invalidate(self, item_id, source="local"):
+		with self.lock:
+			self._bump(item_id)
+			if self.entries.pop(item_id, None) is not None:
+				CACHE_INVALIDATIONS.labels(source, "evict").inc()
+			CACHE_SIZE.set(len(self.entries))
+
+	def refresh(self, item_id, name, source):
+		# Replace a cached entry with the new value from a change event;
+		# items nobody has read are not pulled into the cache
+		with self.lock:
+			self._bump(item_id)
+			if item_id in self.entries:
+				self.entries[item_id] = MISSING if name is None else name
+				CACHE_INVALIDATIONS.labels(source, "refresh").inc()
+
+	def clear(self, source):
+		with self.lock:
+			self.generations = [generation + 1 for generation in self.generations]
+			if self.entries:
+				CACHE_INVALIDATIONS.labels(source, "clear").inc()
+			self.entries.clear()
+			CACHE_SIZE.set(0)
+
+class CacheWatcher:
+	# Applies writes made by any replica to the local ItemCache.
+	#
+	# With a replica set it follows a change stream: inserts/updates refresh
+	# cached items from the event's full document, deletes evict them. The
+	# stream is resumed from the last token after errors; if the token is too
+	# old the cache is cleared, since events may have been missed. Deletes in
+	# MONGO_ID_MODE=field only carry the ObjectId, so they trigger a re-read of
+	# the cached ids instead, at most once per poll_interval (or as soon as the
+	# stream is idle).
+	#
+	# A standalone mongod has no change streams. The watcher then polls:
+	# every poll_interval it re-reads the cached ids and refreshes or evicts
+	# entries that changed, so other replicas' writes show up within one
+	# interval.
+
+	def __init__(self, collection, cache, id_field, poll_interval=1.0, poll_batch=1000):
+		self.collection = collection
+		self.cache = cache
+		self.id_field = id_field
+		self.poll_interval = poll_interval
+		self.poll_batch = poll_batch
+		self.mode = None
+		self.resume_token = None
+		self.recheck_since = None	# first field-mode delete not yet rechecked
+
+	def start(self):
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def _set_mode(self, mode):
+		self.mode = mode
+		for name in ("change_stream", "poll"):
+			WATCHER_MODE.labels(name).set(1 if name == mode else 0)
+		print(f"[CACHE] Watching for writes via {mode}")
+
+	def _run(self):
+		while True:
+			try:
+				self._watch()
+			except OperationFailure as e:
+				if e.code == CHANGE_STREAM_UNSUPPORTED:
+					break
+				print(f"[CACHE] Change stream failed: {e}")
+				if self.resume_token is not None and e.code in (260, 280, 286):
+					# Resume point no longer in the oplog; events were lost
+					self.resume_token = None
+					self.cache.clear("change_stream")
+			except PyMongoError as e:
+				print(f"[CACHE] Change stream interrupted: {e}")
+			except (NotImplementedError, TypeError, AttributeError):
+				# Local stand-ins for mongod (e.g. mongomock) have no watch()
+				break
+			time.sleep(self.poll_interval)
+
+		self._set_mode("poll")
+		while True:
+			time.sleep(self.poll_interval)
+			try:
+				self.poll()
+			except PyMongoError as e:
+				print(f"[CACHE] Poll failed: {e}")
+
+	def _watch(self):
+		options = {"full_document": "updateLookup"}
+		if self.resume_token is not None:
+			options["resume_after"] = self.resume_token
+		with self.collection.watch(**options) as stream:
+			if self.mode != "change_stream":
+				self._set_mode("change_stream")
+				# Writes made before the stream opened were not seen
+				self.cache.clear("change_stream")
+			while stream.alive:
+				event = stream.try_next()
+				if event is not None:
+					self.resume_token = stream.resume_token
+					self.apply(event)
+				if self.recheck_since is not None and (event is None or
+						time.monotonic() - self.recheck_since >= self.poll_interval):
+					self.recheck_since = None
+					self.poll("change_stream")
+
+	def apply(self, event):
+		operation = event["operationType"]
+		document = event.get("fullDocument")
+		if operation in ("insert", "update", "replace") and document:
+			self.cache.refresh(document[self.id_field], document.get("name"), "change_stream")
+		elif operation in ("insert", "update", "replace", "delete") and self.id_field == "_id":
+			# Deleted (or deleted again before the full document lookup)
+			self.cache.invalidate(event["documentKey"]["_id"], "change_stream")
+		elif operation in ("insert", "update", "replace", "delete"):
+			# Only the ObjectId is known; see which cached ids are gone
+			if self.recheck_since is None:
+				self.recheck_since = time.monotonic()
+		else:
+			# drop/rename/invalidate affect everything
+			self.cache.clear("change_stream")
+
+	def poll(self, source="poll"):
+		# Re-read every cached id and refresh entries that changed
+		ids = self.cache.cached_ids()
+		for start in range(0, len(ids), self.poll_batch):
+			chunk = ids[start:start + self.poll_batch]
+			with self.cache.lock:
+				tokens = [self.cache.generation(item_id) for item_id in chunk]
+			current = {doc[self.id_field]: doc["name"] for doc in
+					self.collection.find({self.id_field: {"$in": chunk}}, {self.id_field: 1, "name": 1})}
+			with self.cache.lock:
+				for item_id, token in zip(chunk, tokens):
+					if token != self.cache.generation(item_id):
+						continue	# a write raced the read; check again next round
+					cached = self.cache.entries.get(item_id)
+					if cached is None:
+						continue
+					name = current.get(item_id, MISSING)
+					if cached != name:
+						self.cache.entries[item_id] = name
+						CACHE_INVALIDATIONS.labels(source, "refresh").inc()
+
+def cache_from_env(collection, id_field):
+	# ItemCache + running CacheWatcher when ITEM_CACHE_SIZE > 0, otherwise None
+	size = int(os.getenv("ITEM_CACHE_SIZE", "0"))
+	if size <= 0:
+		return None
+	cache = ItemCache(size)
+	CacheWatcher(collection, cache, id_field, poll_interval=float(os.getenv("ITEM_CACHE_POLL_INTERVAL", "1.0"))).start()
+	return cache
@@ -0,0 +1,234 @@
+import math
+import os
+import threading
+import time
+
+import grpc
+from prometheus_client import Counter, Gauge
+
+# Prometheus metrics (served by start_http_server on port 9103)
+LIMIT_GAUGE = Gauge(
+	'grpc_concurrency_limit',
+	'Current adaptive concurrency limit (summed over worker processes)',
+	multiprocess_mode='livesum'
+)
+
+INFLIGHT_GAUGE = Gauge(
+	'grpc_concurrency_inflight',
+	'RPCs admitted by the limiter and not yet finished (queued or running)',
+	multiprocess_mode='livesum'
+)
+
+REJECTED_COUNTER = Counter(
+	'grpc_concurrency_rejected_total',
+	'RPCs rejected with RESOURCE_EXHAUSTED by the concurrency limiter',
+	['grpc_method', 'priority']
+)
+
+# Share of the limit each priority class may use. When in-flight work reaches
+# share * limit, calls of that class are shed, so writes are rejected before
+# reads as the service approaches overload.
+PRIORITY_SHARES = {
+	"read": 1.0,
+	"write": float(os.getenv("LIMITER_WRITE_SHARE", "0.8")),
+	"batch": 0.5,
+}
+
+METHOD_PRIORITIES = {
+	"GetItemById": "read",
+	"ListAllItems": "read",
+	"CreateItem": "write",
+	"UpdateItem": "write",
+	"DeleteItem": "write",
+}
+
+# Executor threads kept free of admitted calls (see limiter_from_env), so a
+# rejection is answered while every handler thread is busy
+REJECT_THREADS = 2
+
+# Long-lived streams: their duration says nothing about server load and they
+# would hold a slot indefinitely, so they bypass the limiter
+UNLIMITED_METHODS = {"WatchItems"}
+
+class AIMDLimit:
+	# Additive increase / multiplicative decrease: grow by one while the limit
+	# is actually being used, back off when a call is dropped or too slow.
+
+	def __init__(self, min_limit=1, max_limit=200, backoff_ratio=0.9, timeout=0.5):
+		self.min_limit = min_limit
+		self.max_limit = max_limit
+		self.backoff_ratio = backoff_ratio
+		self.timeout = timeout
+
+	def update(self, limit, rtt, inflight, dropped):
+		if dropped or rtt > self.timeout:
+			return max(self.min_limit, limit * self.backoff_ratio)
+		if inflight * 2 >= limit:
+			return min(self.max_limit, limit + 1)
+		return limit
+
+class GradientLimit:
+	# Gradient-based limit: compare each sample's latency with a slowly moving
+	# long-term baseline. When latency rises above the baseline (queueing) the
+	# gradient drops below 1 and the limit shrinks; sqrt(limit) headroom lets
+	# it probe upwards while latency stays flat.
+
+	def __init__(self, min_limit=1, max_limit=200, smoothing=0.2, tolerance=1.5, long_window=600):
+		self.min_limit = min_limit
+		self.max_limit = max_limit
+		self.smoothing = smoothing
+		self.tolerance = tolerance
+		self.long_window = long_window
+		self.long_rtt = None
+
+	def update(self, limit, rtt, inflight, dropped):
+		rtt = max(rtt, 1e-6)
+		if self.long_rtt is None:
+			self.long_rtt = rtt
+		else:
+			self.long_rtt += (rtt - self.long_rtt) / self.long_window
+			# Latency dropped a lot (e.g. after recovery): let the baseline follow
+			if self.long_rtt / rtt > 2:
+				self.long_rtt *= 0.95
+
+		# Not enough load to learn anything from this sample
+		if inflight < limit / 2 and not dropped:
+			return limit
+
+		gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / rtt))
+		if dropped:
+			gradient = 0.5
+		new_limit = limit * gradient + math.sqrt(limit)
+		new_limit = limit * (1 - self.smoothing) + new_limit * self.smoothing
+		return max(self.min_limit, min(self.max_limit, new_limit))
+
+class ConcurrencyLimiter:
+	# Tracks in-flight calls against an adaptive limit. Admission happens when
+	# the call arrives, on gRPC's polling thread before the call is handed to
+	# the executor, so queued work counts against the limit too.
+
+	def __init__(self, algorithm, initial_limit=20, stale_after=60):
+		self.algorithm = algorithm
+		self.limit = initial_limit
+		self.stale_after = stale_after
+		self._inflight = {}	# token -> admission time
+		self._next_token = 0
+		self._lock = threading.Lock()
+		LIMIT_GAUGE.set(self.limit)
+
+	def _reap(self, now):
+		# Calls cancelled while still queued never run their handler, so their
+		# slot is never released. Drop slots older than stale_after as drops.
+		expired = [t for t, started in self._inflight.items() if now - started > self.stale_after]
+		for token in expired:
+			del self._inflight[token]
+			self.limit = self.algorithm.update(self.limit, self.stale_after, len(self._inflight), True)
+
+	def try_acquire(self, share=1.0):
+		with self._lock:
+			now = time.monotonic()
+			if len(self._inflight) >= self.limit * share:
+				self._reap(now)
+				if len(self._inflight) >= self.limit * share:
+					return None
+			token = self._next_token
+			self._next_token += 1
+			self._inflight[token] = now
+			INFLIGHT_GAUGE.set(len(self._inflight))
+			return token
+
+	def release(self, token, dropped=False):
+		with self._lock:
+			started = self._inflight.pop(token, None)
+			if started is None:
+				return
+			rtt = time.monotonic() - started
+			self.limit = self.algorithm.update(self.limit, rtt, len(self._inflight) + 1, dropped)
+			INFLIGHT_GAUGE.set(len(self._inflight))
+			LIMIT_GAUGE.set(self.limit)
+
+def wrap_handler(handler, wrapper):
+	# Return a copy of an RpcMethodHandler whose behavior is wrapper(behavior, response_streaming)
+	if handler.unary_unary:
+		factory, behavior = grpc.unary_unary_rpc_method_handler, handler.unary_unary
+	elif handler.unary_stream:
+		factory, behavior = grpc.unary_stream_rpc_method_handler, handler.unary_stream
+	elif handler.stream_unary:
+		factory, behavior = grpc.stream_unary_rpc_method_handler, handler.stream_unary
+	else:
+		factory, behavior = grpc.stream_stream_rpc_method_handler, handler.stream_stream
+
+	return factory(
+		wrapper(behavior, handler.response_streaming),
+		request_deserializer=handler.request_deserializer,
+		response_serializer=handler.response_serializer,
+	)
+
+class ConcurrencyLimitInterceptor(grpc.ServerInterceptor):
+	# Sheds ItemService calls with RESOURCE_EXHAUSTED once the adaptive limit
+	# for their priority class is reached. The priority comes from the method
+	# name; a client may lower it with an "x-priority" metadata key (e.g.
+	# "batch" for bulk jobs) but never raise it, or any caller could opt out
+	# of load shedding.
+
+	def __init__(self, limiter, service_prefix="/myitems.ItemService/"):
+		self.limiter = limiter
+		self.service_prefix = service_prefix
+
+	def _priority(self, method, metadata):
+		priority = METHOD_PRIORITIES.get(method, "read")
+		for key, value in metadata or ():
+			if key == "x-priority" and PRIORITY_SHARES.get(value, 1.0) < PRIORITY_SHARES[priority]:
+				return value
+		return priority
+
+	def intercept_service(self, continuation, handler_call_details):
+		handler = continuation(handler_call_details)
+		if handler is None or not handler_call_details.method.startswith(self.service_prefix):
+			return handler
+
+		method = handler_call_details.method[len(self.service_prefix):]
+		if method in UNLIMITED_METHODS:
+			return handler
+
+		priority = self._priority(method, handler_call_details.invocation_metadata)
+
+		token = self.limiter.try_acquire(PRIORITY_SHARES[priority])
+		if token is None:
+			REJECTED_COUNTER.labels(grpc_method=method, priority=priority).inc()
+			return wrap_handler(handler, lambda behavior, streaming: _reject)
+
+		return wrap_handler(handler, lambda behavior, streaming: self._limited(behavior, streaming, token))
+
+	def _limited(self, behavior, streaming, token):
+		# Release the slot when the call finishes; a call whose client has
+		# already gone away (cancelled / deadline exceeded) counts as a drop
+		if streaming:
+			def wrapper(request, context):
+				try:
+					yield from behavior(request, context)
+				finally:
+					self.limiter.release(token, dropped=not context.is_active())
+		else:
+			def wrapper(request, context):
+				try:
+					return behavior(request, context)
+				finally:
+					self.limiter.release(token, dropped=not context.is_active())
+		return wrapper
+
+def _reject(request, context):
+	context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Server overloaded, retry later")
+
+def limiter_from_env(handler_threads):
+	# Build a ConcurrencyLimiter from LIMITER_* environment variables. The
+	# limit never exceeds handler_threads: admitted calls then never wait for
+	# a thread, and a rejected call (whose _reject handler also runs on the
+	# executor) only competes for the REJECT_THREADS the server adds on top.
+	max_limit = min(int(os.getenv("LIMITER_MAX", "200")), handler_threads)
+	min_limit = min(int(os.getenv("LIMITER_MIN", "2")), max_limit)
+	if os.getenv("LIMITER_ALGORITHM", "gradient") == "aimd":
+		algorithm = AIMDLimit(min_limit, max_limit, timeout=float(os.getenv("LIMITER_AIMD_TIMEOUT", "0.5")))
+	else:
+		algorithm = GradientLimit(min_limit, max_limit)
+	return ConcurrencyLimiter(algorithm, initial_limit=min(int(os.getenv("LIMITER_INITIAL", "20")), max_limit))
@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import time
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+# Convert an items collection from MONGO_ID_MODE=field ({_id: ObjectId, id, name, ...})
+# to MONGO_ID_MODE=_id ({_id: id, name, ...}), or back with --reverse. Only the
+# id moves; every other field (name, version, ...) is copied as it is.
+#	python3 migrate_ids.py [--reverse] [--dry-run] [--drop-backup]
+# The copy runs on the server ($out aggregation), is checked against the source
+# count and then swapped in with renameCollection. The old collection is kept
+# as items_backup_<timestamp> unless --drop-backup is given. Stop writers (the
+# gRPC service) while it runs and restart them with the new MONGO_ID_MODE.
+
+def to_id_pipeline(target):
+	return [
+		{"$set": {"_id": "$id"}},
+		{"$project": {"id": 0}},
+		{"$out": target},
+	]
+
+def to_field_pipeline(target):
+	# $out gives the documents new ObjectId _ids
+	return [
+		{"$set": {"id": "$_id"}},
+		{"$project": {"_id": 0}},
+		{"$out": target},
+	]
+
+def migrate(db, name, reverse, dry_run, drop_backup):
+	source = db[name]
+	count = source.count_documents({})
+	mode = "field" if reverse else "_id"
+	print(f"[MIGRATE] {db.name}.{name}: {count} documents -> MONGO_ID_MODE={mode}")
+
+	if reverse:
+		if source.count_documents({"id": {"$exists": True}}, limit=1):
+			sys.exit("[MIGRATE] Collection already has an id field; nothing to do")
+	else:
+		if source.count_documents({"id": {"$exists": False}}, limit=1):
+			sys.exit("[MIGRATE] Some documents have no id field; already migrated or mixed collection")
+		duplicates = list(source.aggregate([
+			{"$group": {"_id": "$id", "n": {"$sum": 1}}},
+			{"$match": {"n": {"$gt": 1}}},
+			{"$limit": 5},
+		], allowDiskUse=True))
+		if duplicates:
+			sys.exit(f"[MIGRATE] Duplicate ids, cannot use them as _id: {[d['_id'] for d in duplicates]}")
+
+	if dry_run:
+		print("[MIGRATE] Dry run, no changes made")
+		return
+
+	stamp = time.strftime("%Y%m%d%H%M%S")
+	target = f"{name}_migrating_{stamp}"
+	backup = f"{name}_backup_{stamp}"
+
+	start = time.perf_counter()
+	pipeline = to_field_pipeline(target) if reverse else to_id_pipeline(target)
+	source.aggregate(pipeline, allowDiskUse=True)
+
+	copied = db[target].count_documents({})
+	if copied != count:
+		db.drop_collection(target)
+		sys.exit(f"[MIGRATE] Copied {copied} of {count} documents (writers still running?); aborted")
+
+	if reverse:
+		db[target].create_index("id", unique=True)
+		db[target].create_index([("id", 1), ("name", 1)], name="id_name_covering")
+
+	source.rename(backup)
+	db[target].rename(name)
+	print(f"[MIGRATE] Done in {time.perf_counter() - start:.1f}s; previous collection kept as {backup}")
+
+	if drop_backup:
+		db.drop_collection(backup)
+		print(f"[MIGRATE] Dropped {backup}")
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Switch the items collection between MONGO_ID_MODE layouts")
+	parser.add_argument("--reverse", action="store_true", help="convert _id mode back to field mode")
+	parser.add_argument("--dry-run", action="store_true", help="only run the checks")
+	parser.add_argument("--drop-backup", action="store_true", help="drop the old collection afterwards")
+	parser.add_argument("--collection", default="items")
+	args = parser.parse_args()
+
+	mongo_host = os.environ.get("MONGO_HOST", "localhost")
+	mongo_port = os.environ.get("MONGO_PORT", "27017")
+	client = MongoClient(f"mongodb://{mongo_host}:{mongo_port}", serverSelectionTimeoutMS=5000)
+	db = client[os.getenv("MONGO_DB", "itemsdb")]
+
+	try:
+		migrate(db, args.collection, args.reverse, args.dry_run, args.drop_backup)
+	except OperationFailure as e:
+		sys.exit(f"[MIGRATE] Failed: {e}")
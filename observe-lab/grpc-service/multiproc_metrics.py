@@ -0,0 +1,88 @@
+import glob
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+
+# Prometheus metrics across worker processes.
+#
+# With PROMETHEUS_MULTIPROC_DIR set (before prometheus_client is first
+# imported), every process writes its metric values to its own mmap'd files
+# in that directory instead of keeping them in memory. A scrape aggregates
+# all files with MultiProcessCollector: counters and histograms are summed,
+# gauges follow their multiprocess_mode. Without the variable everything
+# stays in the default in-process registry.
+#
+# The directory must be emptied before workers start (reset_dir) and each
+# dead worker reported (worker_exited) so its live gauges are dropped.
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+if MULTIPROC_DIR:
+	os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+def enabled():
+	return bool(MULTIPROC_DIR)
+
+def scrape_registry():
+	# Registry to expose: aggregated over all workers in multiprocess mode
+	if not MULTIPROC_DIR:
+		return REGISTRY
+	registry = CollectorRegistry()
+	multiprocess.MultiProcessCollector(registry)
+	return registry
+
+def render():
+	return generate_latest(scrape_registry())
+
+def serve_http(port, routes=None):
+	# Standalone /metrics HTTP server (gRPC service), in a daemon thread.
+	# routes maps extra paths to handler(method, params) returning
+	# (status, content type, body) for small admin endpoints.
+	registry = scrape_registry()
+	routes = routes or {}
+
+	class Handler(BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			self.dispatch("GET")
+
+		def do_POST(self):
+			self.dispatch("POST")
+
+		def dispatch(self, method):
+			url = urllib.parse.urlsplit(self.path)
+			if url.path in ("/", "/metrics") and method == "GET":
+				self.reply(200, generate_latest(registry), CONTENT_TYPE_LATEST)
+			elif url.path in routes:
+				params = dict(urllib.parse.parse_qsl(url.query))
+				status, content_type, body = routes[url.path](method, params)
+				self.reply(status, body.encode(), content_type)
+			else:
+				self.reply(404, b"Not found\n", "text/plain")
+
+		def reply(self, status, body, content_type):
+			self.send_response(status)
+			self.send_header("Content-Type", content_type)
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer(("", port), Handler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+def reset_dir():
+	# Remove files left by a previous run; call before starting workers
+	if MULTIPROC_DIR:
+		for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+			os.remove(path)
+
+def worker_exited(pid):
+	if MULTIPROC_DIR:
+		multiprocess.mark_process_dead(pid)
@@ -1,15 +1,32 @@
 import grpc
 from concurrent import futures
+import contextlib
+import threading
 import time
 import myitems_pb2
 import myitems_pb2_grpc
 from grpc_reflection.v1alpha import reflection
+import pymongo
+from opentelemetry import trace
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout, NetworkTimeout, WTimeoutError
 import os
 
 # Prometheus imports
-from prometheus_client import start_http_server
+import multiproc_metrics	# before any metric is created (see PROMETHEUS_MULTIPROC_DIR)
+import profiling
+import stages
+from saturation import HandlerMetricsInterceptor, InstrumentedExecutor
 from py_grpc_prometheus.prometheus_server_interceptor import PromServerInterceptor
+from limiter import REJECT_THREADS, ConcurrencyLimitInterceptor, limiter_from_env
+from writebatch import batcher_from_env, parse_write_concerns
+from itemcache import MISSING, cache_from_env
+from versions import CursorTooOld, clock_from_env
+from tracing import tracing_from_env, tracing_interceptor
+from events import WATCH_BUFFER, WATCH_HEARTBEAT, WATCH_MAX_STREAMS, WATCH_RESETS, EventLog, ResumeTooOld, WatchSlots
+
+# Tracing (see tracing.py), set up before the MongoClient so its commands are traced
+tracer_provider = tracing_from_env("grpc-service")
 
 # MongoDB connection
 mongo_host = os.environ.get("MONGO_HOST", "localhost")
@@ -20,10 +37,142 @@ client = MongoClient(f"mongodb://{mongo_host}:{mongo_port}", serverSelectionTime
 db = client[mongo_db]
 collection = db["items"]
 
-# Create unique index on id field
-collection.create_index("id", unique=True)
-
-print(f"[gRPC] connected to MongoDB at {mongo_host}:{mongo_port}")
+# Document layout, MONGO_ID_MODE:
+#	field	{_id: ObjectId, id: <item id>, name}; unique index on id plus an
+#		(id, name) index so GetItemById/ListAllItems are answered from the
+#		index alone (covered queries, no document fetch)
+#	_id	{_id: <item id>, name}; lookups use the built-in _id index and no
+#		secondary index has to be maintained on writes
+# Existing collections are converted with migrate_ids.py.
+MONGO_ID_MODE = os.getenv("MONGO_ID_MODE", "field")
+if MONGO_ID_MODE not in ("field", "_id"):
+	raise ValueError(f"Unknown MONGO_ID_MODE: {MONGO_ID_MODE}")
+
+ID_FIELD = "_id" if MONGO_ID_MODE == "_id" else "id"
+COVERING_INDEX = [("id", pymongo.ASCENDING), ("name", pymongo.ASCENDING)]
+
+if MONGO_ID_MODE == "_id":
+	ITEM_PROJECTION = {"_id": 1, "name": 1}
+else:
+	# Excluding _id is what lets the (id, name) index cover the query
+	ITEM_PROJECTION = {"_id": 0, "id": 1, "name": 1}
+	collection.create_index("id", unique=True)
+	collection.create_index(COVERING_INDEX, name="id_name_covering")
+
+def item_key(item_id):
+	# Filter matching a single item
+	return {ID_FIELD: item_id}
+
+def item_doc(item_id, name):
+	return {ID_FIELD: item_id, "name": name}
+
+def find_items():
+	# Cursor over all items. In field mode the covering index is hinted so the
+	# scan reads index keys only; in _id mode a plain collection scan is
+	# cheaper than walking the _id index and fetching every document.
+	if MONGO_ID_MODE == "_id":
+		return collection.find({}, ITEM_PROJECTION)
+	return collection.find({}, ITEM_PROJECTION).hint(COVERING_INDEX)
+
+print(f"[gRPC] connected to MongoDB at {mongo_host}:{mongo_port} (MONGO_ID_MODE={MONGO_ID_MODE})")
+
+# Per-method write concern, e.g. WRITE_CONCERN="CreateItem=w=1;j=false" for
+# high-throughput ingest (see writebatch.parse_write_concerns)
+WRITE_CONCERNS = parse_write_concerns(os.getenv("WRITE_CONCERN", ""))
+WRITE_COLLECTIONS = {
+	method: collection.with_options(write_concern=WRITE_CONCERNS[method]) if method in WRITE_CONCERNS else collection
+	for method in ("CreateItem", "UpdateItem", "DeleteItem")
+}
+
+# Opt-in write pipeline (WRITE_BATCHING=1): concurrent writes are grouped into
+# bulk_write calls flushed on size or time. None means one Mongo call per RPC.
+batcher = batcher_from_env(WRITE_COLLECTIONS, ID_FIELD)
+
+# Opt-in GetItemById read cache (ITEM_CACHE_SIZE > 0). Writes from this replica
+# evict entries directly; writes from other replicas arrive via a change stream,
+# or by polling on a standalone mongod (see itemcache.py).
+cache = cache_from_env(collection, ID_FIELD)
+
+# Item versions and delete tombstones for ListItemsSince (see versions.py)
+clock = clock_from_env(db, collection, ID_FIELD)
+
+# Change events for WatchItems, recorded by the write paths below
+events = EventLog(WATCH_BUFFER)
+watch_slots = WatchSlots(WATCH_MAX_STREAMS)
+
+# Writes to one item run one at a time in this process, from version
+# allocation to publishing the event, so the item's versions, its stored
+# document and its WatchItems events all follow the same order. Striped:
+# ids share ITEM_LOCK_STRIPES locks.
+ITEM_LOCK_STRIPES = 1024
+item_locks = [threading.Lock() for _ in range(ITEM_LOCK_STRIPES)]
+
+def item_lock(item_id):
+	return item_locks[hash(item_id) % ITEM_LOCK_STRIPES]
+
+# Executor threads for regular (limited) calls; also the concurrency limiter's
+# upper bound
+HANDLER_THREADS = int(os.getenv("GRPC_HANDLER_THREADS", "10"))
+
+# Don't start Mongo work with less than this much of the caller's deadline left
+MIN_MONGO_BUDGET = float(os.getenv("MIN_MONGO_BUDGET", "0.005"))
+
+# Without a deadline gRPC reports about 9.2e18 s remaining, which pymongo can
+# neither send as maxTimeMS nor use as a socket timeout (OverflowError); any
+# budget above this counts as no deadline
+MAX_MONGO_BUDGET = float(os.getenv("MAX_MONGO_BUDGET", "86400"))
+
+class DeadlineExhausted(Exception):
+	# The caller's deadline is (nearly) gone before the Mongo call starts
+	pass
+
+# Raised by pymongo when the budget given via pymongo.timeout() / maxTimeMS runs
+# out, and by batched writes whose deadline passes while queued
+DEADLINE_ERRORS = (DeadlineExhausted, ExecutionTimeout, NetworkTimeout, WTimeoutError,
+		futures.TimeoutError, TimeoutError)
+
+def remaining_budget(context):
+	# Seconds left until the caller's gRPC deadline, or None without a deadline
+	remaining = context.time_remaining()
+	if remaining is None or remaining > MAX_MONGO_BUDGET:
+		return None
+	if remaining < MIN_MONGO_BUDGET:
+		raise DeadlineExhausted()
+	return remaining
+
+def mongo_budget(context):
+	# Apply the caller's remaining deadline to the Mongo calls in the block;
+	# pymongo.timeout() sends it to the server as maxTimeMS so Mongo stops
+	# working on requests whose callers already gave up
+	remaining = remaining_budget(context)
+	if remaining is None:
+		return contextlib.nullcontext()
+	return pymongo.timeout(remaining)
+
+# Responses are not compressed. gRPC compresses each message on its own and an
+# ItemResponse is 11-19 bytes, so gzip only adds its header and trailer
+# (compression_benchmark.py: 38760 vs 18760 bytes for 1000 streamed items).
+# Large lists are compressed once, as a whole, by the REST gateway.
+
+def batched_write(context, submit, *args):
+	# Queue a write with the batcher and wait for its outcome until the
+	# caller's deadline. A write still queued then is withdrawn, so it is never
+	# applied after the caller was told it timed out; one already being flushed
+	# is waited for, so cache, tombstones and events follow what Mongo did.
+	remaining = remaining_budget(context)
+	deadline = None if remaining is None else time.monotonic() + remaining
+	future = submit(*args, deadline=deadline)
+	try:
+		return future.result(timeout=remaining)
+	except futures.TimeoutError:
+		if future.cancel():
+			raise
+		return future.result()
+
+def deadline_exceeded(context, rpc):
+	print(f"[gRPC] {rpc}: deadline exceeded, abandoning request")
+	context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+	context.set_details("Deadline exceeded")
 
 class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 
@@ -33,12 +182,34 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 			print(f"[gRPC] Creating item: id={request.id}, name={request.name}")
 
 			# Insert into MongoDB
-			doc = {"id": request.id, "name": request.name}
-			collection.insert_one(doc)
-
+			with item_lock(request.id):
+				with clock.next_version("CreateItem") as version:
+					doc = item_doc(request.id, request.name)
+					doc["version"] = version
+					if batcher:
+						with stages.timed("CreateItem", "batch_wait"):
+							batched_write(context, batcher.create, "CreateItem", request.id, doc)
+					else:
+						with mongo_budget(context), stages.timed("CreateItem", "mongo"):
+							WRITE_COLLECTIONS["CreateItem"].insert_one(doc)
+				if cache is not None:
+					cache.invalidate(request.id)
+
+				events.publish("CREATED", request.id, request.name)
 			print(f"[gRPC] Item created successfully: {request.id}")
 			return myitems_pb2.ItemResponse(id=request.id, name=request.name, success=True)
 
+		except DuplicateKeyError:
+			# Not a transient failure, so the gateway must not retry it
+			print(f"[gRPC] Item already exists: {request.id}")
+			context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+			context.set_details("Item already exists")
+			return myitems_pb2.ItemResponse(success=False)
+
+		except DEADLINE_ERRORS:
+			deadline_exceeded(context, "CreateItem")
+			return myitems_pb2.ItemResponse(success=False)
+
 		except Exception as e:
 			print(f"[gRPC] Error creating item: {e}")
 			context.set_code(grpc.StatusCode.INTERNAL)
@@ -52,17 +223,34 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 
 			# Update MongoDB
 			#doc = {{"id": request.id}, {"$set": {"name": request.name}}}
-			result = collection.update_one({"id": request.id}, {"$set": {"name": request.name}})
-
-			if result.matched_count == 0:
-				print(f"[gRPC] Item not found: {request.id}")
-				context.set_code(grpc.StatusCode.NOT_FOUND)
-				context.set_details("Item not found")
-				return myitems_pb2.ItemResponse(success=False)
-
+			with item_lock(request.id):
+				with clock.next_version("UpdateItem") as version:
+					update = {"$set": {"name": request.name, "version": version}}
+					if batcher:
+						with stages.timed("UpdateItem", "batch_wait"):
+							updated = batched_write(context, batcher.update, "UpdateItem", request.id, item_key(request.id), update)
+					else:
+						with mongo_budget(context), stages.timed("UpdateItem", "mongo"):
+							result = WRITE_COLLECTIONS["UpdateItem"].update_one(item_key(request.id), update)
+						# Unacknowledged (w=0) writes report no counts
+						updated = not result.acknowledged or result.matched_count > 0
+				if cache is not None:
+					cache.invalidate(request.id)
+
+				if not updated:
+					print(f"[gRPC] Item not found: {request.id}")
+					context.set_code(grpc.StatusCode.NOT_FOUND)
+					context.set_details("Item not found")
+					return myitems_pb2.ItemResponse(success=False)
+
+				events.publish("UPDATED", request.id, request.name)
 			print(f"[gRPC] Item updated successfully: {request.id}")
 			return myitems_pb2.ItemResponse(id=request.id, name=request.name, success=True)
 
+		except DEADLINE_ERRORS:
+			deadline_exceeded(context, "UpdateItem")
+			return myitems_pb2.ItemResponse(success=False)
+
 		except Exception as e:
 			print(f"[gRPC] Error updating item: {e}")
 			context.set_code(grpc.StatusCode.INTERNAL)
@@ -76,17 +264,34 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 
 			# Update MongoDB
 			#doc = {"id": request.id, "name": request.name}
-			result = collection.delete_one({"id": request.id})
-
-			if result.deleted_count == 0:
-				print(f"[gRPC]  Item not found: {request.id}")
-				context.set_code(grpc.StatusCode.NOT_FOUND)
-				context.set_details("Item not found")
-				return myitems_pb2.ItemResponse(success=False)
-
+			with item_lock(request.id):
+				with clock.next_version("DeleteItem") as version:
+					if batcher:
+						with stages.timed("DeleteItem", "batch_wait"):
+							deleted = batched_write(context, batcher.delete, "DeleteItem", request.id, item_key(request.id))
+					else:
+						with mongo_budget(context), stages.timed("DeleteItem", "mongo"):
+							result = WRITE_COLLECTIONS["DeleteItem"].delete_one(item_key(request.id))
+						deleted = not result.acknowledged or result.deleted_count > 0
+					if deleted:
+						clock.record_delete(request.id, version)
+				if cache is not None:
+					cache.invalidate(request.id)
+
+				if not deleted:
+					print(f"[gRPC]  Item not found: {request.id}")
+					context.set_code(grpc.StatusCode.NOT_FOUND)
+					context.set_details("Item not found")
+					return myitems_pb2.ItemResponse(success=False)
+
+				events.publish("DELETED", request.id)
 			print(f"[gRPC] Item deleted successfully: {request.id}")
 			return myitems_pb2.ItemResponse(id=request.id, name=request.name, success=True)
 
+		except DEADLINE_ERRORS:
+			deadline_exceeded(context, "DeleteItem")
+			return myitems_pb2.ItemResponse(success=False)
+
 		except Exception as e:
 			print(f"[gRPC] Error deleting item: {e}")
 			context.set_code(grpc.StatusCode.INTERNAL)
@@ -96,13 +301,32 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 	def GetItemById(self, request, context):
 		# Get item by ID from MongoDB
 		try:
-			doc = collection.find_one({"id": request.id})
+			if cache is not None:
+				hit, name, token = cache.lookup(request.id)
+				trace.get_current_span().set_attribute("item.cache_hit", hit)
+				if hit:
+					if name is MISSING:
+						context.set_code(grpc.StatusCode.NOT_FOUND)
+						context.set_details("Item not found")
+						return myitems_pb2.ItemResponse()
+					return myitems_pb2.ItemResponse(id=request.id, name=name, success=True)
+
+			with mongo_budget(context), stages.timed("GetItemById", "mongo"):
+				doc = collection.find_one(item_key(request.id), ITEM_PROJECTION)
+			if cache is not None:
+				cache.put(request.id, doc["name"] if doc else None, token)
 			if not doc:
 				context.set_code(grpc.StatusCode.NOT_FOUND)
 				context.set_details("Item not found")
 				return myitems_pb2.ItemResponse()
 
-			return myitems_pb2.ItemResponse(id=doc["id"], name=doc["name"], success=True)
+			with stages.timed("GetItemById", "convert"):
+				response = myitems_pb2.ItemResponse(id=doc[ID_FIELD], name=doc["name"], success=True)
+			return response
+
+		except DEADLINE_ERRORS:
+			deadline_exceeded(context, "GetItemById")
+			return myitems_pb2.ItemResponse(success=False)
 
 		except Exception as e:
 			print(f"[gRPC] Error: {e}")
@@ -112,24 +336,136 @@ class ItemServiceServicer(myitems_pb2_grpc.ItemServiceServicer):
 
 	def ListAllItems(self, request, context):
 		# Server-streaming RPC: List all items
+		# The cursor gets the remaining deadline as maxTimeMS, and the stream
+		# stops as soon as the caller is gone
+		try:
+			cursor = find_items()
+			remaining = remaining_budget(context)
+			if remaining is not None:
+				cursor = cursor.max_time_ms(int(remaining * 1000))
+
+			# Per item: fetch (mongo), build (convert), hand to gRPC (send)
+			timer = stages.StreamTimer("ListAllItems")
+			for doc in cursor:
+				timer.lap("mongo")
+				if not context.is_active():
+					cursor.close()
+					return
+				response = myitems_pb2.ItemResponse(id=doc[ID_FIELD], name=doc["name"], success=True)
+				timer.lap("convert")
+				yield response
+				timer.lap("send")
+
+		except DEADLINE_ERRORS:
+			deadline_exceeded(context, "ListAllItems")
+
+		except Exception as e:
+			print(f"[gRPC] Error: {e}")
+			context.set_code(grpc.StatusCode.INTERNAL)
+			context.set_details(str(e))
+
+	def ListItemsSince(self, request, context):
+		# Server-streaming RPC: items created/updated and deleted after the
+		# given version, in version order. Version 0 returns every item. The
+		# client keeps the highest version it received as its next cursor.
 		try:
-			for doc in collection.find():
-				yield myitems_pb2.ItemResponse(id=doc["id"], name=doc["name"], success=True)
+			remaining = remaining_budget(context)
+			max_time_ms = None if remaining is None else int(remaining * 1000)
+
+			timer = stages.StreamTimer("ListItemsSince")
+			for version, item_id, name, deleted in clock.changes_since(request.version, max_time_ms):
+				timer.lap("mongo")
+				if not context.is_active():
+					return
+				delta = myitems_pb2.ItemDelta(id=item_id, name=name, version=version, deleted=deleted)
+				timer.lap("convert")
+				yield delta
+				timer.lap("send")
+
+		except CursorTooOld:
+			context.abort(grpc.StatusCode.OUT_OF_RANGE, "Version is older than the tombstone horizon, resync from version 0")
+
+		except DEADLINE_ERRORS:
+			deadline_exceeded(context, "ListItemsSince")
 
 		except Exception as e:
 			print(f"[gRPC] Error: {e}")
 			context.set_code(grpc.StatusCode.INTERNAL)
 			context.set_details(str(e))
 
-def serve():
-	# Start Prometheus HTTP server on port 9103
-	start_http_server(9103)
-	print("[gRPC] Prometheus metrics server started on port 9103")
+	def WatchItems(self, request, context):
+		# Server-streaming RPC: stream item changes as they happen. Clients
+		# reconnect with the resume_token of the last event they saw; if those
+		# events are gone (restart, other replica, buffer overrun) a RESET event
+		# tells them to resync with ListAllItems first.
+		if not watch_slots.acquire():
+			context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many watchers")
+		try:
+			try:
+				after = events.position(request.resume_token)
+			except ResumeTooOld:
+				WATCH_RESETS.inc()
+				after = events.sequence
+				yield myitems_pb2.ItemEvent(type=myitems_pb2.ItemEvent.RESET, resume_token=events.token(after))
+
+			while context.is_active():
+				try:
+					batch = events.wait(after, WATCH_HEARTBEAT)
+				except ResumeTooOld:
+					# This watcher fell more than WATCH_BUFFER events behind
+					WATCH_RESETS.inc()
+					after = events.sequence
+					yield myitems_pb2.ItemEvent(type=myitems_pb2.ItemEvent.RESET, resume_token=events.token(after))
+					continue
+
+				if not batch:
+					yield myitems_pb2.ItemEvent(type=myitems_pb2.ItemEvent.HEARTBEAT, resume_token=events.token(after))
+					continue
+
+				for sequence, event_type, item_id, name in batch:
+					yield myitems_pb2.ItemEvent(
+						type=myitems_pb2.ItemEvent.Type.Value(event_type),
+						id=item_id,
+						name=name,
+						resume_token=events.token(sequence),
+					)
+				after = batch[-1][0]
+		finally:
+			watch_slots.release()
+
+def serve(metrics_port=9103):
+	# Start Prometheus HTTP server on port 9103. Worker processes started by
+	# supervisor.py pass None: the supervisor serves the aggregated metrics.
+	if metrics_port:
+		multiproc_metrics.serve_http(metrics_port, routes={**stages.ROUTES, "/debug/profile": profiling.handle_profile})
+		print(f"[gRPC] Prometheus metrics server started on port {metrics_port}")
 
 	# Created Prometheus interceptor
 	prom_interceptor = PromServerInterceptor()
 
-	server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), interceptors=[prom_interceptor])
+	# Adaptive concurrency limiter: sheds excess calls with RESOURCE_EXHAUSTED
+	# instead of letting them queue behind the worker pool (see limiter.py).
+	# Its limit is capped at HANDLER_THREADS. Placed after the Prometheus
+	# interceptor so rejections show up in grpc_server_handled_total.
+	limit_interceptor = ConcurrencyLimitInterceptor(limiter_from_env(HANDLER_THREADS))
+
+	# In-flight RPCs and handler latency per method for admitted calls (see
+	# saturation.py), then per-stage timing of request decode / response
+	# encode (see stages.py)
+	interceptors = [prom_interceptor, limit_interceptor, HandlerMetricsInterceptor(), stages.StageInterceptor()]
+	# Tracing goes first, so its span also covers calls shed by the limiter
+	if tracer_provider is not None:
+		interceptors.insert(0, tracing_interceptor(tracer_provider))
+
+	# Each open WatchItems stream holds a worker thread, so they get their own
+	# share on top of the HANDLER_THREADS workers for regular calls, plus
+	# REJECT_THREADS for answering shed calls; the executor exports its queue
+	# depth and busy threads
+	# SO_REUSEPORT lets several worker processes bind 50051; the kernel
+	# spreads incoming connections across them
+	server = grpc.server(InstrumentedExecutor(max_workers=HANDLER_THREADS + WATCH_MAX_STREAMS + REJECT_THREADS),
+			interceptors=interceptors,
+			options=[("grpc.so_reuseport", 1)])
 
 	# Add servicer to server
 	myitems_pb2_grpc.add_ItemServiceServicer_to_server(ItemServiceServicer(), server)
@@ -142,7 +478,7 @@ def serve():
 	# Start server
 	server.add_insecure_port('[::]:50051')
 	server.start()
-	print("[gRPC] Server started on port 50051")
+	print(f"[gRPC] Server started on port 50051 (pid {os.getpid()})")
 	server.wait_for_termination()
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+import contextlib
+import ctypes
+import json
+import os
+import time
+
+import grpc
+from prometheus_client import Histogram
+
+# Per-stage latency inside RPCs, for finding where the milliseconds of a call
+# go without attaching a profiler. Stages:
+#	decode		request message deserialization
+#	version		version number allocation (a Mongo round trip per write)
+#	mongo		Mongo round trip; per item for streams (time to fetch the
+#			next document, so mostly zero with spikes at each batch)
+#	batch_wait	time a batched write waits for its flush (WRITE_BATCHING)
+#	convert		Mongo result -> protobuf message
+#	encode		response message serialization
+#	send		streams only, per item: from yielding a message until the
+#			next one is requested (encode + write + flow control)
+#
+# Off unless STAGE_TIMING=1; switched at runtime with
+#	curl -X POST 'localhost:9103/stage-timing?enabled=1'
+# Under supervisor.py the switch is shared memory, so it applies to every worker.
+
+STAGE_LATENCY = Histogram(
+	'grpc_server_stage_seconds',
+	'Time spent in one stage of an RPC (STAGE_TIMING)',
+	['grpc_method', 'stage'],
+	buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+)
+
+# Anything with a .value; supervisor.py replaces it with a multiprocessing.Value
+switch = ctypes.c_bool(os.getenv("STAGE_TIMING", "0") == "1")
+
+_children = {}
+
+def enabled():
+	return switch.value
+
+def observe(method, stage, seconds):
+	child = _children.get((method, stage))
+	if child is None:
+		child = _children[(method, stage)] = STAGE_LATENCY.labels(method, stage)
+	child.observe(seconds)
+
+@contextlib.contextmanager
+def timed(method, stage):
+	if not switch.value:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		observe(method, stage, time.perf_counter() - start)
+
+class StreamTimer:
+	# Lap timer for a streaming handler's loop: lap(stage) records the time
+	# since the previous lap (or since creation) under stage. The switch is
+	# read once, so a stream is timed either completely or not at all.
+
+	def __init__(self, method):
+		self.method = method
+		self.active = switch.value
+		self.mark = time.perf_counter() if self.active else 0
+
+	def lap(self, stage):
+		if self.active:
+			now = time.perf_counter()
+			observe(self.method, stage, now - self.mark)
+			self.mark = now
+
+def _timed_codec(method, stage, codec):
+	if codec is None:
+		return None
+
+	def wrapper(data):
+		if not switch.value:
+			return codec(data)
+		start = time.perf_counter()
+		result = codec(data)
+		observe(method, stage, time.perf_counter() - start)
+		return result
+	return wrapper
+
+class StageInterceptor(grpc.ServerInterceptor):
+	# Times request deserialization (decode) and response serialization
+	# (encode) by wrapping the handler's codecs
+
+	def intercept_service(self, continuation, handler_call_details):
+		handler = continuation(handler_call_details)
+		if handler is None:
+			return None
+		method = handler_call_details.method.rsplit("/", 1)[-1]
+		return handler._replace(
+			request_deserializer=_timed_codec(method, "decode", handler.request_deserializer),
+			response_serializer=_timed_codec(method, "encode", handler.response_serializer),
+		)
+
+def handle_toggle(method, params):
+	# /stage-timing on the metrics port: GET shows the switch,
+	# POST ?enabled=1|0 sets it
+	if method == "POST":
+		value = params.get("enabled", "")
+		if value not in ("0", "1", "true", "false"):
+			return 400, "application/json", json.dumps({"error": "enabled must be 1 or 0"})
+		switch.value = value in ("1", "true")
+	return 200, "application/json", json.dumps({"enabled": bool(switch.value)})
+
+ROUTES = {"/stage-timing": handle_toggle}
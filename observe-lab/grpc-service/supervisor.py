@@ -0,0 +1,133 @@
+import ctypes
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+import multiproc_metrics
+import profiling
+import stages
+
+# Runs the gRPC service as GRPC_WORKERS processes sharing port 50051
+# (SO_REUSEPORT), so requests are not limited to one interpreter's GIL.
+#	python3 -u supervisor.py
+# Workers are started with "spawn": each imports server.py afresh and opens its
+# own MongoClient and gRPC server (neither is fork-safe). This process serves
+# /metrics on 9103, aggregated over all workers from PROMETHEUS_MULTIPROC_DIR,
+# the /stage-timing switch (shared memory read by every worker) and
+# /debug/profile (relayed to every worker over a pipe), and replaces workers
+# that die. With GRPC_WORKERS=1 it just clears PROMETHEUS_MULTIPROC_DIR and
+# runs the server.
+#
+# Per-process state stays per process: concurrency limits, read caches and the
+# WatchItems event log each cover only the calls that reached that worker.
+# WatchItems is therefore only correct with a single worker, which is why
+# GRPC_WORKERS defaults to 1: a watcher sees only the writes its own worker
+# handled, and resume tokens from another worker's EventLog always RESET. It
+# needs events shared through Mongo (a change stream) before GRPC_WORKERS > 1
+# is safe. (ListItemsSince is fine: its watermark is kept in the database, see
+# versions.py.)
+
+METRICS_PORT = 9103
+
+def worker_main(stage_switch, profile_conn):
+	stages.switch = stage_switch
+	profiling.serve_pipe(profile_conn)
+	import server
+	server.serve(metrics_port=None)
+
+def supervise(count):
+	if not multiproc_metrics.enabled():
+		sys.exit("[SUPERVISOR] GRPC_WORKERS > 1 needs PROMETHEUS_MULTIPROC_DIR, or each scrape sees one worker")
+
+	print(f"[SUPERVISOR] {count} workers: WatchItems only sees each worker's own writes")
+	multiproc_metrics.reset_dir()
+	context = multiprocessing.get_context("spawn")
+	stages.switch = context.Value(ctypes.c_bool, stages.switch.value, lock=False)
+
+	workers = {}
+	pipes = {}	# pid -> supervisor end of the worker's profiling pipe
+	profile_lock = threading.Lock()
+
+	def profile_workers(method, params):
+		# /debug/profile: profile all workers at once; each worker's stacks
+		# are rooted at a "worker-<pid>" frame
+		try:
+			options = profiling.options(params)
+		except ValueError as e:
+			return 400, "text/plain", f"{e}\n"
+		if not profile_lock.acquire(blocking=False):
+			return 409, "text/plain", "A profile is already running\n"
+		try:
+			sent = []
+			for pid, conn in list(pipes.items()):
+				try:
+					while conn.poll():	# late answer to an earlier request
+						conn.recv()
+					conn.send(options)
+					sent.append((pid, conn))
+				except (EOFError, OSError):
+					pass
+			lines = []
+			for pid, conn in sent:
+				try:
+					if not conn.poll(options["seconds"] + 30):
+						continue
+					status, body = conn.recv()
+				except (EOFError, OSError):
+					continue
+				if status == 200:
+					lines.extend(f"worker-{pid};{line}\n" for line in body.splitlines())
+			return 200, "text/plain", "".join(lines)
+		finally:
+			profile_lock.release()
+
+	multiproc_metrics.serve_http(METRICS_PORT, routes={**stages.ROUTES, "/debug/profile": profile_workers})
+	print(f"[SUPERVISOR] Prometheus metrics server started on port {METRICS_PORT}")
+
+	def start_worker():
+		conn, worker_conn = context.Pipe()
+		process = context.Process(target=worker_main, args=(stages.switch, worker_conn))
+		process.start()
+		worker_conn.close()
+		workers[process.pid] = process
+		pipes[process.pid] = conn
+		print(f"[SUPERVISOR] Started worker {process.pid}")
+
+	def shutdown(signum, frame):
+		for process in workers.values():
+			process.terminate()
+		for process in workers.values():
+			process.join(10)
+		sys.exit(0)
+
+	signal.signal(signal.SIGTERM, shutdown)
+	signal.signal(signal.SIGINT, shutdown)
+
+	for _ in range(count):
+		start_worker()
+
+	while True:
+		time.sleep(1)
+		for pid, process in list(workers.items()):
+			if not process.is_alive():
+				print(f"[SUPERVISOR] Worker {pid} exited with {process.exitcode}, restarting")
+				del workers[pid]
+				pipes.pop(pid).close()
+				multiproc_metrics.worker_exited(pid)
+				start_worker()
+
+if __name__ == '__main__':
+	count = int(os.getenv("GRPC_WORKERS", "1"))
+	if count > 1:
+		supervise(count)
+	else:
+		# PROMETHEUS_MULTIPROC_DIR survives a container restart and the server
+		# is PID 1 again, so it would reopen the previous run's files and carry
+		# on from their counters and gauges. Cleared before server.py creates
+		# any metric.
+		multiproc_metrics.reset_dir()
+		import server
+		server.serve()
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+import unittest
+from concurrent import futures
+
+import grpc
+
+import myitems_pb2
+from limiter import REJECT_THREADS, ConcurrencyLimitInterceptor, limiter_from_env
+
+# Load shedding through a real gRPC server: python3 -m pytest test_limiter.py
+
+HANDLER_THREADS = 2
+CALL_SECONDS = 0.5
+
+class RejectWhileBusyTest(unittest.TestCase):
+	# With every handler thread busy, a shed call must be answered right
+	# away, not after a handler thread frees up
+
+	def setUp(self):
+		self.started = threading.Semaphore(0)
+		def slow(request, context):
+			self.started.release()
+			time.sleep(CALL_SECONDS)
+			return myitems_pb2.ItemResponse(id=request.id, success=True)
+		handler = grpc.method_handlers_generic_handler("myitems.ItemService", {
+			"GetItemById": grpc.unary_unary_rpc_method_handler(slow,
+					request_deserializer=myitems_pb2.ItemRequest.FromString,
+					response_serializer=myitems_pb2.ItemResponse.SerializeToString),
+		})
+
+		# Sized as in server.serve(), with the default LIMITER_* settings,
+		# whose initial limit is well above HANDLER_THREADS
+		for name in ("LIMITER_MIN", "LIMITER_MAX", "LIMITER_INITIAL"):
+			self.assertNotIn(name, os.environ)
+		interceptor = ConcurrencyLimitInterceptor(limiter_from_env(HANDLER_THREADS))
+		self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=HANDLER_THREADS + REJECT_THREADS),
+				handlers=[handler], interceptors=[interceptor])
+		port = self.server.add_insecure_port("127.0.0.1:0")
+		self.server.start()
+		self.channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+		self.call = self.channel.unary_unary("/myitems.ItemService/GetItemById",
+				request_serializer=myitems_pb2.ItemRequest.SerializeToString,
+				response_deserializer=myitems_pb2.ItemResponse.FromString)
+
+	def tearDown(self):
+		self.channel.close()
+		self.server.stop(None)
+
+	def test_rejection_returns_while_pool_is_busy(self):
+		admitted = [self.call.future(myitems_pb2.ItemRequest(id=n), timeout=5) for n in range(HANDLER_THREADS)]
+		for _ in admitted:
+			self.assertTrue(self.started.acquire(timeout=5))
+
+		began = time.monotonic()
+		with self.assertRaises(grpc.RpcError) as raised:
+			self.call(myitems_pb2.ItemRequest(id=99), timeout=5)
+		elapsed = time.monotonic() - began
+		self.assertEqual(raised.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+		self.assertLess(elapsed, CALL_SECONDS / 2)
+
+		for future in admitted:
+			self.assertTrue(future.result().success)
+
+if __name__ == '__main__':
+	unittest.main()
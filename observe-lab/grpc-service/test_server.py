@@ -0,0 +1,89 @@
+import os
+import unittest
+from concurrent import futures
+
+import grpc
+import pymongo
+
+# Servicer tests, run in-process: python3 -m pytest test_server.py
+# Against a live mongod when MONGO_HOST is set, otherwise against mongomock.
+os.environ.setdefault("MONGO_DB", "itemsdb_test")
+os.environ.setdefault("TRACING", "0")
+os.environ.setdefault("WATCH_HEARTBEAT", "0.2")
+
+if "MONGO_HOST" not in os.environ:
+	try:
+		import mongomock
+	except ImportError:
+		raise unittest.SkipTest("set MONGO_HOST or install mongomock")
+	pymongo.MongoClient = mongomock.MongoClient
+
+import myitems_pb2
+import myitems_pb2_grpc
+import server
+
+def setUpModule():
+	global grpc_server, channel, stub
+	grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+	myitems_pb2_grpc.add_ItemServiceServicer_to_server(server.ItemServiceServicer(), grpc_server)
+	port = grpc_server.add_insecure_port("127.0.0.1:0")
+	grpc_server.start()
+	channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+	stub = myitems_pb2_grpc.ItemServiceStub(channel)
+
+def tearDownModule():
+	channel.close()
+	grpc_server.stop(None)
+
+def reset_db():
+	server.collection.delete_many({})
+	server.clock.tombstones.delete_many({})
+	server.clock.counters.delete_many({})
+
+class FakeContext:
+
+	def __init__(self, remaining):
+		self.remaining = remaining
+
+	def time_remaining(self):
+		return self.remaining
+
+class NoDeadlineTest(unittest.TestCase):
+	# Calls made without a deadline (client.py, grpcurl): gRPC reports about
+	# 9.2e18 s remaining, which must not reach pymongo as a budget
+
+	def setUp(self):
+		reset_db()
+
+	def test_budget_without_deadline(self):
+		self.assertIsNone(server.remaining_budget(FakeContext(None)))
+		self.assertIsNone(server.remaining_budget(FakeContext(9.2e18)))
+		self.assertEqual(server.remaining_budget(FakeContext(0.5)), 0.5)
+		with self.assertRaises(server.DeadlineExhausted):
+			server.remaining_budget(FakeContext(0.001))
+
+	def test_unary_calls(self):
+		created = stub.CreateItem(myitems_pb2.ItemRequest(id=1, name="one"))
+		self.assertTrue(created.success)
+		self.assertEqual(stub.GetItemById(myitems_pb2.ItemRequest(id=1)).name, "one")
+		self.assertEqual(stub.UpdateItem(myitems_pb2.ItemRequest(id=1, name="uno")).name, "uno")
+		self.assertTrue(stub.DeleteItem(myitems_pb2.ItemRequest(id=1)).success)
+
+	def test_streams(self):
+		stub.CreateItem(myitems_pb2.ItemRequest(id=1, name="one"))
+		stub.CreateItem(myitems_pb2.ItemRequest(id=2, name="two"))
+		items = list(stub.ListAllItems(myitems_pb2.Empty()))
+		self.assertEqual(sorted((item.id, item.name) for item in items), [(1, "one"), (2, "two")])
+		deltas = list(stub.ListItemsSince(myitems_pb2.SinceRequest(version=0)))
+		self.assertEqual([delta.id for delta in deltas], [1, 2])
+
+	def test_watch(self):
+		stream = stub.WatchItems(myitems_pb2.WatchRequest())
+		try:
+			event = next(stream)
+			self.assertIn(event.type, (myitems_pb2.ItemEvent.HEARTBEAT, myitems_pb2.ItemEvent.CREATED))
+		finally:
+			stream.cancel()
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+import unittest
+
+try:
+	import mongomock
+except ImportError:
+	raise unittest.SkipTest("install mongomock")
+
+from versions import VersionClock
+
+# VersionClock against mongomock:
+#	python3 -m pytest test_versions.py
+
+class SlowCounters:
+	# Counter collection whose find_one_and_update reply takes a while to
+	# arrive, as it does over a network: the version is allocated in Mongo
+	# well before the writer learns it. Calls are applied one at a time, as
+	# mongod does for one document; mongomock breaks when a nested field
+	# changes while another thread copies the document.
+
+	lock = threading.Lock()
+
+	def __init__(self, collection):
+		self.collection = collection
+
+	def find_one_and_update(self, *args, **kwargs):
+		with self.lock:
+			result = self.collection.find_one_and_update(*args, **kwargs)
+		time.sleep(random.random() * 0.002)
+		return result
+
+	def find_one(self, *args, **kwargs):
+		with self.lock:
+			return self.collection.find_one(*args, **kwargs)
+
+	def update_one(self, *args, **kwargs):
+		with self.lock:
+			return self.collection.update_one(*args, **kwargs)
+
+	def __getattr__(self, name):
+		return getattr(self.collection, name)
+
+class ConcurrentWritersTest(unittest.TestCase):
+	# A reader following changes_since() with the ListItemsSince cursor rule
+	# (next cursor = highest version received) must see every write, however
+	# the writers' allocations and commits interleave
+
+	WRITERS = 8
+	WRITES_PER_WRITER = 40
+
+	def setUp(self):
+		db = mongomock.MongoClient().db
+		self.collection = db["items"]
+		# Two replicas (or supervisor workers) writing to the same database;
+		# the reader only talks to the first
+		self.clock = VersionClock(db, self.collection, "id")
+		self.other = VersionClock(db, self.collection, "id")
+		for clock in (self.clock, self.other):
+			clock.counters = SlowCounters(clock.counters)
+
+	def writer(self, first_id):
+		clock = self.clock if first_id // self.WRITES_PER_WRITER % 2 else self.other
+		for item_id in range(first_id, first_id + self.WRITES_PER_WRITER):
+			with clock.next_version("CreateItem") as version:
+				# Commit out of allocation order
+				time.sleep(random.random() * 0.002)
+				self.collection.insert_one({"id": item_id, "name": f"Item{item_id}", "version": version})
+
+	def test_reader_sees_every_write(self):
+		writers = [threading.Thread(target=self.writer, args=(n * self.WRITES_PER_WRITER,)) for n in range(self.WRITERS)]
+		for thread in writers:
+			thread.start()
+
+		seen = set()
+		cursor = 0
+		def read():
+			nonlocal cursor
+			for version, item_id, name, deleted in self.clock.changes_since(cursor):
+				self.assertGreater(version, cursor)
+				seen.add(item_id)
+				cursor = max(cursor, version)
+
+		while any(thread.is_alive() for thread in writers):
+			read()
+		read()
+
+		self.assertEqual(len(seen), self.WRITERS * self.WRITES_PER_WRITER)
+
+	def test_watermark_without_writes_in_flight(self):
+		with self.clock.next_version("CreateItem") as version:
+			self.assertEqual(self.clock.watermark(), version - 1)
+			self.collection.insert_one({"id": 1, "name": "one", "version": version})
+		self.assertEqual(self.clock.watermark(), version)
+		self.assertEqual([change[0] for change in self.clock.changes_since(0)], [version])
+
+	def test_watermark_held_by_other_replica(self):
+		with self.other.next_version("CreateItem") as pending:
+			with self.clock.next_version("CreateItem") as version:
+				self.collection.insert_one({"id": 2, "name": "two", "version": version})
+			self.assertLess(self.clock.watermark(), pending)
+			self.collection.insert_one({"id": 1, "name": "one", "version": pending})
+		self.assertEqual(self.clock.watermark(), version)
+
+	def test_expired_lease(self):
+		# A writer that died mid-write holds the watermark back only until
+		# its lease runs out
+		self.clock.lease = 0.05
+		writes = self.other.next_version("CreateItem")
+		pending = writes.__enter__()
+		self.assertEqual(self.clock.watermark(), pending - 1)
+		time.sleep(0.1)
+		self.assertEqual(self.clock.watermark(), pending)
+		self.assertEqual(self.clock.release_expired(), 1)
+		self.assertEqual(self.clock.counters.find_one({"_id": "items"})["pending"], {})
+
+if __name__ == '__main__':
+	unittest.main()
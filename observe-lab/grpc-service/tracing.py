@@ -0,0 +1,73 @@
+import os
+
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.grpc import filters, server_interceptor
+from opentelemetry.instrumentation.pymongo import PymongoInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased
+from opentelemetry.trace import SpanKind
+
+# Tracing for the gRPC service.
+#
+# Server spans come from the OpenTelemetry server interceptor, which continues
+# the trace context the gateway sends in the call metadata; every pymongo
+# command becomes a child span of whatever span is current. Calls with a
+# parent follow the parent's sampling decision. Calls without one (client.py,
+# grpcurl) are sampled at TRACE_SAMPLE_RATIO.
+#
+# Mongo commands issued outside a call (cache polling, tombstone pruning) are
+# not traced, so they don't start a trace each. Batched writes are flushed in a
+# span linked to the calls it serves and are traced when one of those is.
+
+# WatchItems streams stay open for the client's lifetime; a span covering
+# hours of a stream says nothing about any one request
+UNTRACED_METHODS = ("WatchItems",)
+
+class RequestRootSampler(Sampler):
+	# Root sampler: gRPC server spans are sampled at ratio, background spans
+	# only when linked to a sampled span, anything else is dropped
+
+	def __init__(self, ratio):
+		self.ratio = TraceIdRatioBased(ratio)
+
+	def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+		if kind == SpanKind.SERVER:
+			return self.ratio.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+		if any(link.context.trace_flags.sampled for link in links or ()):
+			return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes)
+		return SamplingResult(Decision.DROP)
+
+	def get_description(self):
+		return f"RequestRoot{{{self.ratio.get_description()}}}"
+
+def tracing_from_env(service_name):
+	# Install the tracer provider and pymongo instrumentation; call before any
+	# MongoClient is created (listeners only apply to later clients). Returns
+	# None when TRACING=0.
+	if os.getenv("TRACING", "1") == "0":
+		return None
+	provider = TracerProvider(
+		resource=Resource.create({"service.name": service_name}),
+		sampler=ParentBased(root=RequestRootSampler(float(os.getenv("TRACE_SAMPLE_RATIO", "1.0")))),
+	)
+	exporter = OTLPSpanExporter(
+		endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://otel-collector:4317"),
+		insecure=True,
+	)
+	provider.add_span_processor(BatchSpanProcessor(
+		exporter,
+		max_queue_size=int(os.getenv("TRACE_MAX_QUEUE_SIZE", "2048")),
+		max_export_batch_size=int(os.getenv("TRACE_MAX_EXPORT_BATCH_SIZE", "512")),
+		schedule_delay_millis=float(os.getenv("TRACE_SCHEDULE_DELAY_MS", "5000")),
+	))
+	trace.set_tracer_provider(provider)
+	PymongoInstrumentor().instrument(tracer_provider=provider)
+	return provider
+
+def tracing_interceptor(provider):
+	# Server interceptor creating a span per call (except UNTRACED_METHODS)
+	traced = filters.negate(filters.any_of(*(filters.method_name(method) for method in UNTRACED_METHODS)))
+	return server_interceptor(tracer_provider=provider, filter_=traced)
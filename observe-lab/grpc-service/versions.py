@@ -0,0 +1,182 @@
+import contextlib
+import datetime
+import heapq
+import os
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+import stages
+
+# Item versions for ListItemsSince.
+#
+# Every write takes the next number from a counter document
+# ({_id: "items", seq, horizon} in the "counters" collection) and stores it in
+# the item's "version" field. Deletes leave a tombstone {id, version,
+# deleted_at} in "item_tombstones", so "what changed since version N" is two
+# range scans on indexed version fields, proportional to the number of changes.
+#
+# Tombstones older than TOMBSTONE_RETENTION seconds are pruned; the highest
+# pruned version becomes the horizon. A client whose cursor is below the
+# horizon may have missed deletes and has to resync from version 0.
+#
+# A version is allocated before its write lands, so a reader must not move a
+# client's cursor past a version that is still being written. Each allocation
+# also registers itself in the counter document, in the same update, as
+# pending.<token>: {floor, at}, where floor is a counter value the allocating
+# process had already seen (so floor < version); the entry is removed when
+# the write finishes. watermark() reads that one document: every version up
+# to min(seq, floors) is written or will never be, whichever replica or worker
+# allocated it. Entries older than the lease (VERSION_LEASE, far above any
+# write's deadline) belong to a writer that died mid-write; they are ignored
+# and removed by the prune loop.
+
+COUNTER_ID = "items"
+
+class CursorTooOld(Exception):
+	# since is below the tombstone horizon
+	pass
+
+class VersionClock:
+
+	def __init__(self, db, collection, id_field, retention=7 * 86400, prune_interval=3600, lease=300):
+		self.counters = db["counters"]
+		self.tombstones = db["item_tombstones"]
+		self.collection = collection
+		self.id_field = id_field
+		self.retention = retention
+		self.prune_interval = prune_interval
+		self.lease = lease
+
+		# Highest counter value this process has seen (floor for new pending
+		# entries); the lock is never held across a Mongo call
+		self.known_seq = 0
+		self.lock = threading.Lock()
+
+		self.collection.create_index([("version", ASCENDING)])
+		self.tombstones.create_index([("version", ASCENDING)])
+		# Items written before versioning existed count as version 0
+		self.collection.update_many({"version": {"$exists": False}}, {"$set": {"version": 0}})
+
+	def start(self):
+		threading.Thread(target=self._prune_loop, daemon=True).start()
+
+	def _saw(self, seq):
+		with self.lock:
+			self.known_seq = max(self.known_seq, seq)
+
+	@contextlib.contextmanager
+	def next_version(self, method):
+		# Allocate a version for one write (timed as method's "version"
+		# stage); the block performs the write. Allocation and the pending
+		# entry are one atomic update, so no reader sees the version
+		# allocated but unregistered.
+		token = str(ObjectId())
+		with self.lock:
+			floor = self.known_seq
+		with stages.timed(method, "version"):
+			counter = self.counters.find_one_and_update(
+				{"_id": COUNTER_ID},
+				{"$inc": {"seq": 1}, "$set": {f"pending.{token}": {"floor": floor, "at": time.time()}}},
+				projection={"seq": 1},
+				upsert=True,
+				return_document=ReturnDocument.AFTER,
+			)
+		version = counter["seq"]
+		self._saw(version)
+		try:
+			yield version
+		finally:
+			try:
+				self.counters.update_one({"_id": COUNTER_ID}, {"$unset": {f"pending.{token}": ""}})
+			except PyMongoError as e:
+				# Holds the watermark back until the lease runs out
+				print(f"[gRPC] Could not release version {version}: {e}")
+
+	def watermark(self):
+		# Highest version that is safe to hand out as a cursor: changes above
+		# the lowest pending floor are held back until that write finishes,
+		# otherwise a client could move its cursor past it and never see it
+		counter = self.counters.find_one({"_id": COUNTER_ID}, {"seq": 1, "pending": 1}) or {}
+		seq = counter.get("seq", 0)
+		self._saw(seq)
+		live = time.time() - self.lease
+		floors = [entry["floor"] for entry in counter.get("pending", {}).values() if entry["at"] > live]
+		return min([seq] + floors)
+
+	def record_delete(self, item_id, version):
+		self.tombstones.insert_one({"id": item_id, "version": version,
+				"deleted_at": datetime.datetime.now(datetime.timezone.utc)})
+
+	def horizon(self):
+		counter = self.counters.find_one({"_id": COUNTER_ID}, {"horizon": 1})
+		return (counter or {}).get("horizon", 0)
+
+	def changes_since(self, since, max_time_ms=None):
+		# (version, id, name, deleted) tuples with version > since, in
+		# version order. since <= 0 returns every item and no tombstones.
+		# max_time_ms bounds both cursors on the server.
+		if 0 < since < self.horizon():
+			raise CursorTooOld(since)
+
+		bounds = {"$gt": since} if since > 0 else {"$gte": 0}
+		bounds["$lte"] = self.watermark()
+
+		items = self.collection.find({"version": bounds}, {self.id_field: 1, "name": 1, "version": 1}).sort("version", ASCENDING)
+		deletes = self.tombstones.find({"version": bounds}, {"id": 1, "version": 1}).sort("version", ASCENDING)
+		if max_time_ms is not None:
+			items = items.max_time_ms(max_time_ms)
+			deletes = deletes.max_time_ms(max_time_ms)
+
+		items = ((doc["version"], doc[self.id_field], doc["name"], False) for doc in items)
+		if since <= 0:
+			return items
+		deletes = ((doc["version"], doc["id"], "", True) for doc in deletes)
+		return heapq.merge(items, deletes)
+
+	def release_expired(self):
+		# Drop pending entries older than the lease (their writer is gone)
+		counter = self.counters.find_one({"_id": COUNTER_ID}, {"pending": 1}) or {}
+		live = time.time() - self.lease
+		expired = {f"pending.{token}": "" for token, entry in counter.get("pending", {}).items() if entry["at"] <= live}
+		if expired:
+			self.counters.update_one({"_id": COUNTER_ID}, {"$unset": expired})
+		return len(expired)
+
+	def prune(self):
+		cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.retention)
+		newest = self.tombstones.find_one({"deleted_at": {"$lt": cutoff}}, {"version": 1}, sort=[("version", -1)])
+		if newest is None:
+			return 0
+		# Raise the horizon first: a client must never be told a range is
+		# complete while its tombstones are being removed
+		self.counters.update_one({"_id": COUNTER_ID}, {"$max": {"horizon": newest["version"]}}, upsert=True)
+		return self.tombstones.delete_many({"version": {"$lte": newest["version"]}}).deleted_count
+
+	def _prune_loop(self):
+		while True:
+			time.sleep(self.prune_interval)
+			try:
+				pruned = self.prune()
+				if pruned:
+					print(f"[gRPC] Pruned {pruned} tombstones")
+				expired = self.release_expired()
+				if expired:
+					print(f"[gRPC] Released {expired} expired version leases")
+			except Exception as e:
+				print(f"[gRPC] Tombstone pruning failed: {e}")
+
+def clock_from_env(db, collection, id_field):
+	clock = VersionClock(
+		db,
+		collection,
+		id_field,
+		retention=float(os.getenv("TOMBSTONE_RETENTION", str(7 * 86400))),
+		prune_interval=float(os.getenv("TOMBSTONE_PRUNE_INTERVAL", "3600")),
+		lease=float(os.getenv("VERSION_LEASE", "300")),
+	)
+	clock.start()
+	return clock
@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from opentelemetry import trace
+from prometheus_client import Counter, Histogram
+from pymongo import DeleteOne, InsertOne, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# Prometheus metrics (served by start_http_server on port 9103)
+BATCH_SIZE = Histogram(
+	'mongo_write_batch_size',
+	'Write operations sent in one bulk_write call',
+	['write_concern'],
+	buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+FLUSH_LATENCY = Histogram(
+	'mongo_write_flush_seconds',
+	'Duration of one batch flush (existence check + bulk_write)',
+	['write_concern'],
+	buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+)
+
+FLUSHES = Counter(
+	'mongo_write_flushes_total',
+	'Batch flushes, by what triggered them (size or time)',
+	['write_concern', 'trigger']
+)
+
+OPERATIONS = Counter(
+	'mongo_write_operations_total',
+	'Batched write operations, by outcome',
+	['grpc_method', 'outcome']
+)
+
+def parse_write_concerns(spec):
+	# "CreateItem=w=1;j=false,DeleteItem=w=majority" -> {method: WriteConcern}.
+	# Keys are w, j and wtimeout (milliseconds); unlisted methods use the
+	# collection's default write concern.
+	concerns = {}
+	for entry in spec.split(","):
+		if "=" not in entry:
+			continue
+		method, options = entry.split("=", 1)
+		kwargs = {}
+		for option in options.split(";"):
+			key, _, value = option.strip().partition("=")
+			if key == "w":
+				kwargs["w"] = int(value) if value.isdigit() else value
+			elif key == "j":
+				kwargs["j"] = value.lower() in ("1", "true", "yes")
+			elif key == "wtimeout":
+				kwargs["wtimeout"] = int(value)
+			else:
+				raise ValueError(f"Unknown write concern option {key!r} for {method}")
+		concerns[method.strip()] = WriteConcern(**kwargs)
+	return concerns
+
+def concern_label(write_concern):
+	if write_concern is None or not write_concern.document:
+		return "default"
+	return ",".join(f"{key}={value}" for key, value in sorted(write_concern.document.items()))
+
+# Flush spans (no-op unless tracing.tracing_from_env installed a provider)
+tracer = trace.get_tracer(__name__)
+
+class PendingWrite:
+	# One queued write. The future resolves to True (applied), False (item
+	# not found) or raises DuplicateKeyError / the bulk_write failure.
+	# Cancelling the future while the write is still queued withdraws it; once
+	# the flusher has taken it, cancel() returns False and it runs.
+
+	def __init__(self, method, kind, item_id, operation, deadline):
+		self.method = method
+		self.kind = kind	# "create", "update" or "delete"
+		self.item_id = item_id
+		self.operation = operation
+		self.deadline = deadline
+		self.future = Future()
+		# The submitting call's span, linked from the flush span
+		self.span_context = trace.get_current_span().get_span_context()
+
+	def finish(self, outcome, result=None, error=None):
+		OPERATIONS.labels(self.method, outcome).inc()
+		if error is not None:
+			self.future.set_exception(error)
+		else:
+			self.future.set_result(result)
+
+class WriteQueue:
+	# Writes sharing one write concern. A single flusher thread sends them as
+	# one bulk_write once max_batch writes are queued or the oldest one has
+	# waited max_delay seconds.
+	#
+	# bulk_write only reports aggregate counts, so before each flush the ids in
+	# the batch are looked up once and the batch is simulated in order: creates
+	# of existing ids fail with DuplicateKeyError, updates/deletes of missing
+	# ids resolve to False, and only the remaining writes are sent. This also
+	# gives sensible answers with unacknowledged (w=0) write concerns, where
+	# the server reports nothing back.
+
+	def __init__(self, collection, id_field, max_batch, max_delay):
+		self.collection = collection
+		self.id_field = id_field
+		self.max_batch = max_batch
+		self.max_delay = max_delay
+		self.label = concern_label(collection.write_concern)
+		self.acknowledged = collection.write_concern.acknowledged
+		self.pending = []
+		self.condition = threading.Condition()
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def submit(self, write):
+		with self.condition:
+			self.pending.append(write)
+			if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+				self.condition.notify()
+		return write.future
+
+	def _run(self):
+		while True:
+			with self.condition:
+				while not self.pending:
+					self.condition.wait()
+				flush_at = time.monotonic() + self.max_delay
+				while len(self.pending) < self.max_batch:
+					remaining = flush_at - time.monotonic()
+					if remaining <= 0:
+						break
+					self.condition.wait(remaining)
+				trigger = "size" if len(self.pending) >= self.max_batch else "time"
+				batch = self.pending[:self.max_batch]
+				del self.pending[:self.max_batch]
+
+			# From here on cancel() fails, so a caller that gave up either
+			# withdrew its write above or waits for this flush's outcome
+			taken = []
+			for write in batch:
+				if write.future.set_running_or_notify_cancel():
+					taken.append(write)
+				else:
+					OPERATIONS.labels(write.method, "cancelled").inc()
+			batch = taken
+			if not batch:
+				continue
+
+			FLUSHES.labels(self.label, trigger).inc()
+			start = time.perf_counter()
+			links = [trace.Link(write.span_context) for write in batch if write.span_context.is_valid]
+			try:
+				with tracer.start_as_current_span("mongo write batch", links=links,
+						attributes={"batch.size": len(batch), "write_concern": self.label}):
+					self._flush(batch)
+			except Exception as e:
+				for write in batch:
+					if not write.future.done():
+						write.finish("error", error=e)
+			FLUSH_LATENCY.labels(self.label).observe(time.perf_counter() - start)
+
+	def _flush(self, batch):
+		now = time.monotonic()
+		live = []
+		for write in batch:
+			if write.deadline is not None and write.deadline <= now:
+				# The caller has given up; don't spend a write on it
+				write.finish("expired", error=TimeoutError("Deadline expired while queued"))
+			else:
+				live.append(write)
+		if not live:
+			return
+
+		ids = list({write.item_id for write in live})
+		existing = {doc[self.id_field] for doc in
+				self.collection.find({self.id_field: {"$in": ids}}, {self.id_field: 1})}
+
+		sent = []
+		for write in live:
+			if write.kind == "create":
+				if write.item_id in existing:
+					write.finish("duplicate", error=DuplicateKeyError(f"Item {write.item_id} already exists"))
+					continue
+				existing.add(write.item_id)
+			elif write.item_id not in existing:
+				write.finish("not_found", result=False)
+				continue
+			elif write.kind == "delete":
+				existing.discard(write.item_id)
+			sent.append(write)
+
+		BATCH_SIZE.labels(self.label).observe(len(sent))
+		# Ordered, so writes to the same id apply in submission order. A failed
+		# write stops an ordered bulk_write; it is failed on its own and the
+		# rest of the batch is resent.
+		while sent:
+			try:
+				self.collection.bulk_write([write.operation for write in sent], ordered=True)
+			except BulkWriteError as e:
+				errors = e.details.get("writeErrors", [])
+				if not errors:
+					raise
+				index = errors[0]["index"]
+				for write in sent[:index]:
+					write.finish("applied", result=True)
+				failed = sent[index]
+				if errors[0].get("code") == 11000:
+					failed.finish("duplicate", error=DuplicateKeyError(errors[0].get("errmsg", "duplicate key")))
+				else:
+					failed.finish("error", error=e)
+				sent = sent[index + 1:]
+				continue
+			for write in sent:
+				write.finish("applied" if self.acknowledged else "unacknowledged", result=True)
+			break
+
+class WriteBatcher:
+	# Groups concurrent CreateItem/UpdateItem/DeleteItem calls into bulk_write
+	# calls, one WriteQueue per distinct write concern.
+
+	def __init__(self, collections, id_field, max_batch=100, max_delay=0.002):
+		# collections: {method: collection configured with that method's write concern}
+		self.methods = {}
+		queues = {}
+		for method, collection in collections.items():
+			key = concern_label(collection.write_concern)
+			if key not in queues:
+				queues[key] = WriteQueue(collection, id_field, max_batch, max_delay)
+			self.methods[method] = queues[key]
+
+	def submit(self, method, kind, item_id, operation, deadline=None):
+		# Queue a write; returns a concurrent.futures.Future (see PendingWrite)
+		return self.methods[method].submit(PendingWrite(method, kind, item_id, operation, deadline))
+
+	def create(self, method, item_id, doc, deadline=None):
+		return self.submit(method, "create", item_id, InsertOne(doc), deadline)
+
+	def update(self, method, item_id, key, update, deadline=None):
+		return self.submit(method, "update", item_id, UpdateOne(key, update), deadline)
+
+	def delete(self, method, item_id, key, deadline=None):
+		return self.submit(method, "delete", item_id, DeleteOne(key), deadline)
+
+def batcher_from_env(collections, id_field):
+	# WriteBatcher when WRITE_BATCHING=1, otherwise None (one Mongo call per RPC)
+	if os.getenv("WRITE_BATCHING", "0") != "1":
+		return None
+	return WriteBatcher(
+		collections,
+		id_field,
+		max_batch=int(os.getenv("WRITE_BATCH_MAX", "100")),
+		max_delay=float(os.getenv("WRITE_BATCH_DELAY_MS", "2")) / 1000,
+	)
@@ -1,47 +1,40 @@
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 import grpc
+import math
 import myitems_pb2
 import myitems_pb2_grpc
 import os
 import time
-from pybreaker import CircuitBreaker, CircuitBreakerError
+import multiproc_metrics	# before any metric is created (see PROMETHEUS_MULTIPROC_DIR)
+import profiling
+from breakers import CircuitOpenError, registry_from_env
+from compression import compress_response
+from fastjson import FastJSONProvider, item_list_response
+from retry import UNSTARTED_CODES, policy_from_env
 
 # Prometheus imports
-from prometheus_client import Counter, Histogram, generate_latest
+from prometheus_client import Counter, Gauge, Histogram
 
-from opentelemetry import trace
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.flask import FlaskInstrumentor
-from opentelemetry.instrumentation.requests import RequestsInstrumentor
-
-# Configure tracer provider and exporter
-resource = Resource.create({"service.name": "rest-service"})
-
-trace.set_tracer_provider(TracerProvider(resource=resource))
-trace_provider = trace.get_tracer_provider()
-
-otlp_exporter = OTLPSpanExporter(
-	endpoint="http://otel-collector:4317",
-	insecure=True,
-)
-
-span_processor = BatchSpanProcessor(otlp_exporter)
-trace_provider.add_span_processor(span_processor)
+from tracing import traced_channel, tracing_from_env
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
-# Instrument Flask + requests
-FlaskInstrumentor().instrument_app(app)
-RequestsInstrumentor().instrument()
+# Instrument Flask (sampling and export settings: see tracing.py)
+tracer_provider = tracing_from_env(app, "rest-service")
 
 # Prometheus metrics
+# Buckets follow the gateway's real range: most calls take 1-20 ms (one gRPC
+# round trip plus a Mongo query), route deadlines are 1 s (5 s for lists).
+# The default buckets start at 5 ms and put nearly every request in the first
+# bucket, which makes p95 meaningless; fine steps up to 25 ms, coarse above.
+LATENCY_BUCKETS = (.001, .002, .004, .006, .008, .01, .015, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
 REQUEST_LATENCY = Histogram(
 	'http_request_duration_seconds',
 	'HTTP request latency in seconds',
-	['method', 'endpoint']
+	['method', 'endpoint'],
+	buckets=LATENCY_BUCKETS
 )
 
 REQUEST_COUNTER = Counter(
@@ -50,234 +43,363 @@ REQUEST_COUNTER = Counter(
 	['method', 'endpoint', 'status']
 )
 
+# Saturation, summed over gunicorn workers
+INFLIGHT_GAUGE = Gauge(
+	'http_requests_inflight',
+	'HTTP requests being handled (event streams excluded)',
+	multiprocess_mode='livesum'
+)
+
+EVENT_STREAMS_GAUGE = Gauge(
+	'http_event_streams',
+	'Open /items/events streams, each holding a request thread',
+	multiprocess_mode='livesum'
+)
+
+SERVER_THREADS_GAUGE = Gauge(
+	'http_server_threads',
+	'Request threads available (set by gunicorn.conf.py)',
+	multiprocess_mode='livesum'
+)
+
+CHANNEL_STATE_GAUGE = Gauge(
+	'grpc_channel_state',
+	'Connectivity of the gateway gRPC channel: workers whose channel is in each state',
+	['state'],
+	multiprocess_mode='livesum'
+)
+
 # gRPC connection configuration
 GRPC_HOST = os.getenv("GRPC_HOST", "localhost")
 GRPC_PORT = os.getenv("GRPC_PORT", "50051")
 
 # Create gRPC channel and stub
-channel = grpc.insecure_channel(f"{GRPC_HOST}:{GRPC_PORT}")
+GRPC_TARGET = f"{GRPC_HOST}:{GRPC_PORT}"
+channel = grpc.insecure_channel(GRPC_TARGET)
+
+def record_channel_state(state):
+	for candidate in grpc.ChannelConnectivity:
+		CHANNEL_STATE_GAUGE.labels(candidate.name.lower()).set(1 if candidate is state else 0)
+
+channel.subscribe(record_channel_state)
+if tracer_provider is not None:
+	channel = traced_channel(channel, tracer_provider)
 stub = myitems_pb2_grpc.ItemServiceStub(channel)
 
-# Circuit Breaker configuration
-breaker = CircuitBreaker(
-	fail_max = 3,		# Open after 3 consecutive failures
-	reset_timeout = 30	# Half-open after 30 seconds
-)
+# Circuit breakers, one per (RPC method, backend target), opening on the
+# failure rate over a sliding window of recent calls (see breakers.py)
+breakers = registry_from_env()
+
+# Retry policy shared by all gRPC calls: jittered exponential backoff,
+# retry budget and status-code-aware classification (see retry.py)
+retry_policy = policy_from_env()
+
+# Map gRPC status codes (after retries) to HTTP responses
+GRPC_TO_HTTP = {
+	grpc.StatusCode.NOT_FOUND: (404, "Item not found"),
+	grpc.StatusCode.ALREADY_EXISTS: (409, "Item already exists"),
+	grpc.StatusCode.INVALID_ARGUMENT: (400, "Bad request"),
+	grpc.StatusCode.DEADLINE_EXCEEDED: (504, "Deadline exceeded"),
+}
+
+# Deadline propagation: callers may send their remaining time budget in
+# milliseconds; it becomes the gRPC deadline (and, in the gRPC service, the
+# Mongo maxTimeMS). Without the header each route uses its default timeout.
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+MAX_REQUEST_TIMEOUT = float(os.getenv("MAX_REQUEST_TIMEOUT", "30"))
 
 print(f"[REST] Connected to gRPC at {GRPC_HOST}:{GRPC_PORT}")
 
+# The endpoint label is the matched route template (/items/<int:item_id>), not
+# the raw path, so the number of series stays fixed however many ids are
+# requested. Unmatched paths share one label, unknown methods another.
+HTTP_METHODS = frozenset({"GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"})
+UNMATCHED_ENDPOINT = "unmatched"
+
+# Label children, bound once per (method, endpoint[, status]) instead of
+# resolving .labels() on every request
+_latency_children = {}
+_counter_children = {}
+
+def request_labels():
+	method = request.method if request.method in HTTP_METHODS else "OTHER"
+	rule = request.url_rule
+	return method, rule.rule if rule is not None else UNMATCHED_ENDPOINT
+
 # Prometheus hooks
 @app.before_request
 def start_timer():
 	# Start timing the request
-	g.start_time = time.time()
-	g.request_timer = REQUEST_LATENCY.labels(method=request.method, endpoint=request.path).time()
-	g.request_timer.__enter__()
+	g.start_time = time.perf_counter()
+	g.received_at = time.monotonic()
+	INFLIGHT_GAUGE.inc()
+	g.inflight = True
+
+@app.teardown_request
+def finish_inflight(exc):
+	# Runs even when the view raised; event streams end up here as soon as
+	# the response starts, they are counted by EVENT_STREAMS_GAUGE instead
+	if g.pop('inflight', False):
+		INFLIGHT_GAUGE.dec()
 
 @app.after_request
 def record_metrics(response):
 	# Record request metrics after response
-	if hasattr(g, 'request_timer'):
-		# Stop the timer
-		g.request_timer.__exit__(None, None, None)
+	labels = request_labels()
 
-	# Increment counter
-	REQUEST_COUNTER.labels(method=request.method, endpoint=request.path, status=response.status_code).inc()
+	latency = _latency_children.get(labels)
+	if latency is None:
+		latency = _latency_children.setdefault(labels, REQUEST_LATENCY.labels(*labels))
+	if 'start_time' in g:
+		latency.observe(time.perf_counter() - g.start_time)
+
+	key = labels + (response.status_code,)
+	counter = _counter_children.get(key)
+	if counter is None:
+		counter = _counter_children.setdefault(key, REQUEST_COUNTER.labels(*labels, str(response.status_code)))
+	counter.inc()
 
 	return response
 
+# Compress large responses (GET /items) when the client sends Accept-Encoding
+app.after_request(compress_response)
+
 # Metrics endpoint
 @app.route('/metrics', methods=['GET'])
 def metrics():
-	# Prometheus metrics endpoint
-	return generate_latest(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
-
-def grpc_create_item(item_data):
-	# Make gRPC call to create item with 1-second timeout
+	# Prometheus metrics endpoint; aggregated over all gunicorn workers in
+	# multiprocess mode
+	return multiproc_metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def request_deadline(default_timeout):
+	# Absolute deadline (time.monotonic()) for the current request: the
+	# caller's budget from the deadline header, else the route's default.
+	# Unparseable, negative or non-finite values ("nan", "inf") are ignored.
+	timeout = default_timeout
+	header = request.headers.get(DEADLINE_HEADER)
+	if header:
+		try:
+			budget = float(header) / 1000
+		except ValueError:
+			budget = None
+		if budget is not None and math.isfinite(budget) and budget >= 0:
+			timeout = min(budget, MAX_REQUEST_TIMEOUT)
+	return g.received_at + timeout
+
+def deadline_expired():
+	# Caller already gave up: don't start backend work
+	return jsonify({"error": "Deadline exceeded"}), 504
+
+def grpc_create_item(item_data, timeout=1):
+	# Make gRPC call to create item
 	request = myitems_pb2.ItemRequest(id=item_data["id"], name=item_data["name"])
-	return stub.CreateItem(request, timeout=1)
+	return stub.CreateItem(request, timeout=timeout)
 
-def grpc_update_item(item_data):
-	# Make gRPC call to update item with 1-second timeout
+def grpc_update_item(item_data, timeout=1):
+	# Make gRPC call to update item
 	request = myitems_pb2.ItemRequest(id=item_data["id"], name=item_data["name"])
-	return stub.UpdateItem(request, timeout=1)
+	return stub.UpdateItem(request, timeout=timeout)
 
-def grpc_delete_item(item_data):
-	# Make gRPC call to delete item with 1-second timeout
+def grpc_delete_item(item_data, timeout=1):
+	# Make gRPC call to delete item
 	request = myitems_pb2.ItemRequest(id=item_data["id"])
-	return stub.DeleteItem(request, timeout=1)
-
-@app.route('/items', methods=['POST'])
-def create_item():
-	# Create item with retry logic and circuit breaker
-	# - 3 attempts with exponential backoff (0ms, 100ms, 200ms)
-	# - Circuit breaker opens after 3 consecutive failures
+	return stub.DeleteItem(request, timeout=timeout)
+
+def circuit_open():
+	# Circuit is open - fail fast
+	print(f"[REST] Circuit breaker is OPEN - failing fast")
+	return jsonify({"error": "Service unavailable"}), 503
+
+def write_with_retry(method, grpc_call, item_data, action, retryable_codes=None):
+	# Run a write RPC through its circuit breaker with retries
+	# - Transient codes (UNAVAILABLE, DEADLINE_EXCEEDED, ...) are retried with
+	#   jittered exponential backoff while the retry budget allows; writes that
+	#   are not idempotent pass retryable_codes=UNSTARTED_CODES
+	# - Non-retryable codes (NOT_FOUND, ALREADY_EXISTS, ...) fail immediately
 	# - Returns 503 when circuit is open
+	# - Every attempt gets the time left until the request deadline
+	deadline = request_deadline(1)
+	if deadline <= time.monotonic():
+		return deadline_expired()
 
-	item_data = request.get_json()
-
-	if not item_data or 'id' not in item_data or 'name' not in item_data:
-		return jsonify({"error": "Bad request"}), 400
-
-	# Retry configuration
-	max_attempts = 3
-	delays = [0, 0.1, 0.2]	# 0ms, 100ms, 200ms
-
-	last_error = None
+	try:
+		breaker = breakers.get(method, GRPC_TARGET)
+		response = retry_policy.call(breaker.call, grpc_call, item_data, deadline=deadline,
+			retryable_codes=retryable_codes)
 
-	for attempt in range(max_attempts):
-		try:
-			print(f"[REST] Attempt {attempt + 1}/{max_attempts}")
+	except CircuitOpenError:
+		return circuit_open()
 
-			# Call gRPC through circuit breaker
-			response = breaker.call(grpc_create_item, item_data)
+	except grpc.RpcError as e:
+		if e.code() in GRPC_TO_HTTP:
+			status, message = GRPC_TO_HTTP[e.code()]
+			return jsonify({"error": message}), status
 
-			print(f"[REST] Item created successfully: {response.id}")
-			return jsonify({"message": "Item created", "id": response.id, "name": response.name}), 201
+		print(f"[REST] Backend failure: {e.code()}")
+		return jsonify({"error": "Backend failure", "details": str(e)}), 500
 
-		except CircuitBreakerError:
-			# Circuit is open - fail fast
-			print(f"[REST] Circuit breaker is OPEN - failing fast")
-			return jsonify({"error": "Service unavailable"}), 503
+	print(f"[REST] Item {action} successfully: {response.id}")
+	return jsonify({"message": f"Item {action}", "id": response.id, "name": response.name}), 201
 
-		except grpc.RpcError as e:
-			last_error = e
-			print(f"[REST] gRPC Error on attempt {attempt + 1}: {e.code()}")
+@app.route('/items', methods=['POST'])
+def create_item():
+	# Create item with retry logic and circuit breaker
+	item_data = request.get_json()
 
-			# Don't retry on last attempt
-			if attempt < max_attempts - 1:
-				delay = delays[attempt + 1]
-				print(f"[REST] Retrying in {delay}s...")
-				time.sleep(delay)
+	if not item_data or 'id' not in item_data or 'name' not in item_data:
+		return jsonify({"error": "Bad request"}), 400
 
-	# All retries exhausted
-	print(f"[REST] All retries exhausted. Returning error.")
-	return jsonify({"error": "Backend failure", "details": str(last_error)}), 500
+	return write_with_retry("CreateItem", grpc_create_item, item_data, "created", UNSTARTED_CODES)
 
 @app.route('/items/<int:item_id>', methods=['GET'])
 def get_item(item_id):
-	# Get item by ID (no retry/circuit breaker for reads
+	# Get item by ID through its circuit breaker; idempotent, so transient
+	# failures are retried and optionally hedged, see RETRY_HEDGE_DELAY_MS
+	deadline = request_deadline(1)
+	if deadline <= time.monotonic():
+		return deadline_expired()
+
 	try:
-		request = myitems_pb2.ItemRequest(id=item_id)
-		response = stub.GetItemById(request, timeout=1)
+		item_request = myitems_pb2.ItemRequest(id=item_id)
+		breaker = breakers.get("GetItemById", GRPC_TARGET)
+		response = breaker.call(retry_policy.hedged_call, stub.GetItemById, item_request, deadline=deadline)
 
 		return jsonify({"id": response.id, "name": response.name}), 200
 
+	except CircuitOpenError:
+		return circuit_open()
+
 	except grpc.RpcError as e:
-		if e.code() == grpc.StatusCode.NOT_FOUND:
-			return jsonify({"error": "Item not found"}), 404
+		if e.code() in GRPC_TO_HTTP:
+			status, message = GRPC_TO_HTTP[e.code()]
+			return jsonify({"error": message}), status
 		return jsonify({"error": str(e)}), 500
 
 @app.route('/items', methods=['GET'])
 def list_items():
-	# List all items
-	try:
-		items = []
-		for item in stub.ListAllItems(myitems_pb2.Empty(), timeout=5):
-			items.append({"id": item.id, "name": item.name})
+	# List all items, or with ?since=<version> only what changed after it
+	deadline = request_deadline(5)
+	if deadline <= time.monotonic():
+		return deadline_expired()
 
-		return jsonify(items), 200
+	if "since" in request.args:
+		return list_items_since(deadline)
 
-	except grpc.RpcError as e:
-		return jsonify({"error": str(e)}), 500
+	def fetch_all():
+		return list(stub.ListAllItems(myitems_pb2.Empty(), timeout=deadline - time.monotonic()))
 
-@app.route('/items/<int:item_id>', methods=['PUT'])
-def update_item(item_id):
-		# Update specific item with retry logic and circuit breaker
-		# - 3 attempts with exponential backoff (0ms, 100ms, 200ms)
-		# - Circuit breaker opens after 3 consecutive failures
-		# - Returns 503 when circuit is open
+	try:
+		items = breakers.get("ListAllItems", GRPC_TARGET).call(fetch_all)
 
-		item_data = request.get_json()
+		return item_list_response(items), 200
 
-		if not item_data or 'id' not in item_data or 'name' not in item_data or item_data['id'] != item_id:
-			return jsonify({"error": "Bad request"}), 400
+	except CircuitOpenError:
+		return circuit_open()
 
-		# Retry configuration
-		max_attempts = 3
-		delays = [0, 0.1, 0.2]
+	except grpc.RpcError as e:
+		if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+			return deadline_expired()
+		return jsonify({"error": str(e)}), 500
 
-		last_error = None
+def list_items_since(deadline):
+	# Delta sync: {"version": v, "items": [...], "deleted": [...]}. Clients
+	# apply "deleted" then "items" and pass "version" as the next ?since=.
+	# since=0 is a full sync that also returns the starting version; 410 means
+	# the cursor is too old (deletes were pruned) and a full sync is needed.
+	try:
+		since = int(request.args["since"])
+	except ValueError:
+		return jsonify({"error": "Bad request"}), 400
 
-		for attempt in range(max_attempts):
-			try:
-				print(f"[REST] Attempt {attempt + 1}/{max_attempts}")
+	def fetch_changes():
+		since_request = myitems_pb2.SinceRequest(version=since)
+		return list(stub.ListItemsSince(since_request, timeout=deadline - time.monotonic()))
 
-				# Call gRPC through circuit breaker
-				response = breaker.call(grpc_update_item, item_data)
+	try:
+		deltas = breakers.get("ListItemsSince", GRPC_TARGET).call(fetch_changes)
+	except CircuitOpenError:
+		return circuit_open()
+	except grpc.RpcError as e:
+		if e.code() == grpc.StatusCode.OUT_OF_RANGE:
+			return jsonify({"error": "Version too old, resync with since=0"}), 410
+		if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+			return deadline_expired()
+		return jsonify({"error": str(e)}), 500
 
-				print(f"[REST] Item updated successfully: {response.id}")
-				return jsonify({"message": "Item updated", "id": response.id, "name": response.name}), 201
+	items = []
+	deleted = []
+	for delta in deltas:
+		if delta.deleted:
+			deleted.append({"id": delta.id, "version": delta.version})
+		else:
+			items.append({"id": delta.id, "name": delta.name, "version": delta.version})
+	version = max(since, deltas[-1].version) if deltas else since
+	return jsonify({"version": version, "items": items, "deleted": deleted}), 200
+
+@app.route('/items/events', methods=['GET'])
+def watch_items():
+	# Server-Sent Events feed of item changes, relayed from the WatchItems RPC.
+	# Each event's id is the resume token: browsers resend it as Last-Event-ID
+	# when they reconnect (other clients can pass ?since=<token>), so only
+	# missed changes are delivered. A "reset" event means the missed changes
+	# are gone and the client should reload GET /items.
+	resume_token = request.headers.get("Last-Event-ID") or request.args.get("since", "")
+
+	def stream():
+		call = stub.WatchItems(myitems_pb2.WatchRequest(resume_token=resume_token))
+		EVENT_STREAMS_GAUGE.inc()
+		try:
+			for event in call:
+				if event.type == myitems_pb2.ItemEvent.HEARTBEAT:
+					# Comment line: keeps proxies from timing out the idle
+					# connection and lets the server notice clients that left
+					yield ": heartbeat\n\n"
+					continue
+				event_type = myitems_pb2.ItemEvent.Type.Name(event.type).lower()
+				data = app.json.dumps({"type": event_type, "id": event.id, "name": event.name})
+				yield f"id: {event.resume_token}\nevent: {event_type}\ndata: {data}\n\n"
+		except grpc.RpcError as e:
+			if e.code() != grpc.StatusCode.CANCELLED:
+				yield f"event: error\ndata: {app.json.dumps({'error': e.code().name})}\n\n"
+		finally:
+			# Runs when the client disconnects, too: stop the upstream stream
+			call.cancel()
+			EVENT_STREAMS_GAUGE.dec()
 
-			except CircuitBreakerError:
-				# Circuit is open - fail fast
-				print(f"[REST] Circuit breaker is OPEN - failing fast")
-				return jsonify({"error": "Service unavailable"}), 503
+	return Response(stream(), mimetype="text/event-stream",
+			headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-			except grpc.RpcError as e:
-				last_error = e
-				print(f"[REST] gRPC Error on attempt {attempt + 1}: {e.code()}")
+@app.route('/items/<int:item_id>', methods=['PUT'])
+def update_item(item_id):
+	# Update specific item with retry logic and circuit breaker
+	item_data = request.get_json()
 
-				# Don't retry on last attempt
-				if attempt < max_attempts - 1:
-					delay = delays[attempt + 1]
-					print(f"[REST] Retrying in {delay}s...")
-					time.sleep(delay)
+	if not item_data or 'id' not in item_data or 'name' not in item_data or item_data['id'] != item_id:
+		return jsonify({"error": "Bad request"}), 400
 
-		# All retries exhausted
-		print(f"[REST] All retries exhausted. Returning error.")
-		return jsonify({"error": "Backend failure", "details": str(last_error)}), 500
+	return write_with_retry("UpdateItem", grpc_update_item, item_data, "updated")
 
 @app.route('/items/<int:item_id>', methods=['DELETE'])
 def delete_item(item_id):
 	# Delete specific item with retry logic and circuit breaker
-	# - 3 attempts with exponential backoff (0ms, 100ms, 200ms)
-	# - Circuit breaker opens after 3 consecutive failures
-	# - Returns 503 when circuit is open
-
 	item_data = request.get_json()
 
 	if not item_data or item_data['id'] != item_id:
 		return jsonify({"error": "Bad request"}), 400
 
-	# Retry configuration
-	max_attempts = 3
-	delays = [0, 0.1, 0.2]
-
-	last_error = None
-
-	for attempt in range(max_attempts):
-		try:
-			print(f"[REST] Attempt {attempt + 1}/{max_attempts}")
-
-			# Call gRPC through circuit breaker
-			response = breaker.call(grpc_delete_item, item_data)
-
-			print(f"[REST] Item deleted successfully: {response.id}")
-			return jsonify({"message": "Item deleted", "id": response.id, "name": response.name}), 201
-
-		except CircuitBreakerError:
-			# Circuit i sopen - fail fast
-			print(f"[REST] Circuit breaker is OPEN - failing fast")
-			return jsonify({"error": "Service unavailable"}), 503
-
-		except grpc.RpcError as e:
-			last_error = e
-			print(f"[REST] gRPC Error on attempt {attempt + 1}: {e.code()}")
-			# Don't retry on ast attempt
-			if attempt < max_attempts - 1:
-				delay = delays[attempt + 1]
-				print(f"[REST] Retrying in {delay}s...")
-				time.sleep(delay)
-
-	# All retries exhausted
-	print(f"[REST] All retries exhausted. Returning error.")
-	return jsonify({"error": "Backend failure", "details": str(last_error)}), 500
+	return write_with_retry("DeleteItem", grpc_delete_item, item_data, "deleted", UNSTARTED_CODES)
 
 @app.route('/health', methods=['GET'])
 def health():
 	# Health check endpoint
-	return jsonify({"status": "healthy", "circuit_breaker_state": breaker.current_state}), 200
+	return jsonify({"status": "healthy", "circuit_breakers": breakers.states()}), 200
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+	# CPU / allocation profile of the gunicorn worker that serves this
+	# request, as collapsed stacks (see profiling.py)
+	status, content_type, body = profiling.handle_profile(request.method, request.args)
+	return Response(body, status=status, content_type=content_type)
 
 if __name__ == '__main__':
 	app.run(host='0.0.0.0', port=5000)
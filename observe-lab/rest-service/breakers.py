@@ -0,0 +1,167 @@
+import collections
+import os
+import threading
+import time
+
+import grpc
+from prometheus_client import Counter, Gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+# Prometheus metrics (exposed on /metrics with the rest of the default registry)
+STATE_GAUGE = Gauge(
+	'circuit_breaker_state',
+	'Circuit breaker state (0=closed, 1=open, 2=half-open)',
+	['method', 'target'],
+	# One series per worker process (pid label): each worker has its own breakers
+	multiprocess_mode='liveall'
+)
+
+TRANSITION_COUNTER = Counter(
+	'circuit_breaker_transitions_total',
+	'Circuit breaker state transitions',
+	['method', 'target', 'from_state', 'to_state']
+)
+
+REJECTED_COUNTER = Counter(
+	'circuit_breaker_rejected_total',
+	'Calls rejected without reaching the backend because the circuit was open',
+	['method', 'target']
+)
+
+# gRPC codes that say something about backend health. Business outcomes like
+# NOT_FOUND or ALREADY_EXISTS are successful calls as far as the breaker cares.
+FAILURE_CODES = frozenset({
+	grpc.StatusCode.UNAVAILABLE,
+	grpc.StatusCode.DEADLINE_EXCEEDED,
+	grpc.StatusCode.RESOURCE_EXHAUSTED,
+	grpc.StatusCode.INTERNAL,
+	grpc.StatusCode.UNKNOWN,
+	grpc.StatusCode.ABORTED,
+})
+
+def is_failure(error):
+	if isinstance(error, grpc.RpcError):
+		return error.code() in FAILURE_CODES
+	return True
+
+class CircuitOpenError(Exception):
+	# Raised instead of calling the backend while a circuit is open
+	pass
+
+class CircuitBreaker:
+	# Failure-rate circuit breaker over a sliding window of the last
+	# window_size calls:
+	# - closed -> open when at least min_calls were seen and the failure rate
+	#   in the window reaches failure_rate
+	# - open -> half-open after reset_timeout seconds
+	# - half-open lets at most half_open_max_calls probes through; all of them
+	#   succeeding closes the circuit, any failure opens it again
+
+	def __init__(self, method, target, failure_rate=0.5, window_size=20, min_calls=10,
+			reset_timeout=30, half_open_max_calls=3):
+		self.method = method
+		self.target = target
+		self.failure_rate = failure_rate
+		self.min_calls = min_calls
+		self.reset_timeout = reset_timeout
+		self.half_open_max_calls = half_open_max_calls
+
+		self.state = CLOSED
+		self._outcomes = collections.deque(maxlen=window_size)	# True = failure
+		self._opened_at = 0
+		self._probes_started = 0
+		self._probes_succeeded = 0
+		self._lock = threading.Lock()
+		STATE_GAUGE.labels(method=method, target=target).set(STATE_VALUES[CLOSED])
+
+	def _transition(self, new_state):
+		# Caller holds the lock
+		TRANSITION_COUNTER.labels(method=self.method, target=self.target,
+				from_state=self.state, to_state=new_state).inc()
+		STATE_GAUGE.labels(method=self.method, target=self.target).set(STATE_VALUES[new_state])
+		print(f"[REST] Circuit {self.method}@{self.target}: {self.state} -> {new_state}")
+
+		self.state = new_state
+		self._outcomes.clear()
+		if new_state == OPEN:
+			self._opened_at = time.monotonic()
+		elif new_state == HALF_OPEN:
+			self._probes_started = 0
+			self._probes_succeeded = 0
+
+	def _before_call(self):
+		with self._lock:
+			if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+				self._transition(HALF_OPEN)
+
+			if self.state == OPEN or (self.state == HALF_OPEN and self._probes_started >= self.half_open_max_calls):
+				REJECTED_COUNTER.labels(method=self.method, target=self.target).inc()
+				raise CircuitOpenError(f"Circuit for {self.method}@{self.target} is {self.state}")
+
+			if self.state == HALF_OPEN:
+				self._probes_started += 1
+
+	def _record(self, failed):
+		with self._lock:
+			if self.state == HALF_OPEN:
+				if failed:
+					self._transition(OPEN)
+				else:
+					self._probes_succeeded += 1
+					if self._probes_succeeded >= self.half_open_max_calls:
+						self._transition(CLOSED)
+				return
+
+			if self.state == CLOSED:
+				self._outcomes.append(failed)
+				failures = sum(self._outcomes)
+				if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+					self._transition(OPEN)
+
+	def call(self, fn, *args, **kwargs):
+		self._before_call()
+		try:
+			result = fn(*args, **kwargs)
+		except Exception as e:
+			self._record(is_failure(e))
+			raise
+		self._record(False)
+		return result
+
+class BreakerRegistry:
+	# One breaker per (RPC method, backend target), created on first use, so a
+	# failing operation or replica only sheds its own traffic
+
+	def __init__(self, **settings):
+		self.settings = settings
+		self._breakers = {}
+		self._lock = threading.Lock()
+
+	def get(self, method, target):
+		key = (method, target)
+		breaker = self._breakers.get(key)
+		if breaker is None:
+			with self._lock:
+				breaker = self._breakers.get(key)
+				if breaker is None:
+					breaker = CircuitBreaker(method, target, **self.settings)
+					self._breakers[key] = breaker
+		return breaker
+
+	def states(self):
+		return {f"{method}@{target}": breaker.state for (method, target), breaker in self._breakers.items()}
+
+def registry_from_env():
+	# Build a BreakerRegistry from BREAKER_* environment variables
+	return BreakerRegistry(
+		failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+		window_size=int(os.getenv("BREAKER_WINDOW_SIZE", "20")),
+		min_calls=int(os.getenv("BREAKER_MIN_CALLS", "10")),
+		reset_timeout=float(os.getenv("BREAKER_RESET_TIMEOUT", "30")),
+		half_open_max_calls=int(os.getenv("BREAKER_HALF_OPEN_MAX_CALLS", "3")),
+	)
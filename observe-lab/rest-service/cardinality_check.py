@@ -0,0 +1,48 @@
+import sys
+import time
+
+from prometheus_client import REGISTRY
+
+from app import app
+
+# Checks that the HTTP metrics keep a bounded number of series: sends requests
+# for many distinct item ids (and unknown paths) through the app and counts
+# the http_request_* series afterwards. No gRPC backend is needed: the PUTs
+# carry a mismatched id and are rejected with 400 before any backend call.
+#	python3 cardinality_check.py [ids]	(default 100,000)
+# Exits non-zero if the series count grows with the number of ids.
+
+# Family names as prometheus_client reports them (counters without _total)
+METRICS = ("http_request_duration_seconds", "http_requests")
+
+def series_count():
+	count = 0
+	for family in REGISTRY.collect():
+		if family.name in METRICS:
+			count += len({tuple(sorted(sample.labels.items())) for sample in family.samples
+					if sample.name.endswith(("_count", "_total"))})
+	return count
+
+def send(client, ids):
+	for item_id in ids:
+		client.put(f"/items/{item_id}", json={"id": -1, "name": "x"})
+		if item_id % 10 == 0:
+			client.get(f"/no-such-route/{item_id}")
+
+if __name__ == '__main__':
+	total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+	client = app.test_client()
+
+	send(client, range(1, 101))
+	baseline = series_count()
+
+	start = time.perf_counter()
+	send(client, range(101, total + 1))
+	elapsed = time.perf_counter() - start
+	after = series_count()
+
+	print(f"Series after 100 ids:	{baseline}")
+	print(f"Series after {total} ids:	{after}	({total / elapsed:.0f} requests/s through the test client)")
+	if after != baseline:
+		sys.exit(f"FAIL: series grew from {baseline} to {after}")
+	print("OK: series count is independent of the number of ids")
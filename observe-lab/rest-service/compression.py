@@ -0,0 +1,69 @@
+import gzip
+import os
+import zlib
+
+from flask import request
+
+# Responses smaller than this are sent uncompressed: for a few hundred bytes
+# the CPU cost and the gzip header outweigh the bytes saved
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "1"))
+
+COMPRESSIBLE_TYPES = {"application/json", "text/plain"}
+
+def gzip_encode(data, level=COMPRESS_LEVEL):
+	return gzip.compress(data, compresslevel=level)
+
+def deflate_encode(data, level=COMPRESS_LEVEL):
+	# HTTP "deflate" is the zlib format (RFC 1950), not raw deflate
+	return zlib.compress(data, level)
+
+ENCODERS = {
+	"gzip": gzip_encode,
+	"deflate": deflate_encode,
+}
+
+def negotiate_encoding(accept_encoding):
+	# Pick the best supported coding from an Accept-Encoding header, honouring
+	# q-values ("gzip;q=0.5, deflate"); gzip wins ties. Returns None for identity.
+	best, best_q = None, 0.0
+	for part in (accept_encoding or "").split(","):
+		coding, _, params = part.strip().partition(";")
+		coding = coding.strip().lower()
+		q = 1.0
+		params = params.strip()
+		if params.startswith("q="):
+			try:
+				q = float(params[2:])
+			except ValueError:
+				q = 0.0
+
+		if coding == "*":
+			coding = "gzip"
+		if coding in ENCODERS and q > 0 and (q > best_q or (q == best_q and coding == "gzip")):
+			best, best_q = coding, q
+	return best
+
+def compress_response(response):
+	# after_request hook: compress large JSON/text bodies when the client asks for it
+	if (response.direct_passthrough or response.is_streamed
+			or response.mimetype not in COMPRESSIBLE_TYPES
+			or "Content-Encoding" in response.headers):
+		return response
+
+	response.vary.add("Accept-Encoding")
+
+	if response.content_length is not None and response.content_length < COMPRESS_MIN_BYTES:
+		return response
+
+	encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+	if encoding is None:
+		return response
+
+	data = response.get_data()
+	if len(data) < COMPRESS_MIN_BYTES:
+		return response
+
+	response.set_data(ENCODERS[encoding](data))
+	response.headers["Content-Encoding"] = encoding
+	return response
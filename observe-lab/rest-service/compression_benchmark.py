@@ -0,0 +1,61 @@
+import gzip
+import json
+import time
+
+import myitems_pb2
+from compression import ENCODERS
+
+# CPU cost vs bytes saved when compressing list responses of different sizes.
+# Runs offline against generated items, no services needed:
+#	python3 compression_benchmark.py
+
+SIZES = [10, 100, 1000, 10000, 100000]
+LEVELS = [1, 6, 9]
+
+def make_items(count):
+	return [{"id": i, "name": f"Item{i}"} for i in range(count)]
+
+def cpu_time(fn, data, repeat):
+	# Average CPU seconds per call
+	start = time.process_time()
+	for _ in range(repeat):
+		fn(data)
+	return (time.process_time() - start) / repeat
+
+def bench_http(count):
+	# Whole GET /items JSON body compressed by the gateway
+	body = json.dumps(make_items(count)).encode()
+	repeat = max(1, 200000 // max(count, 1))
+
+	print(f"\nGET /items with {count} items: {len(body)} bytes uncompressed")
+	print(f"	{'encoding':<10}{'level':>6}{'bytes':>12}{'ratio':>8}{'cpu ms':>10}{'us/KB saved':>14}")
+	for encoding, encoder in ENCODERS.items():
+		for level in LEVELS:
+			compressed = encoder(body, level)
+			cpu = cpu_time(lambda d: encoder(d, level), body, repeat)
+			saved_kb = max(len(body) - len(compressed), 1) / 1024
+			print(f"	{encoding:<10}{level:>6}{len(compressed):>12}{len(body) / len(compressed):>8.2f}"
+				f"{cpu * 1000:>10.3f}{cpu * 1e6 / saved_kb:>14.2f}")
+
+def bench_grpc(count):
+	# ListAllItems stream: gRPC compresses each ItemResponse on its own, so
+	# compare per-message gzip with what a single compressed payload would give
+	messages = [myitems_pb2.ItemResponse(id=i, name=f"Item{i}", success=True).SerializeToString() for i in range(count)]
+	raw = sum(len(m) + 5 for m in messages)	# 5-byte gRPC message prefix
+	per_message = sum(len(gzip.compress(m, 6)) + 5 for m in messages)
+	whole = len(gzip.compress(b"".join(messages), 6))
+
+	print(f"\nListAllItems stream with {count} items:")
+	print(f"	uncompressed:		{raw} bytes")
+	print(f"	per-message gzip:	{per_message} bytes")
+	print(f"	single gzip payload:	{whole} bytes")
+
+if __name__ == '__main__':
+	print("Compression benchmark: CPU cost vs bytes saved")
+	print("=" * 50)
+
+	for count in SIZES:
+		bench_http(count)
+
+	for count in SIZES:
+		bench_grpc(count)
@@ -0,0 +1,30 @@
+import os
+
+import multiproc_metrics
+
+# gunicorn settings for the REST gateway (see Dockerfile).
+# Threaded workers so the long-lived /items/events streams don't each block a
+# whole process; WEB_WORKERS processes share the port. One by default: with
+# several, each worker's gRPC channel may reach a different gRPC worker, so an
+# /items/events client reconnecting through another worker gets a RESET (see
+# grpc-service/supervisor.py).
+
+bind = "0.0.0.0:5000"
+workers = int(os.getenv("WEB_WORKERS", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "16"))
+# SSE clients stay connected indefinitely; heartbeats keep them below this
+timeout = 60
+
+def on_starting(server):
+	# Metric files from a previous run would be aggregated into this one
+	multiproc_metrics.reset_dir()
+
+def post_worker_init(worker):
+	# Thread capacity next to http_requests_inflight on the saturation panel
+	from app import SERVER_THREADS_GAUGE
+	SERVER_THREADS_GAUGE.set(worker.cfg.threads)
+
+def child_exit(server, worker):
+	# Drop the dead worker's live gauges from /metrics
+	multiproc_metrics.worker_exited(worker.pid)
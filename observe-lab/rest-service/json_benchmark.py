@@ -0,0 +1,58 @@
+import time
+
+from flask import Flask, jsonify
+
+import myitems_pb2
+from fastjson import FastJSONProvider, item_list_json
+
+# Serialization cost of a GET /items response per 10k items:
+# - jsonify:         per-item dicts, Flask's default (stdlib json) provider
+# - FastJSON:        per-item dicts, orjson-backed provider (what GET /items
+#                    uses, see fastjson.item_list_response)
+# - item_list_json:  ItemResponse messages encoded directly, no dicts (the
+#                    fallback when orjson is not installed)
+# Runs offline, no services needed:
+#	python3 json_benchmark.py
+
+ITEMS = 10000
+REPEAT = 50
+
+def bench(label, fn):
+	fn()	# warm up
+	start = time.perf_counter()
+	for _ in range(REPEAT):
+		body = fn()
+	per_call = (time.perf_counter() - start) / REPEAT
+	print(f"	{label:<28}{per_call * 1000:>8.2f} ms / {ITEMS} items	({len(body)} bytes)")
+	return per_call
+
+if __name__ == '__main__':
+	messages = [myitems_pb2.ItemResponse(id=i, name=f"Item{i}", success=True) for i in range(ITEMS)]
+
+	default_app = Flask("default")
+	fast_app = Flask("fast")
+	fast_app.json = FastJSONProvider(fast_app)
+
+	def dicts():
+		return [{"id": item.id, "name": item.name} for item in messages]
+
+	def with_default():
+		with default_app.app_context():
+			return jsonify(dicts()).get_data()
+
+	def with_fast():
+		with fast_app.app_context():
+			return jsonify(dicts()).get_data()
+
+	def direct():
+		return item_list_json(messages)
+
+	print("JSON serialization benchmark")
+	print("=" * 50)
+	baseline = bench("jsonify (stdlib)", with_default)
+	fast = bench("jsonify (FastJSONProvider)", with_fast)
+	raw = bench("item_list_json", direct)
+
+	print(f"\nComparison:")
+	print(f"	FastJSONProvider is {baseline / fast:.2f}x faster than jsonify")
+	print(f"	item_list_json is {baseline / raw:.2f}x faster than jsonify")
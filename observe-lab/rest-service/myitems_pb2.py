@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rmyitems.proto\x12\x07myitems\"\'\n\x0bItemRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\"9\n\x0cItemResponse\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"\x07\n\x05\x45mpty2\xb3\x02\n\x0bItemService\x12\x39\n\nCreateItem\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12\x39\n\nUpdateItem\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12\x39\n\nDeleteItem\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12:\n\x0bGetItemById\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12\x37\n\x0cListAllItems\x12\x0e.myitems.Empty\x1a\x15.myitems.ItemResponse0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rmyitems.proto\x12\x07myitems\"\'\n\x0bItemRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\"9\n\x0cItemResponse\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"\x07\n\x05\x45mpty\"\x1f\n\x0cSinceRequest\x12\x0f\n\x07version\x18\x01 \x01(\x03\"G\n\tItemDelta\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x0f\n\x07version\x18\x03 \x01(\x03\x12\x0f\n\x07\x64\x65leted\x18\x04 \x01(\x08\"$\n\x0cWatchRequest\x12\x14\n\x0cresume_token\x18\x01 \x01(\t\"\xb8\x01\n\tItemEvent\x12%\n\x04type\x18\x01 \x01(\x0e\x32\x17.myitems.ItemEvent.Type\x12\n\n\x02id\x18\x02 \x01(\x05\x12\x0c\n\x04name\x18\x03 \x01(\t\x12\x14\n\x0cresume_token\x18\x04 \x01(\t\"T\n\x04Type\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0b\n\x07\x43REATED\x10\x01\x12\x0b\n\x07UPDATED\x10\x02\x12\x0b\n\x07\x44\x45LETED\x10\x03\x12\t\n\x05RESET\x10\x04\x12\r\n\tHEARTBEAT\x10\x05\x32\xad\x03\n\x0bItemService\x12\x39\n\nCreateItem\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12\x39\n\nUpdateItem\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12\x39\n\nDeleteItem\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12:\n\x0bGetItemById\x12\x14.myitems.ItemRequest\x1a\x15.myitems.ItemResponse\x12\x37\n\x0cListAllItems\x12\x0e.myitems.Empty\x1a\x15.myitems.ItemResponse0\x01\x12=\n\x0eListItemsSince\x12\x15.myitems.SinceRequest\x1a\x12.myitems.ItemDelta0\x01\x12\x39\n\nWatchItems\x12\x15.myitems.WatchRequest\x1a\x12.myitems.ItemEvent0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -37,6 +37,16 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_ITEMRESPONSE']._serialized_end=124
   _globals['_EMPTY']._serialized_start=126
   _globals['_EMPTY']._serialized_end=133
-  _globals['_ITEMSERVICE']._serialized_start=136
-  _globals['_ITEMSERVICE']._serialized_end=443
+  _globals['_SINCEREQUEST']._serialized_start=135
+  _globals['_SINCEREQUEST']._serialized_end=166
+  _globals['_ITEMDELTA']._serialized_start=168
+  _globals['_ITEMDELTA']._serialized_end=239
+  _globals['_WATCHREQUEST']._serialized_start=241
+  _globals['_WATCHREQUEST']._serialized_end=277
+  _globals['_ITEMEVENT']._serialized_start=280
+  _globals['_ITEMEVENT']._serialized_end=464
+  _globals['_ITEMEVENT_TYPE']._serialized_start=380
+  _globals['_ITEMEVENT_TYPE']._serialized_end=464
+  _globals['_ITEMSERVICE']._serialized_start=467
+  _globals['_ITEMSERVICE']._serialized_end=896
 # @@protoc_insertion_point(module_scope)
@@ -59,6 +59,16 @@ class ItemServiceStub(object):
                 request_serializer=myitems__pb2.Empty.SerializeToString,
                 response_deserializer=myitems__pb2.ItemResponse.FromString,
                 _registered_method=True)
+        self.ListItemsSince = channel.unary_stream(
+                '/myitems.ItemService/ListItemsSince',
+                request_serializer=myitems__pb2.SinceRequest.SerializeToString,
+                response_deserializer=myitems__pb2.ItemDelta.FromString,
+                _registered_method=True)
+        self.WatchItems = channel.unary_stream(
+                '/myitems.ItemService/WatchItems',
+                request_serializer=myitems__pb2.WatchRequest.SerializeToString,
+                response_deserializer=myitems__pb2.ItemEvent.FromString,
+                _registered_method=True)
 
 
 class ItemServiceServicer(object):
@@ -99,6 +109,20 @@ class ItemServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ListItemsSince(self, request, context):
+        """Server-streaming RPC: items changed or deleted after a version
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchItems(self, request, context):
+        """Server-streaming RPC: item changes as they happen
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ItemServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -127,6 +151,16 @@ def add_ItemServiceServicer_to_server(servicer, server):
                     request_deserializer=myitems__pb2.Empty.FromString,
                     response_serializer=myitems__pb2.ItemResponse.SerializeToString,
             ),
+            'ListItemsSince': grpc.unary_stream_rpc_method_handler(
+                    servicer.ListItemsSince,
+                    request_deserializer=myitems__pb2.SinceRequest.FromString,
+                    response_serializer=myitems__pb2.ItemDelta.SerializeToString,
+            ),
+            'WatchItems': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchItems,
+                    request_deserializer=myitems__pb2.WatchRequest.FromString,
+                    response_serializer=myitems__pb2.ItemEvent.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'myitems.ItemService', rpc_method_handlers)
@@ -272,3 +306,57 @@ class ItemService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ListItemsSince(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/myitems.ItemService/ListItemsSince',
+            myitems__pb2.SinceRequest.SerializeToString,
+            myitems__pb2.ItemDelta.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def WatchItems(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/myitems.ItemService/WatchItems',
+            myitems__pb2.WatchRequest.SerializeToString,
+            myitems__pb2.ItemEvent.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
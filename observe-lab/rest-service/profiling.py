@@ -0,0 +1,164 @@
+import collections
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# On-demand profiling of a running process, for latency spikes in production.
+#	GET /debug/profile?mode=cpu&seconds=10&interval_ms=10
+# Output is collapsed stacks ("outer;...;inner count" per line), ready for
+# flamegraph.pl or speedscope.
+#	cpu	samples every thread's stack each interval_ms, counting only threads
+#		whose CPU clock advanced since the previous sample (Linux; elsewhere
+#		every thread counts, as in wall)
+#	wall	samples every thread, busy or waiting
+#	alloc	tracemalloc for `seconds`; weights are bytes allocated during the
+#		window and still alive at its end, per allocating stack
+#
+# Sampling runs in the requesting thread and costs one stack walk per thread
+# per interval. tracemalloc slows every allocation while on, so alloc windows
+# are best kept short. One profile at a time per process (409 otherwise);
+# seconds is capped at PROFILE_MAX_SECONDS.
+
+MODES = ("cpu", "wall", "alloc")
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MIN_INTERVAL = 0.001
+ALLOC_FRAMES = 32
+
+_running = threading.Lock()
+
+class ProfileBusy(Exception):
+	# Another profile is running in this process
+	pass
+
+def options(params):
+	# Validated profile() arguments from query parameters; raises ValueError
+	mode = params.get("mode", "cpu")
+	if mode not in MODES:
+		raise ValueError(f"mode must be one of {', '.join(MODES)}")
+	seconds = float(params.get("seconds", "10"))
+	if not 0 < seconds <= MAX_SECONDS:
+		raise ValueError(f"seconds must be in (0, {MAX_SECONDS:g}]")
+	interval = float(params.get("interval_ms", "10")) / 1000
+	if not (math.isfinite(interval) and MIN_INTERVAL <= interval <= seconds):
+		raise ValueError(f"interval_ms must be between {MIN_INTERVAL * 1000:g} and seconds * 1000")
+	return {"mode": mode, "seconds": seconds, "interval": interval}
+
+def _short(filename):
+	# "flask/app.py" rather than a bare "app.py" or "__init__.py"
+	return "/".join(filename.replace(os.sep, "/").rsplit("/", 2)[-2:])
+
+def _thread_cpu(ident):
+	# CPU seconds used by a thread, or None where that can't be read
+	try:
+		return time.clock_gettime(time.pthread_getcpuclockid(ident))
+	except (AttributeError, OSError):
+		return None
+
+def sample_stacks(seconds, interval, cpu_only):
+	me = threading.get_ident()
+	names = {}
+	last_cpu = {}
+	counts = collections.Counter()
+	deadline = time.monotonic() + seconds
+	while time.monotonic() < deadline:
+		frames = sys._current_frames()
+		if frames.keys() - names.keys():
+			names = {thread.ident: thread.name for thread in threading.enumerate()}
+		for ident, frame in frames.items():
+			if ident == me:
+				continue
+			if cpu_only:
+				cpu = _thread_cpu(ident)
+				if cpu is not None:
+					previous = last_cpu.get(ident)
+					last_cpu[ident] = cpu
+					if previous is None or cpu <= previous:
+						continue
+			stack = []
+			while frame is not None:
+				code = frame.f_code
+				stack.append(f"{_short(code.co_filename)}:{code.co_name}")
+				frame = frame.f_back
+			stack.append(names.get(ident, f"thread-{ident}"))
+			counts[";".join(reversed(stack))] += 1
+		del frames
+		time.sleep(max(0, min(interval, deadline - time.monotonic())))
+	return counts
+
+def allocation_profile(seconds):
+	was_tracing = tracemalloc.is_tracing()
+	if not was_tracing:
+		tracemalloc.start(ALLOC_FRAMES)
+	try:
+		baseline = tracemalloc.take_snapshot() if was_tracing else None
+		time.sleep(seconds)
+		snapshot = tracemalloc.take_snapshot()
+	finally:
+		if not was_tracing:
+			tracemalloc.stop()
+
+	ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+	snapshot = snapshot.filter_traces(ignore)
+	if baseline is None:
+		weights = ((stat.traceback, stat.size) for stat in snapshot.statistics("traceback"))
+	else:
+		# Tracing was already on (PYTHONTRACEMALLOC): only what grew
+		weights = ((stat.traceback, stat.size_diff) for stat in
+				snapshot.compare_to(baseline.filter_traces(ignore), "traceback"))
+
+	counts = collections.Counter()
+	for traceback, size in weights:
+		if size > 0:
+			# Frames are ordered oldest first
+			stack = ";".join(f"{_short(frame.filename)}:{frame.lineno}" for frame in traceback)
+			counts[stack] += size
+	return counts
+
+def profile(mode="cpu", seconds=10, interval=0.01):
+	# Collapsed-stack profile of this process (see the top of the file)
+	if not _running.acquire(blocking=False):
+		raise ProfileBusy()
+	try:
+		if mode == "alloc":
+			counts = allocation_profile(seconds)
+		else:
+			counts = sample_stacks(seconds, interval, cpu_only=mode == "cpu")
+	finally:
+		_running.release()
+	return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+def handle_profile(method, params):
+	# /debug/profile handler: (status, content type, body)
+	try:
+		text = profile(**options(params))
+	except ValueError as e:
+		return 400, "text/plain", f"{e}\n"
+	except ProfileBusy:
+		return 409, "text/plain", "A profile is already running\n"
+	return 200, "text/plain", text
+
+def serve_pipe(conn):
+	# Worker side of supervisor.py's /debug/profile: run each options dict
+	# received on conn and send back (status, body). A failed profile is
+	# answered with a 500 rather than ending the loop, which would leave the
+	# worker unreachable for every later request.
+	def loop():
+		while True:
+			try:
+				request = conn.recv()
+			except (EOFError, OSError):
+				return
+			try:
+				reply = (200, profile(**request))
+			except ProfileBusy:
+				reply = (409, "A profile is already running\n")
+			except Exception as e:
+				reply = (500, f"Profile failed: {e}\n")
+			try:
+				conn.send(reply)
+			except (EOFError, OSError):
+				return
+	threading.Thread(target=loop, daemon=True).start()
@@ -0,0 +1,202 @@
+import os
+import queue
+import random
+import threading
+import time
+
+import grpc
+
+# Status codes that indicate a transient backend problem and are safe to retry.
+# Everything else (ALREADY_EXISTS, NOT_FOUND, INVALID_ARGUMENT, ...) is returned
+# to the caller immediately because another attempt would get the same answer.
+RETRYABLE_CODES = frozenset({
+	grpc.StatusCode.UNAVAILABLE,
+	grpc.StatusCode.DEADLINE_EXCEEDED,
+	grpc.StatusCode.RESOURCE_EXHAUSTED,
+	grpc.StatusCode.ABORTED,
+})
+
+# Codes after which the server is known not to have run the handler, so a
+# write that is not idempotent (CreateItem, DeleteItem) can be sent again:
+# UNAVAILABLE means no connection, RESOURCE_EXHAUSTED is the server's limiter
+# shedding the call before its handler. After DEADLINE_EXCEEDED or ABORTED the
+# first attempt may have been applied, and a retry would answer 409/404 for a
+# write that succeeded.
+UNSTARTED_CODES = frozenset({
+	grpc.StatusCode.UNAVAILABLE,
+	grpc.StatusCode.RESOURCE_EXHAUSTED,
+})
+
+def is_retryable(error, retryable_codes=RETRYABLE_CODES):
+	# Only gRPC errors with a transient status code are retried
+	return isinstance(error, grpc.RpcError) and error.code() in retryable_codes
+
+class RetryBudget:
+	# Caps retries to a percentage of recent traffic so retries cannot multiply
+	# load during an outage. Requests and retries are counted in 1-second buckets
+	# over a sliding window; a retry is allowed while
+	#   retries < ratio * requests + min_per_sec * window
+	# (the floor keeps low-traffic endpoints able to retry at all).
+
+	def __init__(self, ratio=0.1, min_per_sec=1, window=10):
+		self.ratio = ratio
+		self.min_per_sec = min_per_sec
+		self.window = window
+		self._requests = [0] * window
+		self._retries = [0] * window
+		self._stamps = [0] * window
+		self._lock = threading.Lock()
+
+	def _bucket(self, now):
+		# Return the bucket index for this second, resetting it if it is stale
+		second = int(now)
+		idx = second % self.window
+		if self._stamps[idx] != second:
+			self._stamps[idx] = second
+			self._requests[idx] = 0
+			self._retries[idx] = 0
+		return idx
+
+	def _totals(self, now):
+		oldest = int(now) - self.window
+		requests = retries = 0
+		for idx in range(self.window):
+			if self._stamps[idx] > oldest:
+				requests += self._requests[idx]
+				retries += self._retries[idx]
+		return requests, retries
+
+	def record_request(self):
+		with self._lock:
+			self._requests[self._bucket(time.time())] += 1
+
+	def try_acquire(self):
+		# Reserve one retry if the budget allows it
+		with self._lock:
+			now = time.time()
+			idx = self._bucket(now)
+			requests, retries = self._totals(now)
+			if retries >= self.ratio * requests + self.min_per_sec * self.window:
+				return False
+			self._retries[idx] += 1
+			return True
+
+class RetryPolicy:
+	# Jittered exponential backoff for a single logical call:
+	#   delay(n) = uniform(0, min(max_delay, base_delay * multiplier ** n))
+	# ("full jitter") so concurrent clients do not retry in lockstep.
+
+	def __init__(self, max_attempts=3, base_delay=0.05, max_delay=1.0, multiplier=2.0,
+			retryable_codes=RETRYABLE_CODES, budget=None, hedge_delay=None):
+		self.max_attempts = max_attempts
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.multiplier = multiplier
+		self.retryable_codes = retryable_codes
+		self.budget = budget
+		self.hedge_delay = hedge_delay	# None disables hedging
+
+	def backoff(self, attempt):
+		cap = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+		return random.uniform(0, cap)
+
+	def call(self, fn, *args, deadline=None, retryable_codes=None, **kwargs):
+		# Call fn, retrying transient gRPC failures with backoff while the retry
+		# budget allows. Non-retryable errors are raised on the first attempt.
+		# With an absolute deadline (time.monotonic()), each attempt is passed
+		# the remaining time as timeout= and no retry starts past the deadline.
+		# retryable_codes overrides the policy's codes for this call.
+		if self.budget:
+			self.budget.record_request()
+		return self._attempts(fn, args, kwargs, deadline, retryable_codes or self.retryable_codes, 0)
+
+	def _attempts(self, fn, args, kwargs, deadline, retryable_codes, first):
+		for attempt in range(first, self.max_attempts):
+			if deadline is not None:
+				kwargs["timeout"] = deadline - time.monotonic()
+			try:
+				return fn(*args, **kwargs)
+			except grpc.RpcError as e:
+				self._before_retry(e, attempt, deadline, retryable_codes)
+
+	def _before_retry(self, error, attempt, deadline, retryable_codes):
+		# Back off before the attempt after `attempt`, or raise error when it
+		# may not be retried
+		if not is_retryable(error, retryable_codes) or attempt == self.max_attempts - 1:
+			raise error
+
+		delay = self.backoff(attempt)
+		if deadline is not None and time.monotonic() + delay >= deadline:
+			print(f"[REST] Deadline reached, not retrying {error.code()}")
+			raise error
+		if self.budget and not self.budget.try_acquire():
+			print(f"[REST] Retry budget exhausted, not retrying {error.code()}")
+			raise error
+
+		print(f"[REST] {error.code()} on attempt {attempt + 1}/{self.max_attempts}, retrying in {delay:.3f}s")
+		time.sleep(delay)
+
+	def hedged_call(self, multicallable, request, deadline=None):
+		# Hedged request for idempotent unary RPCs: send the request, and if no
+		# answer arrived after hedge_delay send one more copy (budget permitting).
+		# The first successful response wins; the slower call is cancelled.
+		# When every copy failed with a retryable code (typically fast, before
+		# the hedge was due) the remaining attempts go through the normal
+		# backoff path.
+		if self.hedge_delay is None:
+			return self.call(multicallable, request, deadline=deadline)
+
+		if self.budget:
+			self.budget.record_request()
+
+		completed = queue.Queue()
+		calls = []
+
+		def launch():
+			timeout = None if deadline is None else deadline - time.monotonic()
+			call = multicallable.future(request, timeout=timeout)
+			call.add_done_callback(completed.put)
+			calls.append(call)
+
+		launch()
+		try:
+			first = completed.get(timeout=self.hedge_delay)
+		except queue.Empty:
+			first = None
+			if self.budget is None or self.budget.try_acquire():
+				print(f"[REST] No response after {self.hedge_delay}s, sending hedged request")
+				launch()
+
+		last_error = None
+		for _ in range(len(calls)):
+			call = first if first is not None else completed.get()
+			first = None
+			try:
+				result = call.result()
+			except grpc.RpcError as e:
+				last_error = e
+				if not is_retryable(e, self.retryable_codes):
+					break
+				continue
+			for other in calls:
+				other.cancel()
+			return result
+
+		for other in calls:
+			other.cancel()
+		self._before_retry(last_error, 0, deadline, self.retryable_codes)
+		return self._attempts(multicallable, (request,), {}, deadline, self.retryable_codes, 1)
+
+def policy_from_env(prefix="RETRY"):
+	# Build a RetryPolicy from environment variables, e.g. RETRY_MAX_ATTEMPTS
+	hedge_ms = os.getenv(f"{prefix}_HEDGE_DELAY_MS")
+	return RetryPolicy(
+		max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", "3")),
+		base_delay=float(os.getenv(f"{prefix}_BASE_DELAY", "0.05")),
+		max_delay=float(os.getenv(f"{prefix}_MAX_DELAY", "1.0")),
+		budget=RetryBudget(
+			ratio=float(os.getenv(f"{prefix}_BUDGET_RATIO", "0.1")),
+			min_per_sec=float(os.getenv(f"{prefix}_BUDGET_MIN_PER_SEC", "1")),
+		),
+		hedge_delay=float(hedge_ms) / 1000 if hedge_ms else None,
+	)
@@ -0,0 +1,179 @@
+import collections
+import os
+import threading
+
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.flask import FlaskInstrumentor
+from opentelemetry.instrumentation.grpc import client_interceptor, filters, grpcext
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased
+from opentelemetry.trace import SpanContext, StatusCode, TraceFlags
+
+# Trace sampling for the gateway.
+#
+# Head sampling: root spans are kept with probability TRACE_SAMPLE_RATIO
+# (decided from the trace id, so every service keeps the same traces);
+# requests arriving with a sampled/unsampled parent follow the caller.
+#
+# Tail bias (TRACE_SLOW_MS > 0): requests that lose the ratio draw are still
+# recorded, but not exported. When the request's root span ends, its spans
+# are exported anyway if it took at least TRACE_SLOW_MS or any span ended
+# with an error status; otherwise they are dropped. Slow and failed requests
+# are therefore always traced, at the cost of building spans for every
+# request. The decision is local: downstream services only see the head
+# decision in the propagated context.
+
+class TailBiasedSampler(Sampler):
+	# Ratio-based root sampler that records (RECORD_ONLY) instead of dropping
+	# when tail sampling is on
+
+	def __init__(self, ratio, record_unsampled):
+		self.ratio = TraceIdRatioBased(ratio)
+		self.record_unsampled = record_unsampled
+
+	def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+		result = self.ratio.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+		if result.decision == Decision.DROP and self.record_unsampled:
+			return SamplingResult(Decision.RECORD_ONLY, attributes, result.trace_state)
+		return result
+
+	def get_description(self):
+		return f"TailBiased{{{self.ratio.get_description()}, record_unsampled={self.record_unsampled}}}"
+
+class RecordChildrenSampler(Sampler):
+	# Children of a recorded-but-unsampled span are recorded too, so a slow
+	# request is exported with its full span tree; children of dropped spans
+	# stay dropped
+
+	def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+		if trace.get_current_span(parent_context).is_recording():
+			return SamplingResult(Decision.RECORD_ONLY, attributes)
+		return SamplingResult(Decision.DROP)
+
+	def get_description(self):
+		return "RecordChildren"
+
+def sampled_copy(span):
+	# ReadableSpan identical to span but with the sampled flag set, so the
+	# batch processor exports it
+	context = span.context
+	return ReadableSpan(
+		name=span.name,
+		context=SpanContext(context.trace_id, context.span_id, is_remote=False,
+				trace_flags=TraceFlags(TraceFlags.SAMPLED), trace_state=context.trace_state),
+		parent=span.parent,
+		resource=span.resource,
+		attributes=span.attributes,
+		events=span.events,
+		links=span.links,
+		kind=span.kind,
+		status=span.status,
+		start_time=span.start_time,
+		end_time=span.end_time,
+		instrumentation_scope=span.instrumentation_scope,
+	)
+
+class TailSamplingProcessor(SpanProcessor):
+	# Passes sampled spans straight to the delegate (a BatchSpanProcessor).
+	# Recorded-only spans are held per trace until the trace's local root span
+	# ends, then forwarded if the root was slow or anything failed. At most
+	# max_traces traces are held; the oldest are dropped beyond that.
+
+	def __init__(self, delegate, slow_ns, keep_errors=True, max_traces=2048):
+		self.delegate = delegate
+		self.slow_ns = slow_ns
+		self.keep_errors = keep_errors
+		self.max_traces = max_traces
+		self.pending = collections.OrderedDict()	# trace_id -> [spans]
+		self.lock = threading.Lock()
+
+	def on_start(self, span, parent_context=None):
+		self.delegate.on_start(span, parent_context=parent_context)
+
+	def on_end(self, span):
+		if span.context.trace_flags.sampled:
+			self.delegate.on_end(span)
+			return
+
+		trace_id = span.context.trace_id
+		is_root = span.parent is None or span.parent.is_remote
+		with self.lock:
+			spans = self.pending.pop(trace_id, []) if is_root else self.pending.setdefault(trace_id, [])
+			if not is_root:
+				spans.append(span)
+				if len(self.pending) > self.max_traces:
+					self.pending.popitem(last=False)
+				return
+		spans.append(span)
+
+		slow = span.end_time - span.start_time >= self.slow_ns
+		failed = self.keep_errors and any(s.status.status_code == StatusCode.ERROR for s in spans)
+		if slow or failed:
+			for kept in spans:
+				self.delegate.on_end(sampled_copy(kept))
+
+	def shutdown(self):
+		self.delegate.shutdown()
+
+	def force_flush(self, timeout_millis=30000):
+		return self.delegate.force_flush(timeout_millis)
+
+def configure_tracing(app, service_name, exporter, ratio=1.0, slow_ms=0, keep_errors=True,
+		max_queue_size=2048, max_export_batch_size=512, schedule_delay_millis=5000,
+		excluded_urls="metrics,health"):
+	# Instrument the Flask app with a TracerProvider built from these settings
+	# and return the provider
+	tail = slow_ms > 0 and ratio < 1.0
+	sampler = ParentBased(
+		root=TailBiasedSampler(ratio, record_unsampled=tail),
+		local_parent_not_sampled=RecordChildrenSampler() if tail else None,
+	)
+	provider = TracerProvider(resource=Resource.create({"service.name": service_name}), sampler=sampler)
+
+	processor = BatchSpanProcessor(
+		exporter,
+		max_queue_size=max_queue_size,
+		max_export_batch_size=max_export_batch_size,
+		schedule_delay_millis=schedule_delay_millis,
+	)
+	if tail:
+		processor = TailSamplingProcessor(processor, int(slow_ms * 1e6), keep_errors)
+	provider.add_span_processor(processor)
+
+	FlaskInstrumentor().instrument_app(app, tracer_provider=provider, excluded_urls=excluded_urls)
+	return provider
+
+def traced_channel(channel, provider):
+	# Channel that creates a client span per call and sends the trace context
+	# in the call metadata. WatchItems is left out: the interceptor hands
+	# streaming responses back as a plain generator, which has no cancel() for
+	# the SSE route to close the stream with.
+	interceptor = client_interceptor(tracer_provider=provider, filter_=filters.negate(filters.method_name("WatchItems")))
+	return grpcext.intercept_channel(channel, interceptor)
+
+def tracing_from_env(app, service_name):
+	# Set up tracing from TRACE_* / OTEL_EXPORTER_OTLP_ENDPOINT; TRACING=0
+	# leaves the app uninstrumented
+	if os.getenv("TRACING", "1") == "0":
+		return None
+	exporter = OTLPSpanExporter(
+		endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://otel-collector:4317"),
+		insecure=True,
+	)
+	provider = configure_tracing(
+		app,
+		service_name,
+		exporter,
+		ratio=float(os.getenv("TRACE_SAMPLE_RATIO", "1.0")),
+		slow_ms=float(os.getenv("TRACE_SLOW_MS", "250")),
+		keep_errors=os.getenv("TRACE_KEEP_ERRORS", "1") != "0",
+		max_queue_size=int(os.getenv("TRACE_MAX_QUEUE_SIZE", "2048")),
+		max_export_batch_size=int(os.getenv("TRACE_MAX_EXPORT_BATCH_SIZE", "512")),
+		schedule_delay_millis=float(os.getenv("TRACE_SCHEDULE_DELAY_MS", "5000")),
+		excluded_urls=os.getenv("TRACE_EXCLUDED_URLS", "metrics,health"),
+	)
+	trace.set_tracer_provider(provider)
+	return provider
@@ -0,0 +1,119 @@
+import sys
+import time
+
+from flask import Flask, jsonify
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from tracing import configure_tracing
+
+# Per-request cost of tracing at different sampling / batching settings.
+# Runs offline through the Flask test client with an exporter that only counts
+# spans, so the numbers are span creation + processing, not network:
+#	python3 tracing_benchmark.py [requests]	(default 20,000)
+# 1 in 100 requests is slow (SLOW_SLEEP) and 1 in 100 fails, to show which
+# settings keep them.
+
+SLOW_EVERY = 100
+ERROR_EVERY = 100
+SLOW_SLEEP = 0.01
+SLOW_MS = 5
+
+# (label, settings for configure_tracing, or None for no tracing at all)
+SETTINGS = [
+	("off", None),
+	("ratio 1.0", {"ratio": 1.0}),
+	("ratio 0.1", {"ratio": 0.1}),
+	("ratio 0.01", {"ratio": 0.01}),
+	("ratio 0.0", {"ratio": 0.0}),
+	("ratio 0.01 + tail", {"ratio": 0.01, "slow_ms": SLOW_MS}),
+	("ratio 0.0 + tail", {"ratio": 0.0, "slow_ms": SLOW_MS}),
+	("ratio 1.0, queue 512/batch 64", {"ratio": 1.0, "max_queue_size": 512, "max_export_batch_size": 64}),
+	("ratio 1.0, queue 8192/batch 2048", {"ratio": 1.0, "max_queue_size": 8192, "max_export_batch_size": 2048}),
+]
+
+class CountingExporter(SpanExporter):
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.spans = 0
+		self.slow = 0
+		self.errors = 0
+
+	def export(self, spans):
+		for span in spans:
+			self.spans += 1
+			route = span.attributes.get("http.route")
+			if route == "/slow/<int:n>":
+				self.slow += 1
+			elif route == "/fail/<int:n>":
+				self.errors += 1
+		return SpanExportResult.SUCCESS
+
+	def shutdown(self):
+		pass
+
+def make_app():
+	app = Flask(__name__)
+
+	@app.route("/items/<int:n>")
+	def item(n):
+		return jsonify({"id": n, "name": f"Item{n}"})
+
+	@app.route("/slow/<int:n>")
+	def slow(n):
+		time.sleep(SLOW_SLEEP)
+		return jsonify({"id": n})
+
+	@app.route("/fail/<int:n>")
+	def fail(n):
+		return jsonify({"error": "backend unavailable"}), 503
+
+	return app
+
+def path(n):
+	if n % SLOW_EVERY == 0:
+		return f"/slow/{n}"
+	if n % ERROR_EVERY == 1:
+		return f"/fail/{n}"
+	return f"/items/{n}"
+
+def run(settings, total):
+	app = make_app()
+	exporter = CountingExporter()
+	provider = None
+	if settings is not None:
+		provider = configure_tracing(app, "tracing-benchmark", exporter, **settings)
+
+	client = app.test_client()
+	for n in range(200):
+		client.get(path(n))	# warm up
+	if provider is not None:
+		provider.force_flush()
+	exporter.reset()
+
+	cpu = time.process_time()
+	wall = time.perf_counter()
+	for n in range(total):
+		client.get(path(n))
+	if provider is not None:
+		provider.force_flush()
+	cpu = time.process_time() - cpu
+	wall = time.perf_counter() - wall - (total // SLOW_EVERY) * SLOW_SLEEP
+	if provider is not None:
+		provider.shutdown()
+	return cpu / total, wall / total, exporter
+
+if __name__ == '__main__':
+	total = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+	print(f"Tracing overhead: {total} requests, 1/{SLOW_EVERY} slow, 1/{ERROR_EVERY} failing")
+	print("=" * 50)
+	print(f"{'setting':<36}{'cpu us/req':>12}{'wall us/req':>13}{'overhead':>10}{'spans':>8}{'slow kept':>11}{'errors kept':>13}")
+
+	baseline = None
+	for label, settings in SETTINGS:
+		cpu, wall, exporter = run(settings, total)
+		baseline = baseline or cpu
+		print(f"{label:<36}{cpu * 1e6:>12.1f}{wall * 1e6:>13.1f}{(cpu - baseline) * 1e6:>+10.1f}"
+			f"{exporter.spans:>8}{exporter.slow:>11}{exporter.errors:>13}")
@@ -1,17 +1,28 @@
+import threading
+
 from flask import Flask, request, jsonify
+from fastjson import FastJSONProvider
+from persistence import open_store
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+# In-memory storage (compact array-backed store, see item_store.py).
+# Set ITEMS_DATA_DIR to persist it with a WAL and snapshots (persistence.py).
+items = open_store()
+next_id = items.ids[-1] + 1 if len(items) else 1
+# Creates and deletes both move next_id; the dev server is threaded
+id_lock = threading.Lock()
 
-# In-memory storage
-items = []
-next_id = 1
+def valid_item(data):
+	return isinstance(data, dict) and isinstance(data.get('name'), str)
 
 @app.route('/items', methods=['GET'])
 def get_items():
-	return jsonify(items), 200
+	return jsonify(list(items)), 200
 
 @app.route('/items/<int:item_id>', methods=['GET'])
 def get_item(item_id):
-	item = next((i for i in items if i['id'] == item_id), None)
+	item = items.get(item_id)
 	if item:
 		return jsonify(item), 200
 	return jsonify({'error': 'Item not found'}), 404
@@ -20,34 +31,33 @@ def get_item(item_id):
 def create_item():
 	global next_id
 	data = request.get_json()
-	if not data or 'name' not in data:
+	if not valid_item(data):
 		return jsonify({'error': 'Bad request'}), 400
-	new_item = {'id': next_id, 'name': data['name']}
-	items.append(new_item)
-	next_id += 1
+	with id_lock:
+		new_item = items.add(next_id, data['name'])
+		next_id += 1
 	return jsonify(new_item), 201
 
 @app.route('/items/<int:item_id>', methods=['PUT'])
 def update_item(item_id):
-	item = next((i for i in items if i['id'] == item_id), None)
-	if not item:
+	if item_id not in items:
 		return jsonify({'error': 'Item not found'}), 404
 	data = request.get_json()
-	if not data or 'name' not in data:
+	if not valid_item(data):
 		return jsonify({'error': 'Bad request'}), 400
-	item['name'] = data['name']
+	item = items.update(item_id, data['name'])
+	if item is None:
+		return jsonify({'error': 'Item not found'}), 404
 	return jsonify(item), 200
 
 @app.route('/items/<int:item_id>', methods=['DELETE'])
 def delete_item(item_id):
-	global items
 	global next_id
-	item = next((i for i in items if i['id'] == item_id), None)
-	if not item:
-		return jsonify({'error': 'Item not found'}), 404
-	items = [i for i in items if i['id'] != item_id]
-	items = [{'id': i['id'] - 1 if i['id'] > item_id else i['id'], 'name': i['name']} for i in items]
-	next_id -= 1
+	# Ids stay contiguous: every item after the deleted one moves down by one
+	with id_lock:
+		if not items.delete(item_id, renumber=True):
+			return jsonify({'error': 'Item not found'}), 404
+		next_id -= 1
 	return jsonify({'message': 'Item deleted'}), 200
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional: without it everything falls back to the stdlib encoder
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+	# Flask JSON provider backed by orjson. Output matches the default provider
+	# (sorted keys, compact separators, same handling of dates/UUIDs/dataclasses
+	# through DefaultJSONProvider.default) except that non-ASCII text is sent
+	# as UTF-8 instead of \u escapes.
+	# Use with: app.json = FastJSONProvider(app)
+
+	def _options(self):
+		# orjson writes datetimes as ISO 8601 by itself; passing them through
+		# to default() keeps Flask's HTTP date format
+		options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+		if self.sort_keys:
+			options |= orjson.OPT_SORT_KEYS
+		return options
+
+	def dumps(self, obj, **kwargs):
+		if orjson is None or kwargs:
+			return super().dumps(obj, **kwargs)
+		return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+	def loads(self, s, **kwargs):
+		if orjson is None or kwargs:
+			return super().loads(s, **kwargs)
+		return orjson.loads(s)
+
+	def response(self, *args, **kwargs):
+		if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+			return super().response(*args, **kwargs)
+
+		obj = self._prepare_response_obj(args, kwargs)
+		body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+		return self._app.response_class(body, mimetype=self.mimetype)
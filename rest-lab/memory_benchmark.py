@@ -0,0 +1,57 @@
+import sys
+import time
+import tracemalloc
+
+from item_store import ItemStore
+
+# Per-item memory of the old list-of-dicts storage vs ItemStore.
+#	python3 memory_benchmark.py [items]		(default 10,000,000)
+# The dict baseline needs several GB at 10M items; it is measured on at most
+# DICT_SAMPLE items and reported per item.
+
+DICT_SAMPLE = 1_000_000
+
+def measure(build, count):
+	tracemalloc.start()
+	start = time.perf_counter()
+	store = build(count)
+	elapsed = time.perf_counter() - start
+	used, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return store, used, elapsed
+
+def build_dicts(count):
+	return [{"id": i, "name": f"Item{i}"} for i in range(1, count + 1)]
+
+def build_store(count):
+	store = ItemStore()
+	for i in range(1, count + 1):
+		store.add(i, f"Item{i}")
+	return store
+
+def report(label, count, used, elapsed):
+	print(f"{label}:")
+	print(f"	Items:		{count}")
+	print(f"	Memory:		{used / 2**20:.1f} MiB")
+	print(f"	Per item:	{used / count:.1f} bytes")
+	print(f"	Build time:	{elapsed:.2f}s")
+
+if __name__ == '__main__':
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+	dict_count = min(count, DICT_SAMPLE)
+
+	print("Memory benchmark: list of dicts vs ItemStore")
+	print("=" * 50)
+
+	store, used, elapsed = measure(build_dicts, dict_count)
+	dict_per_item = used / dict_count
+	report("List of dicts", dict_count, used, elapsed)
+	del store
+
+	store, used, elapsed = measure(build_store, count)
+	store_per_item = used / count
+	report("\nItemStore", count, used, elapsed)
+
+	print(f"\nComparison:")
+	print(f"	ItemStore uses {dict_per_item / store_per_item:.1f}x less memory per item")
+	print(f"	List of dicts at {count} items would need ~{dict_per_item * count / 2**30:.2f} GiB")
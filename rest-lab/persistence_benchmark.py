@@ -0,0 +1,71 @@
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from persistence import DurableItemStore
+
+# Write throughput and recovery time of DurableItemStore.
+#	python3 persistence_benchmark.py [items]	(default 1,000,000)
+# Uses a temporary directory, so it measures whatever disk backs $TMPDIR.
+
+def write_throughput(label, data_dir, sync, threads, count):
+	store = DurableItemStore(data_dir, sync=sync, snapshot_every=10**9)
+	ids = itertools.count(1)
+
+	def writer(n):
+		for _ in range(n):
+			i = next(ids)
+			store.add(i, f"Item{i}")
+
+	workers = [threading.Thread(target=writer, args=(count // threads,)) for _ in range(threads)]
+	start = time.perf_counter()
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+	elapsed = time.perf_counter() - start
+	store.close()
+
+	print(f"	{label:<34}{count / elapsed:>12.0f} writes/s")
+
+def recovery_time(label, data_dir):
+	start = time.perf_counter()
+	store = DurableItemStore(data_dir)
+	elapsed = time.perf_counter() - start
+	store.close()
+	print(f"	{label:<34}{elapsed:>10.3f}s	({len(store)} items)")
+
+def fresh_dir(root, name):
+	path = os.path.join(root, name)
+	shutil.rmtree(path, ignore_errors=True)
+	return path
+
+if __name__ == '__main__':
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+	root = tempfile.mkdtemp(prefix="items-bench-")
+
+	try:
+		print("Persistence benchmark")
+		print("=" * 50)
+
+		print("\nWrite throughput:")
+		write_throughput("sync, 1 thread (fsync per write)", fresh_dir(root, "a"), True, 1, min(count, 2000))
+		write_throughput("sync, 32 threads (group commit)", fresh_dir(root, "b"), True, 32, min(count, 64000))
+		write_throughput("async (background fsync)", fresh_dir(root, "c"), False, 1, count)
+
+		print("\nRecovery:")
+		wal_only = os.path.join(root, "c")	# the async run left 1 WAL with every write
+		recovery_time("WAL replay only", wal_only)
+
+		store = DurableItemStore(wal_only, sync=False)
+		store.snapshot()
+		for i in range(count + 1, count + 10001):
+			store.add(i, f"Item{i}")
+		store.close()
+		recovery_time("snapshot + 10k WAL tail", wal_only)
+	finally:
+		shutil.rmtree(root, ignore_errors=True)